@@ -0,0 +1,166 @@
+"""
+Join followers and following exports in bounded memory
+"""
+
+import heapq, os, shutil, tempfile
+
+import metrics, output
+from ndjson_writer import NDJSONWriter, read_ndjson
+
+metrics.register("analyze_spilled_bytes_total", "Bytes of sorted runs spilled to disk by analyze")
+
+DEFAULT_MAX_MEMORY = 256  # MB of records held in memory before a sorted run is spilled to disk
+ENTRY_OVERHEAD = 130  # Bytes of tuple, int and bytes object per in-memory entry, on top of the record itself
+
+MUTUALS = "mutuals"
+FANS = "followers_not_followed_back"  # They follow the account, it doesn't follow them
+UNRETURNED = "following_not_following_back"  # The account follows them, they don't follow it
+OUTPUTS = (MUTUALS, FANS, UNRETURNED)
+
+EXTENSIONS = (".ndjson", ".ndjson.gz", ".ndjson.zst", ".json", ".json.gz", ".json.zst")
+
+
+def find_export(directory, name):
+    """The followers or following export of export.py user in directory, or None"""
+    for extension in EXTENSIONS:
+        path = os.path.join(directory, name + extension)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def read_records(filename, name):
+    """Records of an export: streamed from NDJSON, loaded in one piece from JSON"""
+    if ".ndjson" in os.path.basename(filename):
+        return read_ndjson(filename)
+    return iter(output.read_json(filename).get(name) or [])
+
+
+class SortedRuns:
+    """
+    The records of one export, sorted by user id, in bounded memory
+
+    Records are held as (id, encoded line) pairs. Once max_bytes worth have
+    piled up they are sorted and spilled to a run file, and iterating merges
+    every run with whatever is still in memory. Memory stays around max_bytes
+    plus one line per run however large the export is, and an export that
+    fits under the cap never touches the disk. Duplicate ids are dropped.
+    """
+
+    def __init__(self, directory, name, max_bytes):
+        self.directory = directory
+        self.name = name
+        self.max_bytes = max_bytes
+        self.entries = []
+        self.size = 0
+        self.runs = []
+        self.count = 0
+        self.skipped = 0
+
+    def add(self, record):
+        if record.get("id") is None:
+            self.skipped += 1
+            return
+        line = output.dumps_line(record)
+        self.entries.append((int(record["id"]), line))
+        self.size += len(line) + ENTRY_OVERHEAD
+        self.count += 1
+        if self.size >= self.max_bytes:
+            self.spill()
+
+    def spill(self):
+        """Write the records in memory to a new sorted run"""
+        self.entries.sort(key=lambda entry: entry[0])
+        path = os.path.join(self.directory, f"{self.name}-{len(self.runs):04d}.run")
+        with open(path, "wb") as f:
+            for user_id, line in self.entries:
+                f.write(b"%d\t" % user_id)
+                f.write(line)
+        self.runs.append(path)
+        metrics.inc("analyze_spilled_bytes_total", os.path.getsize(path))
+        self.entries = []
+        self.size = 0
+
+    @staticmethod
+    def read_run(path):
+        with open(path, "rb") as f:
+            for raw in f:
+                user_id, line = raw.split(b"\t", 1)
+                yield int(user_id), line
+
+    def __iter__(self):
+        self.entries.sort(key=lambda entry: entry[0])
+        sources = [self.read_run(path) for path in self.runs] + [iter(self.entries)]
+        previous = None
+        for user_id, line in heapq.merge(*sources, key=lambda entry: entry[0]):
+            if user_id != previous:
+                previous = user_id
+                yield user_id, line
+
+
+def merge_join(followers, following):
+    """(output, line) for every user of two id-sorted streams, in id order"""
+    followers, following = iter(followers), iter(following)
+    a, b = next(followers, None), next(following, None)
+    while a is not None or b is not None:
+        if b is None or (a is not None and a[0] < b[0]):
+            yield FANS, a[1]
+            a = next(followers, None)
+        elif a is None or b[0] < a[0]:
+            yield UNRETURNED, b[1]
+            b = next(following, None)
+        else:
+            yield MUTUALS, a[1]
+            a, b = next(followers, None), next(following, None)
+
+
+def analyze(followers_file, following_file, output_dir, max_memory=DEFAULT_MAX_MEMORY, compression=None,
+            console=None):
+    """
+    Split followers and following into mutuals, followers not followed back
+    and following not following back
+
+    Both exports are sorted by user id in runs spilled to a temporary
+    directory above max_memory MB (half for each side), then merge-joined in
+    one pass that streams each user to the NDJSON file of its group. NDJSON
+    inputs are streamed; JSON inputs have to be loaded whole first.
+    Returns the number of users in each group.
+    """
+    if console is None:
+        from rich.console import Console
+        console = Console()
+
+    os.makedirs(output_dir, exist_ok=True)
+    spill_dir = tempfile.mkdtemp(prefix="analyze-", dir=output_dir)
+    max_bytes = max_memory * 1024 * 1024 // 2
+    writers = {}
+    try:
+        sides = {}
+        for name, filename in (("followers", followers_file), ("following", following_file)):
+            console.print(f"[yellow]Sorting {name} from {filename}...[/yellow]")
+            runs = SortedRuns(spill_dir, name, max_bytes)
+            for record in read_records(filename, name):
+                runs.add(record)
+            if runs.runs:
+                console.print(f"[yellow]{runs.count} {name}: {len(runs.runs)} sorted runs spilled to disk[/yellow]")
+            sides[name] = runs
+
+        writers = {name: NDJSONWriter(output.with_extension(os.path.join(output_dir, f"{name}.ndjson"), compression),
+                                      compression=compression)
+                   for name in OUTPUTS}
+        for name, line in merge_join(sides["followers"], sides["following"]):
+            writers[name].write_line(line)
+    except BaseException:
+        for writer in writers.values():
+            writer.abort()
+        raise
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+
+    counts = {}
+    for name, writer in writers.items():
+        counts[name] = writer.count
+        writer.close(followers=sides["followers"].count, following=sides["following"].count)
+        console.print(f"[green]{writer.count} {name.replace('_', ' ')} saved to {writer.filename}[/green]")
+    metrics.inc("records_total", sum(counts.values()), source="analyze")
+    return counts
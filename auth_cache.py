@@ -0,0 +1,100 @@
+"""
+Cached, validated Instagram auth session
+"""
+
+import json, os, threading, time
+
+import output
+
+AUTH_CACHE_FILE = os.path.join(os.path.expanduser("~"), ".instaloader_auth_cache.json")
+DEFAULT_TTL = 6 * 60 * 60  # Re-verify the session after six hours
+
+
+class AuthCache:
+    """
+    Instagram cookie jar plus the time it was last verified
+
+    While the cache is fresh the session is trusted without another
+    verification round-trip, browser cookie extraction or browser login.
+    One instance is shared per process (see shared()), so every code path
+    hands the same in-memory jar to its requests.
+    """
+
+    def __init__(self, path=AUTH_CACHE_FILE, ttl=DEFAULT_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.username = None
+        self.cookies = {}
+        self.verified_at = None
+        self.loaded = False
+
+    @property
+    def age(self):
+        return time.time() - self.verified_at if self.verified_at else None
+
+    def is_fresh(self):
+        """True if the cached cookies were verified within the TTL"""
+        return bool(self.cookies.get("sessionid")) and self.age is not None and self.age < self.ttl
+
+    def load(self):
+        """Load the cache from disk once per process, returning True if it holds a session"""
+        if self.loaded:
+            return bool(self.cookies)
+        self.loaded = True
+
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+
+        self.username = data.get("username")
+        self.cookies = data.get("cookies") or {}
+        self.verified_at = data.get("verified_at")
+        return bool(self.cookies)
+
+    def store(self, cookies, username):
+        """Remember a freshly verified session"""
+        self.cookies = dict(cookies)
+        self.username = username
+        self.verified_at = time.time()
+        self.loaded = True
+        self.save()
+
+    def save(self):
+        with output.replacing(self.path) as tmp_path:
+            with open(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w", encoding="utf-8") as f:
+                json.dump({
+                    "username": self.username,
+                    "cookies": self.cookies,
+                    "verified_at": self.verified_at,
+                }, f)
+
+    def invalidate(self):
+        """Force re-verification on next use, e.g. after an auth failure"""
+        self.verified_at = None
+        if self.cookies:
+            self.save()
+
+    def clear(self):
+        self.username = None
+        self.cookies = {}
+        self.verified_at = None
+        self.loaded = True
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+_shared = None
+_lock = threading.Lock()
+
+
+def shared(ttl=None):
+    """Return the process-wide auth cache"""
+    global _shared
+    with _lock:
+        if _shared is None:
+            _shared = AuthCache()
+        if ttl is not None:
+            _shared.ttl = ttl
+        return _shared
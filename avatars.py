@@ -0,0 +1,218 @@
+"""
+Content-addressed download of the profile pictures in exports
+"""
+
+import datetime, hashlib, json, os, threading, time
+from urllib.parse import urlsplit
+
+import metrics, output, transport
+from ndjson_writer import read_ndjson
+
+metrics.register("avatars_total", "Profile pictures synced, by result")
+
+DEFAULT_DIR = "avatars"
+DEFAULT_CONCURRENCY = 16  # Downloads in flight at once
+INDEX_FILE = "index.ndjson"
+
+
+def media_key(url):
+    """
+    The stable part of a CDN URL: its path, e.g. /v/t51.2885-19/123_456_n.jpg
+
+    The query string is a signature that changes from export to export,
+    while the path names the same picture for as long as it exists.
+    """
+    return urlsplit(url).path or None
+
+
+def read_urls(filename):
+    """Every profile_pic_url in an export, NDJSON or JSON, in file order"""
+    if ".ndjson" in os.path.basename(filename):
+        for record in read_ndjson(filename):
+            if record.get("profile_pic_url"):
+                yield record["profile_pic_url"]
+        return
+
+    # JSON exports nest their records differently (followers, following, nodes, the profile itself)
+    stack = [output.read_json(filename)]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, dict):
+            if isinstance(value.get("profile_pic_url"), str):
+                yield value["profile_pic_url"]
+            stack.extend(reversed(list(value.values())))
+        elif isinstance(value, list):
+            stack.extend(reversed(value))
+
+
+def read_index(directory):
+    """media key -> index entry of every picture already stored"""
+    entries = {}
+    path = os.path.join(directory, INDEX_FILE)
+    if not os.path.exists(path):
+        return entries
+    with open(path, "rb") as f:
+        for line in f:
+            # A line cut short by a crash is the end of the index
+            if not line.endswith(b"\n"):
+                break
+            entry = json.loads(line)
+            entries[entry["key"]] = entry
+    return entries
+
+
+class AvatarStore:
+    """
+    Profile pictures stored once per content, under objects/AB/SHA256.jpg
+
+    index.ndjson maps the media key of every downloaded URL to the hash of
+    its content, one line per picture, appended only once the file is in
+    place. A URL whose key is in the index is never downloaded again, even
+    if its signature has changed, and a picture whose content is already
+    stored (the default avatar, the same user in several exports) only adds
+    an index line.
+    """
+
+    def __init__(self, directory=DEFAULT_DIR):
+        self.directory = directory
+        self.lock = threading.Lock()
+        os.makedirs(os.path.join(directory, "objects"), exist_ok=True)
+        self.entries = read_index(directory)
+        self.index = open(os.path.join(directory, INDEX_FILE), "ab")
+
+    def object_path(self, digest, extension=".jpg"):
+        return os.path.join(self.directory, "objects", digest[:2], digest + extension)
+
+    def path_for(self, url):
+        """Local file of a profile picture URL, or None if it hasn't been downloaded"""
+        entry = self.entries.get(media_key(url))
+        return os.path.join(self.directory, entry["path"]) if entry else None
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def add(self, key, body, extension=".jpg"):
+        """Store a downloaded picture under its content hash, returning (entry, True if the content was new)"""
+        digest = hashlib.sha256(body).hexdigest()
+        path = self.object_path(digest, extension)
+        new = not os.path.exists(path)
+        if new:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Several workers may download the same content at once; each renames its own file into place
+            with output.replacing(path) as tmp_path:
+                with open(tmp_path, "wb") as f:
+                    f.write(body)
+
+        entry = {
+            "key": key,
+            "sha256": digest,
+            "size": len(body),
+            "path": os.path.relpath(path, self.directory),
+            "fetched_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        }
+        with self.lock:
+            self.index.write(json.dumps(entry, separators=(",", ":")).encode("utf-8") + b"\n")
+            self.index.flush()
+            self.entries[key] = entry
+        return entry, new
+
+    def close(self):
+        with self.lock:
+            self.index.close()
+
+
+def fetch(session, url):
+    """Download one picture: (body, status), with no body if the CDN refused it"""
+    response = session.get(url, timeout=transport.request_timeout(), headers={"Accept": "image/*"})
+    if response.status_code != 200:
+        # Signed URLs expire: 403 means the export is too old, not that the picture is gone
+        return None, response.status_code
+    return response.content, 200
+
+
+def sync(filenames, directory=DEFAULT_DIR, concurrency=DEFAULT_CONCURRENCY, console=None):
+    """
+    Download every profile picture referenced by the exports into an AvatarStore
+
+    URLs are read lazily and each media key is only fetched once, with at
+    most concurrency downloads in flight over the shared connection pool.
+    Keys already in the store are skipped without a request, so running
+    again over the same (or a newer) export only fetches new pictures.
+    Returns the counts of downloaded, deduplicated, cached and failed URLs.
+    """
+    from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+    if console is None:
+        from rich.console import Console
+        console = Console()
+
+    store = AvatarStore(directory)
+    session = transport.get_session()
+    counts = {"downloaded": 0, "deduplicated": 0, "cached": 0, "failed": 0}
+    statuses = {}
+    queued = set()
+    started = time.monotonic()
+
+    def download(key, url):
+        """(key, True/False for new/duplicate content or None on failure, status)"""
+        try:
+            body, status = fetch(session, url)
+        except Exception as e:
+            return key, None, type(e).__name__
+        if body is None:
+            return key, None, status
+        try:
+            return key, store.add(key, body, os.path.splitext(key)[1] or ".jpg")[1], status
+        except OSError as e:
+            # e.g. a full disk: counted like a failed download rather than aborting the sync
+            return key, None, type(e).__name__
+
+    def collect(done):
+        for future in done:
+            key, new, status = future.result()
+            if new is None:
+                counts["failed"] += 1
+                statuses[status] = statuses.get(status, 0) + 1
+                # A later export may carry a fresh signature for the same picture
+                queued.discard(key)
+            else:
+                counts["downloaded" if new else "deduplicated"] += 1
+
+    console.print(f"[bold blue]Syncing profile pictures into {directory} "
+                  f"({len(store.entries)} already stored, {concurrency} downloads at once)...[/bold blue]")
+    pending = set()
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="avatar") as executor:
+            for filename in filenames:
+                for url in read_urls(filename):
+                    key = media_key(url)
+                    if key is None or key in queued:
+                        continue
+                    queued.add(key)
+                    if key in store:
+                        counts["cached"] += 1
+                        continue
+
+                    # Only a couple of URLs per worker are held at once, however large the export
+                    if len(pending) >= concurrency * 2:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        collect(done)
+                    pending.add(executor.submit(download, key, url))
+            collect(wait(pending).done)
+    finally:
+        store.close()
+
+    elapsed = time.monotonic() - started
+    metrics.inc("avatars_total", counts["downloaded"], result="downloaded")
+    metrics.inc("avatars_total", counts["deduplicated"], result="deduplicated")
+    metrics.inc("avatars_total", counts["cached"], result="cached")
+    metrics.inc("avatars_total", counts["failed"], result="failed")
+    fetched = counts["downloaded"] + counts["deduplicated"]
+    console.print(f"[green]{counts['downloaded']} pictures downloaded, {counts['deduplicated']} duplicates of "
+                  f"stored content, {counts['cached']} already cached in {elapsed:.1f}s "
+                  f"({fetched / elapsed if elapsed else 0:.0f}/s)[/green]")
+    if counts["failed"]:
+        details = ", ".join(f"{count} x {status}" for status, count in sorted(statuses.items(), key=str))
+        console.print(f"[yellow]{counts['failed']} pictures could not be downloaded ({details}); "
+                      f"403s usually mean the export's signed URLs have expired[/yellow]")
+    return counts
@@ -0,0 +1,169 @@
+"""
+Batch export of several accounts over one authenticated session
+"""
+
+import datetime, os, sys, time
+
+import output
+from snapshots import SnapshotStore
+
+DEFAULT_WORKERS = 2
+
+
+def read_targets(source):
+    """
+    Read usernames from a file, or stdin if source is "-"
+
+    One username per line; blank lines and lines starting with # are
+    skipped, a leading @ is dropped and duplicates are only exported once.
+    """
+    if source == "-":
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(source, "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+
+    targets = []
+    seen = set()
+    for line in lines:
+        username = line.strip().lstrip("@")
+        if not username or username.startswith("#") or username in seen:
+            continue
+        seen.add(username)
+        targets.append(username)
+    return targets
+
+
+def output_path(username, output_format, output_dir=None, compression=None):
+    filename = output.with_extension(f"{username}_followers.{output_format}", compression)
+    return os.path.join(output_dir, filename) if output_dir else filename
+
+
+class BatchExporter:
+    """
+    Export the followers of many accounts through a bounded worker pool
+
+    Every worker shares the primary exporter's logged-in loader (so there is
+    one session and one connection pool) and its scheduler, which makes the
+    scheduler's rate the request budget for the whole batch rather than per
+    account. Each account is written to its own output file.
+    """
+
+    def __init__(self, primary, workers=DEFAULT_WORKERS, output_format="json", output_dir=None, resume=False,
+                 snapshot_options=None):
+        self.primary = primary
+        self.console = primary.console
+        self.workers = max(1, workers)
+        self.output_format = output_format
+        self.output_dir = output_dir
+        self.resume = resume
+        self.snapshot_options = snapshot_options  # SnapshotStore arguments when history is tracked
+        self.results = []
+        self.elapsed = 0.0
+
+    def make_exporter(self, username):
+        """An exporter for username sharing the primary's session, scheduler and options"""
+        exporter = type(self.primary)(username, scheduler=self.primary.scheduler, insta=self.primary.insta,
+                                      retry=self.primary.retry)
+        exporter.console = self.console
+        # Rich only allows one live spinner per console
+        exporter.show_status = False
+        exporter.history = self.primary.history
+        exporter.compact = self.primary.compact
+        exporter.compression = self.primary.compression
+        exporter.fields = self.primary.fields
+        exporter.archive = self.primary.archive
+        exporter.prefetch = self.primary.prefetch
+        if self.snapshot_options is not None:
+            exporter.snapshots = SnapshotStore(username, **self.snapshot_options)
+        return exporter
+
+    def export_one(self, username):
+        """Export a single account and return its result record"""
+        exporter = self.make_exporter(username)
+        filename = output_path(username, self.output_format, self.output_dir, exporter.compression)
+        started = time.monotonic()
+        error = None
+        try:
+            success = exporter.export(output_format=self.output_format, output=filename, resume=self.resume)
+        except Exception as e:
+            success = False
+            error = str(e)
+
+        return {
+            "username": username,
+            "success": bool(success),
+            "records": exporter.records,
+            "output": filename if success else None,
+            "seconds": round(time.monotonic() - started, 2),
+            "error": error if error or success else "export failed",
+        }
+
+    def run(self, targets):
+        """Export every target, returning the list of per-account results"""
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+
+        if self.output_dir:
+            os.makedirs(self.output_dir, exist_ok=True)
+
+        self.console.print(f"[bold blue]Exporting {len(targets)} accounts with {self.workers} workers...[/bold blue]")
+        started = time.monotonic()
+
+        executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="export")
+        try:
+            futures = {executor.submit(self.export_one, username): username for username in targets}
+            for future in as_completed(futures):
+                result = future.result()
+                self.results.append(result)
+                if result["success"]:
+                    self.console.print(f"[green]✓ {result['username']}: {result['records']} followers "
+                                       f"in {result['seconds']:.1f}s[/green]")
+                else:
+                    self.console.print(f"[bold red]✗ {result['username']}: {result['error']}[/bold red]")
+        except KeyboardInterrupt:
+            # Accounts not started yet are dropped; running ones keep their checkpoints
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        else:
+            executor.shutdown()
+
+        # Report in the order the targets were given
+        order = {username: i for i, username in enumerate(targets)}
+        self.results.sort(key=lambda result: order[result["username"]])
+        self.elapsed = time.monotonic() - started
+        return self.results
+
+    def summary(self):
+        succeeded = [r for r in self.results if r["success"]]
+        return {
+            "timestamp": str(datetime.datetime.now()),
+            "accounts": len(self.results),
+            "succeeded": len(succeeded),
+            "failed": len(self.results) - len(succeeded),
+            "records": sum(r["records"] for r in succeeded),
+            "seconds": round(self.elapsed, 2),
+            "scheduler": self.primary.scheduler.summary(),
+            "results": self.results,
+        }
+
+    def print_summary(self):
+        summary = self.summary()
+        self.console.print("\n[bold blue]===== Batch summary =====[/bold blue]")
+        for result in self.results:
+            if result["success"]:
+                self.console.print(f"[green]{result['username']:<30} ok      {result['records']:>8} followers "
+                                   f"{result['seconds']:>8.1f}s  {result['output']}[/green]")
+            else:
+                self.console.print(f"[red]{result['username']:<30} failed  {'':>8}           "
+                                   f"{result['seconds']:>8.1f}s  {result['error']}[/red]")
+        self.console.print(f"[bold]{summary['succeeded']}/{summary['accounts']} accounts exported, "
+                           f"{summary['records']} followers in {summary['seconds']:.1f}s[/bold]")
+        return summary
+
+    def save_summary(self, filename=None):
+        """Write the batch summary next to the exports"""
+        if filename is None:
+            filename = os.path.join(self.output_dir or ".", "batch_summary.json")
+        output.write_json(filename, self.summary())
+        self.console.print(f"[green]Batch summary saved to {filename}[/green]")
+        return filename
@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+"""
+End-to-end throughput benchmarks against the local mock server
+
+Every scenario drives a real export code path against mock_instagram.py
+and reports records/s, requests/s, where the wall time went (network,
+sleeping, serialization, everything else) and the peak RSS. Scenarios run
+in a fresh process each, so peak RSS and import costs do not leak between
+them. Results can be saved as a baseline and later runs compared to it:
+
+    python benchmark.py --followers 2000 --save-baseline
+    python benchmark.py --followers 2000 --compare
+"""
+
+import argparse, json, os, subprocess, sys, tempfile, time
+
+import mock_instagram
+
+SCENARIOS = {
+    "followers": "main.py export to JSON through instaloader (get_followers)",
+    "followers-ndjson": "main.py export streamed to NDJSON through instaloader",
+    "direct": "main.py direct GraphQL route (try_direct_api_request)",
+    "export-user": "export.py user: account info, followers, following and posts",
+    "export-graphql": "export.py graphql following every page of the followers edge",
+    "export-archive": "export.py graphql --archive of the followers edge, then replay offline",
+    "avatars": "export.py avatars: every follower's profile picture, then a second, cached run",
+}
+BASELINE_FILE = os.path.join(".benchmarks", "baseline.json")
+TOLERANCE = 0.1  # Slowdown in records/s that --compare reports as a regression
+
+# A session the mock accepts; with a fresh auth cache login costs no requests
+SESSION_COOKIES = {
+    "sessionid": "mock-session",
+    "csrftoken": "mock-csrftoken",
+    "ds_user_id": str(mock_instagram.VIEWER_ID),
+    "mid": "mock-mid",
+    "ig_did": "mock-ig-did",
+}
+
+
+class Timers:
+    """Time spent sleeping, measured by wrapping time.sleep (serializing is measured by the metrics)"""
+
+    def __init__(self):
+        self.sleep = 0.0
+
+    def timed(self, function, attribute):
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                setattr(self, attribute, getattr(self, attribute) + time.perf_counter() - started)
+        return wrapper
+
+    def install(self):
+        time.sleep = self.timed(time.sleep, "sleep")
+
+
+def remove_instaloader_limits():
+    """Drop instaloader's own random sleeps and sliding-window limits"""
+    import instaloader
+    instaloader.InstaloaderContext.do_sleep = lambda self: None
+    instaloader.RateController.query_waittime = lambda self, *args, **kwargs: 0.0
+
+
+def count_records(path):
+    import output
+    if ".ndjson" in path:
+        from ndjson_writer import read_ndjson
+        return sum(1 for _ in read_ndjson(path))
+    data = output.read_json(path)
+    for key in ("followers", "following", "posts", "nodes"):
+        if key in data:
+            return len(data[key])
+    return 0
+
+
+def run_scenario(name, rate, backoff, compact=False, compression=None, fields=None, prefetch=None):
+    """Run one scenario in this process and return the number of records it exported"""
+    import export, output
+    from graphql_paginator import parse_fields
+    from main import InstaFollowers
+    from rate_scheduler import AdaptiveScheduler
+    from rich.console import Console
+
+    scheduler = AdaptiveScheduler(rate=rate, burst=max(1, int(rate)), base_backoff=backoff)
+    target = mock_instagram.TARGET_USERNAME
+
+    if name in ("followers", "followers-ndjson", "direct"):
+        exporter = InstaFollowers(target, scheduler=scheduler)
+        exporter.compact = compact
+        exporter.compression = compression
+        exporter.fields = parse_fields(fields) if fields else None
+        if prefetch is not None:
+            exporter.prefetch = prefetch
+        exporter.login()
+
+        if name == "direct":
+            data = exporter.try_direct_api_request(user_id=mock_instagram.TARGET_ID)
+            exporter.save_to_json(data, output.with_extension("direct.json", compression))
+            return len(data["followers"]) if data else 0
+
+        # Compression only applies to JSON; NDJSON checkpoints need a plain file
+        output_format = "ndjson" if name == "followers-ndjson" else "json"
+        filename = f"followers.{output_format}"
+        if output_format == "json":
+            filename = output.with_extension(filename, compression)
+        if not exporter.export(output_format=output_format, output=filename):
+            return 0
+        return exporter.records
+
+    if name == "export-user":
+        sys.argv = ["export.py", "user", target] + (["--compact"] if compact else []) + \
+                   (["--compress", compression] if compression else []) + \
+                   (["--fields", fields] if fields else []) + \
+                   (["--prefetch", str(prefetch)] if prefetch is not None else [])
+        export.main()
+        directory = f"{target}_data"
+        files = [output.with_extension(f, compression) for f in ("followers.json", "following.json", "recent_posts.json")]
+        return sum(count_records(os.path.join(directory, f)) for f in files
+                   if os.path.exists(os.path.join(directory, f)))
+
+    if name == "export-graphql":
+        data = export.fetch_graphql_data(mock_instagram.FOLLOWERS_QUERY_HASH,
+                                         {"id": str(mock_instagram.TARGET_ID), "first": 50},
+                                         output.with_extension("graphql.json", compression), Console(),
+                                         scheduler=scheduler, compact=compact, compression=compression)
+        return len(data["nodes"]) if data else 0
+
+    if name == "export-archive":
+        if not export.archive_graphql_data(mock_instagram.FOLLOWERS_QUERY_HASH,
+                                           {"id": str(mock_instagram.TARGET_ID), "first": 50},
+                                           "archive", Console(), scheduler=scheduler):
+            return 0
+        data = export.export_archive("archive", output.with_extension("archive.json", compression),
+                                     console=Console(), compact=compact, compression=compression)
+        return data["count"]
+
+    if name == "avatars":
+        import avatars, transport
+        transport.configure(pool_size=avatars.DEFAULT_CONCURRENCY)
+        if not export.fetch_graphql_data(mock_instagram.FOLLOWERS_QUERY_HASH,
+                                         {"id": str(mock_instagram.TARGET_ID), "first": 50},
+                                         "graphql.ndjson", Console(), scheduler=scheduler, output_format="ndjson"):
+            return 0
+        counts = avatars.sync(["graphql.ndjson"], "avatars", console=Console())
+        # The second run must be served from the index without a single download
+        cached = avatars.sync(["graphql.ndjson"], "avatars", console=Console())
+        if cached["downloaded"] or cached["deduplicated"]:
+            raise RuntimeError(f"Cached avatar run still downloaded pictures: {cached}")
+        return counts["downloaded"] + counts["deduplicated"]
+
+    raise ValueError(f"Unknown scenario: {name}")
+
+
+def child(args):
+    """Entry point of the per-scenario process; writes its measurements to args.result"""
+    import resource
+    import auth_cache, metrics, profile_cache, transport
+
+    os.chdir(args.workdir)
+    transport.configure(base_url=args.base_url)
+
+    # A cached, freshly verified session, kept apart from the real one in ~
+    auth = auth_cache.AuthCache(path=os.path.join(args.workdir, "auth.json"))
+    auth.store(SESSION_COOKIES, mock_instagram.VIEWER_USERNAME)
+    auth_cache._shared = auth
+    profile_cache._shared = profile_cache.ProfileCache(path=os.path.join(args.workdir, "profiles.json"))
+
+    if not args.keep_instaloader_limits:
+        remove_instaloader_limits()
+    timers = Timers()
+    timers.install()
+
+    started = time.perf_counter()
+    records = run_scenario(args.child, args.rate, args.backoff, args.compact, args.compress, args.fields, args.prefetch)
+    wall = time.perf_counter() - started
+
+    network = metrics.registry.value("request_seconds")
+    serialize = metrics.registry.value("serialize_seconds_total")
+    result = {
+        "scenario": args.child,
+        "records": records,
+        "wall": wall,
+        "network": network,
+        "sleep": timers.sleep,
+        "serialize": serialize,
+        "other": max(0.0, wall - network - timers.sleep - serialize),
+        "client_requests": metrics.registry.count("request_seconds"),
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "metrics": metrics.registry.snapshot(),
+    }
+    with open(args.result, "w", encoding="utf-8") as f:
+        json.dump(result, f)
+
+
+def run_child(name, url, args):
+    """Run one scenario in a fresh process and return its measurements"""
+    with tempfile.TemporaryDirectory(prefix=f"benchmark-{name}-") as workdir:
+        result_file = os.path.join(workdir, "result.json")
+        command = [sys.executable, os.path.abspath(__file__), "--child", name, "--base-url", url,
+                   "--workdir", workdir, "--result", result_file, "--rate", str(args.rate),
+                   "--backoff", str(args.backoff)]
+        if args.keep_instaloader_limits:
+            command.append("--keep-instaloader-limits")
+        if args.compact:
+            command.append("--compact")
+        if args.compress:
+            command += ["--compress", args.compress]
+        if args.fields:
+            command += ["--fields", args.fields]
+        if args.prefetch is not None:
+            command += ["--prefetch", str(args.prefetch)]
+
+        process = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+                                 cwd=os.path.dirname(os.path.abspath(__file__)))
+        if process.returncode != 0 or not os.path.exists(result_file):
+            raise RuntimeError(f"Scenario {name} failed:\n{process.stderr[-2000:]}")
+        with open(result_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+
+def load_baseline(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def print_results(console, results, baseline=None, tolerance=TOLERANCE):
+    """Print the results table, with the change against a baseline if one is given; return the regressions"""
+    from rich.table import Table
+
+    table = Table(title="Benchmark results")
+    table.add_column("scenario", no_wrap=True)
+    for column in ("records", "rec/s", "req/s", "wall s", "net s", "sleep s", "ser s", "other s", "RSS MB"):
+        table.add_column(column, justify="right", no_wrap=True)
+    if baseline is not None:
+        table.add_column("vs base", justify="right", no_wrap=True)
+
+    regressions = []
+    for name, result in results.items():
+        row = [name, str(result["records"]), f"{result['records_per_second']:.1f}",
+               f"{result['requests_per_second']:.1f}", f"{result['wall']:.2f}", f"{result['network']:.2f}",
+               f"{result['sleep']:.2f}", f"{result['serialize']:.3f}", f"{result['other']:.2f}",
+               f"{result['peak_rss_mb']:.1f}"]
+
+        if baseline is not None:
+            previous = baseline["results"].get(name)
+            if previous and previous["records_per_second"]:
+                change = result["records_per_second"] / previous["records_per_second"] - 1
+                color = "red" if change < -tolerance else "green" if change > tolerance else "white"
+                row.append(f"[{color}]{change:+.1%}[/{color}]")
+                if change < -tolerance:
+                    regressions.append(name)
+            else:
+                row.append("-")
+        table.add_row(*row)
+
+    console.print(table)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput benchmarks of the exporters against a local mock server")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help=f"Comma-separated scenarios to run (default: all of {', '.join(SCENARIOS)})")
+    parser.add_argument("--followers", type=int, default=1000, help="Followers of the mock account (up to millions)")
+    parser.add_argument("--following", type=int, default=100, help="Accounts the mock account follows")
+    parser.add_argument("--posts", type=int, default=24, help="Posts of the mock account")
+    parser.add_argument("--latency", type=float, default=0.005, help="Seconds the mock adds to every response")
+    parser.add_argument("--fail-401", type=float, default=0.0, help="Fraction of requests answered with 401")
+    parser.add_argument("--fail-429", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--fail-503", type=float, default=0.0, help="Fraction of requests answered with 503")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with injected 429s")
+    parser.add_argument("--rate", type=float, default=1000.0, help="Scheduler rate in requests/second")
+    parser.add_argument("--backoff", type=float, default=1.0, help="Scheduler base backoff in seconds")
+    parser.add_argument("--keep-instaloader-limits", action="store_true",
+                        help="Keep instaloader's own random sleeps and sliding-window limits")
+    parser.add_argument("--compact", action="store_true", help="Write compact JSON output")
+    parser.add_argument("--compress", choices=("gzip", "zstd"), help="Compress the JSON output")
+    parser.add_argument("--fields", help="Export only these comma-separated follower fields")
+    parser.add_argument("--prefetch", type=int, help="Pages fetched ahead in the background (default: the exporters')")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per scenario; the fastest one is reported")
+    parser.add_argument("--save-baseline", nargs="?", const=BASELINE_FILE, metavar="PATH",
+                        help=f"Save the results as the baseline (default: {BASELINE_FILE})")
+    parser.add_argument("--compare", nargs="?", const=BASELINE_FILE, metavar="PATH",
+                        help=f"Compare against a saved baseline (default: {BASELINE_FILE}); "
+                             f"exits with status 1 on a regression")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE,
+                        help=f"Records/s slowdown counted as a regression (default: {TOLERANCE * 100:.0f}%%)")
+
+    # Used by the per-scenario processes
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--base-url", help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args)
+        return
+
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+
+    from rich.console import Console
+    console = Console()
+
+    config = {key: getattr(args, key) for key in ("followers", "following", "posts", "latency", "fail_401",
+                                                  "fail_429", "fail_503", "retry_after", "rate", "backoff",
+                                                  "keep_instaloader_limits", "compact", "compress",
+                                                  "fields", "prefetch")}
+    mock = mock_instagram.MockInstagram(followers=args.followers, following=args.following, posts=args.posts,
+                                        latency=args.latency, fail_401=args.fail_401, fail_429=args.fail_429,
+                                        retry_after=args.retry_after, fail_503=args.fail_503)
+    server = mock_instagram.serve(mock)
+    url = mock_instagram.base_url(server)
+    console.print(f"[bold blue]Mock Instagram on {url}: {args.followers} followers, {args.following} following, "
+                  f"{args.posts} posts, {args.latency * 1000:.0f} ms latency[/bold blue]")
+
+    results = {}
+    try:
+        for name in scenarios:
+            console.print(f"[yellow]Running {name}: {SCENARIOS[name]}...[/yellow]")
+            for _ in range(max(1, args.repeat)):
+                mock.reset()
+                result = run_child(name, url, args)
+                result.update(server=mock.stats())
+                result["records_per_second"] = result["records"] / result["wall"] if result["wall"] else 0.0
+                result["requests_per_second"] = result["server"]["requests"] / result["wall"] if result["wall"] else 0.0
+                if name not in results or result["wall"] < results[name]["wall"]:
+                    results[name] = result
+    except RuntimeError as e:
+        console.print(f"[bold red]{e}[/bold red]")
+        sys.exit(1)
+    finally:
+        server.shutdown()
+
+    baseline = None
+    if args.compare:
+        baseline = load_baseline(args.compare)
+        if baseline is None:
+            console.print(f"[yellow]No baseline at {args.compare}; save one with --save-baseline[/yellow]")
+        elif baseline.get("config") != config:
+            console.print("[yellow]The baseline was recorded with different settings, "
+                          "so the comparison may not be meaningful[/yellow]")
+
+    regressions = print_results(console, results, baseline, args.tolerance)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.save_baseline) or ".", exist_ok=True)
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump({"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "config": config, "results": results},
+                      f, indent=4)
+        console.print(f"[green]Baseline saved to {args.save_baseline}[/green]")
+
+    if regressions:
+        console.print(f"[bold red]Slower than the baseline: {', '.join(regressions)}[/bold red]")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
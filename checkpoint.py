@@ -0,0 +1,115 @@
+"""
+Pagination checkpoints for resumable follower crawls
+"""
+
+import datetime, json, os, time
+
+import output
+
+
+class Checkpoint:
+    """
+    Last committed pagination state for one (target, edge) crawl
+
+    A checkpoint is only committed once every record before it has been
+    flushed to the output, so resuming never skips or duplicates records.
+    Without a directory the checkpoint lives in memory only, which still
+    lets in-process retries pick up where they left off.
+    """
+
+    def __init__(self, target: str, edge: str = "followers", directory=".checkpoints"):
+        self.target = target
+        self.edge = edge
+        self.path = os.path.join(directory, f"{target}_{edge}.json") if directory else None
+        self.reset()
+
+    def reset(self):
+        self.end_cursor = None
+        self.has_next_page = True
+        self.records_written = 0
+        self.output = None
+        self.output_offset = 0
+        self.frozen = None
+        self.updated = None
+
+    @property
+    def is_resumable(self):
+        """True if there is committed state to resume pagination from"""
+        if self.frozen is not None:
+            best_before = self.frozen.get("best_before")
+            return bool(best_before) and best_before > time.time()
+        return self.end_cursor is not None
+
+    def commit(self, end_cursor=None, records_written=0, output=None, output_offset=0,
+               frozen=None, has_next_page=True, save=True):
+        """Record the current pagination position and persist it, unless save is False"""
+        if frozen is not None:
+            page_info = (frozen.get("remaining_data") or {}).get("page_info", {})
+            end_cursor = page_info.get("end_cursor", end_cursor)
+            has_next_page = page_info.get("has_next_page", has_next_page)
+
+        self.end_cursor = end_cursor
+        self.has_next_page = has_next_page
+        self.records_written = records_written
+        self.output = output
+        self.output_offset = output_offset
+        self.frozen = frozen
+        self.updated = str(datetime.datetime.now())
+        if save:
+            self.save()
+
+    def load(self):
+        """Load a previously saved checkpoint, returning True if one was found"""
+        if not self.path or not os.path.exists(self.path):
+            return False
+
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+
+        return self.restore(data)
+
+    def restore(self, data):
+        """Take over the state of to_dict(), e.g. from a job queue, returning True if it applies"""
+        if not data or data.get("target") != self.target or data.get("edge") != self.edge:
+            return False
+
+        self.end_cursor = data.get("end_cursor")
+        self.has_next_page = data.get("has_next_page", True)
+        self.records_written = data.get("records_written", 0)
+        self.output = data.get("output")
+        self.output_offset = data.get("output_offset", 0)
+        self.frozen = data.get("frozen")
+        self.updated = data.get("updated")
+        return True
+
+    def to_dict(self):
+        return {
+            "target": self.target,
+            "edge": self.edge,
+            "end_cursor": self.end_cursor,
+            "has_next_page": self.has_next_page,
+            "records_written": self.records_written,
+            "output": self.output,
+            "output_offset": self.output_offset,
+            "frozen": self.frozen,
+            "updated": self.updated,
+        }
+
+    def save(self):
+        """Atomically write the checkpoint so a crash never leaves a torn file"""
+        if not self.path:
+            return
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with output.replacing(self.path) as tmp_path:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.to_dict(), f, ensure_ascii=False)
+
+    def clear(self):
+        """Forget the checkpoint once the crawl has completed"""
+        self.reset()
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
@@ -5,115 +5,476 @@ Created by: https://github.com/ibnaleem
 Modified for JSON data export only
 """
 
-import instaloader
 import os
 import json
 import sys
 import datetime
 import time
-import requests
 import argparse
-from rich.console import Console
+import itertools
+from graphql_paginator import (GraphQLPaginator, GraphQLError, FOLLOWERS_QUERY_HASH, FOLLOWING_QUERY_HASH,
+                               RECORD_FIELDS, node_to_record, parse_fields)
+from ndjson_writer import NDJSONWriter, read_ndjson
+from snapshots import SnapshotStore
+from history_db import DEFAULT_DB, HistoryDB
+from page_archive import ArchiveReader, PageArchive
+import analyze
+import avatars
+from prefetch import DEFAULT_DEPTH, Prefetcher
+import metrics
+import output
+from rate_scheduler import AdaptiveScheduler, DOCUMENTED_RATE, instaloader_rate_controller
+from retry import RetryPolicy, wrap_instaloader
+from graphql_batch import AiohttpClient, DEFAULT_CONCURRENCY, GraphQLBatch, ThreadedClient, read_specs
+import transport
+import auth_cache
+import profile_cache
 
-def fetch_graphql_data(query_hash, variables, output_file=None, console=None):
+# rich and instaloader are imported on the code paths that use them: the graphql
+# subcommand never loads instaloader, and --help loads neither.
+
+DEFAULT_POSTS = 12  # Recent posts exported by the user command
+
+def graphql_cookies(console):
+    """Prefer the cached session; fall back to cookies from the browser"""
+    auth = auth_cache.shared()
+    if auth.load():
+        console.print(f"[green]Using cached session for {auth.username}[/green]")
+        return auth.cookies
+    
+    try:
+        import browser_cookie3
+        cookies = browser_cookie3.chrome(domain_name='.instagram.com')
+        console.print("[green]Successfully retrieved cookies from Chrome browser[/green]")
+        return cookies
+    except Exception as e:
+        console.print(f"[yellow]Could not get browser cookies: {e}[/yellow]")
+        console.print("[yellow]Proceeding without authentication, which may limit access[/yellow]")
+        return None
+
+def fetch_graphql_data(query_hash, variables, output_file=None, console=None, max_pages=None, limit=None,
+                       output_format="json", scheduler=None, compact=False, compression=None):
     """
-    Fetch data directly from Instagram GraphQL API endpoint
+    Fetch data directly from Instagram GraphQL API endpoint, following
+    page_info.end_cursor until the edge is exhausted or a limit is hit
     
     Args:
         query_hash: The GraphQL query hash
         variables: Dict or JSON string of variables to send
-        output_file: Where to save the output (defaults to query_hash.json)
+        output_file: Where to save the output (defaults to query_hash_data.json)
         console: Rich console instance for output
+        max_pages: Stop after this many pages (default: no limit)
+        limit: Stop after this many nodes (default: no limit)
+        output_format: "json" for a single document, "ndjson" to stream one node per line
+        scheduler: AdaptiveScheduler pacing the requests (default: the documented rate)
+        compact: Write JSON without indentation (with orjson when it is installed)
+        compression: "gzip" or "zstd" (default: inferred from the output_file extension)
     """
     if console is None:
+        from rich.console import Console
         console = Console()
         
-    # Convert variables to string if they're a dict
-    if isinstance(variables, dict):
-        variables = json.dumps(variables)
+    # Parse variables if they're a JSON string
+    if isinstance(variables, str):
+        variables = json.loads(variables)
         
     if output_file is None:
-        output_file = f"{query_hash}_data.json"
-    
-    # Set up headers to look like a browser request
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/115.0.0.0 Safari/537.36',
-        'Accept': 'application/json',
-        'Accept-Language': 'en-US,en;q=0.9',
-        'Referer': 'https://www.instagram.com/',
-        'X-IG-App-ID': '936619743392459',  # Common Instagram App ID
-        'X-Requested-With': 'XMLHttpRequest',
-    }
+        extension = "ndjson" if output_format == "ndjson" else "json"
+        output_file = output.with_extension(f"{query_hash}_data.{extension}", compression)
+    compression = output.compression_for(output_file, compression)
+    
+    cookies = graphql_cookies(console)
+    
+    console.print(f"[bold blue]Fetching data from Instagram GraphQL API...[/bold blue]")
+    console.print(f"[yellow]Query: {query_hash} {json.dumps(variables)}[/yellow]")
+    
+    scheduler = scheduler or AdaptiveScheduler()
+    paginator = GraphQLPaginator(transport.get_session(), query_hash, variables, max_pages=max_pages, limit=limit,
+                                 scheduler=scheduler, cookies=cookies, retry=RetryPolicy(scheduler=scheduler))
+    writer = NDJSONWriter(output_file, compression=compression) if output_format == "ndjson" else None
+    nodes = []
     
-    # Try to get cookies from browser for authentication
     try:
-        import browser_cookie3
-        cookies = browser_cookie3.chrome(domain_name='.instagram.com')
-        console.print("[green]Successfully retrieved cookies from Chrome browser[/green]")
+        for node in paginator:
+            if writer is not None:
+                writer.write(node)
+            else:
+                nodes.append(node)
+            if paginator.yielded % 50 == 0:
+                console.print(f"[yellow]Retrieved {paginator.yielded} nodes ({paginator.pages} pages)...[/yellow]")
+    except GraphQLError as e:
+        console.print(f"[bold red]Error: {e}[/bold red]")
+        if e.status_code == 401:
+            console.print("[bold red]Authentication error. Make sure you are logged into Instagram in Chrome[/bold red]")
+        elif e.status_code == 429:
+            console.print("[bold red]Rate limited by Instagram. Try again later.[/bold red]")
+        if writer is not None:
+            writer.abort()
+        return None
     except Exception as e:
-        console.print(f"[yellow]Could not get browser cookies: {e}[/yellow]")
-        console.print("[yellow]Proceeding without authentication, which may limit access[/yellow]")
-        cookies = None
+        console.print(f"[bold red]Error fetching data: {e}[/bold red]")
+        if writer is not None:
+            writer.abort()
+        return None
     
-    url = f"https://www.instagram.com/graphql/query?query_hash={query_hash}&variables={variables}"
+    data = {
+        "timestamp": str(datetime.datetime.now()),
+        "query_hash": query_hash,
+        "variables": variables,
+        "count": paginator.count,
+        "pages": paginator.pages,
+        "has_next_page": paginator.has_next_page,
+        "end_cursor": paginator.end_cursor,
+    }
     
-    console.print(f"[bold blue]Fetching data from Instagram GraphQL API...[/bold blue]")
-    console.print(f"[yellow]URL: {url}[/yellow]")
+    # Save the data to a file
+    if writer is not None:
+        writer.close(**data)
+    else:
+        data["nodes"] = nodes
+        output.write_json(output_file, data, compact, compression)
+    metrics.inc("records_total", paginator.yielded, source="graphql")
+        
+    console.print(f"[bold green]✅ {paginator.yielded} nodes from {paginator.pages} pages saved to {output_file}[/bold green]")
+    return data
+
+def archive_graphql_data(query_hash, variables, directory, console=None, max_pages=None, scheduler=None):
+    """
+    Append every page of a GraphQL query, as raw response bytes, to the
+    PageArchive in directory
     
+    Pages are not decoded or re-encoded, so the crawl is bound by the network
+    and the disk. An interrupted crawl continues after the last archived page
+    of the same query. Turn the archive into an export with export_archive.
+    """
+    if console is None:
+        from rich.console import Console
+        console = Console()
+    
+    if isinstance(variables, str):
+        variables = json.loads(variables)
+    
+    archive = PageArchive(directory)
+    after = None
+    resumed = archive.next_cursor(query_hash, variables)
+    if resumed is not None:
+        has_next_page, after = resumed
+        if not has_next_page:
+            console.print(f"[green]{directory} already holds every page of this query[/green]")
+            archive.close()
+            return {"pages": 0, "bytes": 0, "complete": True}
+        console.print(f"[yellow]Continuing the archive after cursor {after}[/yellow]")
+    
+    cookies = graphql_cookies(console)
+    console.print(f"[bold blue]Archiving raw pages from Instagram GraphQL API to {directory}...[/bold blue]")
+    
+    def progress(paginator):
+        if paginator.pages % 50 == 0:
+            console.print(f"[yellow]Archived {paginator.pages} pages ({archive.bytes / 1e6:.1f} MB)...[/yellow]")
+    
+    scheduler = scheduler or AdaptiveScheduler()
+    paginator = GraphQLPaginator(transport.get_session(), query_hash, variables, after=after, max_pages=max_pages,
+                                 scheduler=scheduler, cookies=cookies, retry=RetryPolicy(scheduler=scheduler),
+                                 archive=archive, decode=False, on_page=progress)
     try:
-        response = requests.get(url, headers=headers, cookies=cookies)
-        
-        # Check if the request was successful
-        if response.status_code == 200:
-            data = response.json()
-            
-            # Save the data to a file
-            with open(output_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=4, ensure_ascii=False)
-                
-            console.print(f"[bold green]✅ Data successfully saved to {output_file}[/bold green]")
-            
-            # Try to print some summary info about the data
-            if 'data' in data:
-                if 'user' in data['data']:
-                    user = data['data']['user']
-                    if user:
-                        console.print("[green]User data retrieved successfully[/green]")
-            
-            return data
-        else:
-            console.print(f"[bold red]Error: HTTP {response.status_code}[/bold red]")
-            console.print(f"[yellow]Response: {response.text[:200]}...[/yellow]")
-            
-            if response.status_code == 401:
-                console.print("[bold red]Authentication error. Make sure you are logged into Instagram in Chrome[/bold red]")
-            elif response.status_code == 429:
-                console.print("[bold red]Rate limited by Instagram. Try again later.[/bold red]")
-                
-            return None
-            
+        for _ in paginator:
+            pass
     except Exception as e:
         console.print(f"[bold red]Error fetching data: {e}[/bold red]")
+        console.print("[yellow]Run the same command again to continue after the last archived page.[/yellow]")
         return None
+    finally:
+        archive.close()
+    
+    console.print(f"[bold green]✅ {paginator.pages} pages ({archive.bytes / 1e6:.1f} MB) archived to {directory}[/bold green]")
+    return {"pages": paginator.pages, "bytes": archive.bytes, "complete": not paginator.has_next_page}
 
-def main():
-    console = Console()
+def export_archive(directory, output_file, query_hash=None, console=None, output_format="json", compact=False,
+                   compression=None):
+    """
+    Export the nodes of archived pages like fetch_graphql_data does, without
+    any network access
+    
+    Only the pages of query_hash (default: every page) are decoded, one at a time.
+    """
+    if console is None:
+        from rich.console import Console
+        console = Console()
+    
+    compression = output.compression_for(output_file, compression)
+    writer = NDJSONWriter(output_file, compression=compression) if output_format == "ndjson" else None
+    nodes = []
+    count = 0
+    
+    with ArchiveReader(directory) as reader:
+        pages = sum(1 for _ in reader.pages(query_hash))
+        try:
+            for node in reader.nodes(query_hash):
+                if writer is not None:
+                    writer.write(node)
+                else:
+                    nodes.append(node)
+                count += 1
+        except BaseException:
+            if writer is not None:
+                writer.abort()
+            raise
+    
+    data = {
+        "timestamp": str(datetime.datetime.now()),
+        "archive": directory,
+        "query_hash": query_hash,
+        "count": count,
+        "pages": pages,
+    }
+    if writer is not None:
+        writer.close(**data)
+    else:
+        data["nodes"] = nodes
+        output.write_json(output_file, data, compact, compression)
+    
+    console.print(f"[bold green]✅ {count} nodes from {pages} archived pages saved to {output_file}[/bold green]")
+    return data
+
+def fetch_graphql_batch(spec_file, console=None, concurrency=DEFAULT_CONCURRENCY, rate=DOCUMENTED_RATE, burst=6,
+                        max_pages=None, limit=None, output_format="json", compact=False, compression=None):
+    """
+    Run every query in a spec file concurrently, one JSON object per line
+    with query_hash, variables and output
     
+    Specs run with bounded concurrency on aiohttp (or on worker threads over
+    the shared requests session if aiohttp is not installed), all drawing
+    from one request rate. Each result is written as soon as it completes.
+    """
+    if console is None:
+        from rich.console import Console
+        console = Console()
+    
+    try:
+        specs = read_specs(spec_file, output_format, max_pages, limit, compact, compression)
+    except (OSError, ValueError) as e:
+        console.print(f"[bold red]Could not read spec file: {e}[/bold red]")
+        return None
+    if not specs:
+        console.print("[bold red]Spec file contains no queries![/bold red]")
+        return None
+    
+    cookies = graphql_cookies(console)
+    try:
+        client = AiohttpClient(cookies, concurrency)
+    except ImportError:
+        console.print("[yellow]aiohttp not available (install with: pip install aiohttp), using threads instead[/yellow]")
+        client = ThreadedClient(cookies)
+    
+    scheduler = AdaptiveScheduler(rate=rate, burst=burst)
+    console.print(f"[bold blue]Running {len(specs)} queries, {concurrency} at a time, "
+                  f"at up to {scheduler.target_rate:.3f} req/s...[/bold blue]")
+    
+    import asyncio
+    batch = GraphQLBatch(client, scheduler, concurrency, console)
+    started = time.monotonic()
+    results = asyncio.run(batch.run(specs))
+    
+    succeeded = sum(1 for result in results if result["success"])
+    stats = scheduler.summary()
+    console.print(f"[bold green]✅ {succeeded}/{len(results)} queries completed in {time.monotonic() - started:.1f}s "
+                  f"({stats['requests']} requests, {stats['throttles']} throttled)[/bold green]")
+    return results
+
+def raw_nodes(profile, edge):
+    """
+    Iterator over the raw nodes of a profile's followers or following
+    
+    Yields the GraphQL node dicts as they are, without building a Profile
+    (or looking up an HD picture) for every node and without reloading the
+    profile's metadata first as Profile.get_followers() does.
+    """
+    from instaloader.nodeiterator import NodeIterator
+    
+    query_hash, edge_name = {
+        "followers": (FOLLOWERS_QUERY_HASH, "edge_followed_by"),
+        "following": (FOLLOWING_QUERY_HASH, "edge_follow"),
+    }[edge]
+    return NodeIterator(
+        profile._context,
+        query_hash,
+        lambda d: d['data']['user'][edge_name],
+        lambda n: n,
+        {'id': str(profile.userid)},
+        f'https://www.instagram.com/{profile.username}/',
+    )
+
+def export_profiles(profiles, output_dir, name, timestamp, output_format="json", console=None, snapshots=None,
+                    history=None, account=None, compact=False, compression=None, fields=None, prefetch=DEFAULT_DEPTH):
+    """
+    Export an iterator of profiles (followers or following) to output_dir
+    
+    With output_format="ndjson" each profile is written as soon as it is
+    fetched, so memory stays flat regardless of the account size. If a
+    SnapshotStore or HistoryDB is given the export is also added to it.
+    With fields, profiles are raw nodes (see raw_nodes) and only those
+    fields are kept. Up to prefetch pages are fetched in the background
+    while the current one is converted and written.
+    """
+    if console is None:
+        from rich.console import Console
+        console = Console()
+        
+    writer = None
+    records = []
+    if output_format == "ndjson":
+        filename = output.with_extension(f"{output_dir}/{name}.ndjson", compression)
+        writer = NDJSONWriter(filename, compression=compression)
+    else:
+        filename = output.with_extension(f"{output_dir}/{name}.json", compression)
+    
+    count = 0
+    try:
+        with Prefetcher(profiles, prefetch) as pipeline:
+            for profile in pipeline:
+                if fields:
+                    record = node_to_record(profile, fields)
+                else:
+                    record = {
+                        "id": profile.userid,
+                        "username": profile.username,
+                        "full_name": profile.full_name,
+                        "profile_pic_url": profile.profile_pic_url,
+                        "is_private": profile.is_private,
+                        "is_verified": profile.is_verified
+                    }
+                if writer is not None:
+                    writer.write(record)
+                else:
+                    records.append(record)
+                count += 1
+                if count % 50 == 0:
+                    console.print(f"[yellow]Retrieved {count} {name}...[/yellow]")
+    except BaseException:
+        if writer is not None:
+            writer.abort()
+        raise
+    
+    if writer is not None:
+        writer.close(export_timestamp=timestamp)
+    else:
+        output.write_json(filename, {
+            "timestamp": timestamp,
+            "count": len(records),
+            name: records
+        }, compact, compression)
+    console.print(f"[green]{name.capitalize()} saved to {filename}[/green]")
+    metrics.inc("records_total", count, source="export.py", edge=name)
+    
+    if snapshots is not None:
+        entry = snapshots.record(read_ndjson(filename) if writer is not None else records)
+        if entry["delta"] is not None:
+            console.print(f"[green]{name.capitalize()} since the last snapshot: {entry['added']} new, "
+                          f"{entry['lost']} lost[/green]")
+    
+    if history is not None:
+        history.record_snapshot(account, read_ndjson(filename) if writer is not None else records,
+                                edge=name, source="export.py")
+    return count
+
+def main():
     # Use argparse for better command-line argument handling
     parser = argparse.ArgumentParser(description="Instagram Data Exporter")
+    parser.add_argument('--pool-size', type=int, default=transport.DEFAULT_POOL_SIZE,
+                        help='Number of keep-alive connections kept in the shared HTTP pool')
+    parser.add_argument('--timeout', type=float, default=transport.DEFAULT_TIMEOUT[1],
+                        help='Read timeout in seconds for direct requests')
     subparsers = parser.add_subparsers(dest='command', help='Command to run')
     
     # Subparser for the original user data export
     user_parser = subparsers.add_parser('user', help='Export user data using instaloader')
     user_parser.add_argument('username', help='Instagram username to export data for')
+    user_parser.add_argument('--format', choices=['json', 'ndjson'], default='json',
+                             help='Output format for followers/following; ndjson streams one record per line')
+    user_parser.add_argument('--fields', metavar='FIELDS',
+                             help=f"Comma-separated follower/following fields to export, read straight from the "
+                                  f"lists (from: {','.join(RECORD_FIELDS)}; default: all, with HD profile pictures)")
+    user_parser.add_argument('--db', nargs='?', const=DEFAULT_DB, metavar='PATH',
+                             help=f'Also store the export in an SQLite history database (default: {DEFAULT_DB})')
+    user_parser.add_argument('--snapshot', action='store_true',
+                             help='Also add followers and following to the snapshot history (see main.py --snapshot)')
+    user_parser.add_argument('--posts', type=int, default=DEFAULT_POSTS,
+                             help=f'Number of recent posts to export (default: {DEFAULT_POSTS})')
+    user_parser.add_argument('--prefetch', type=int, default=DEFAULT_DEPTH, metavar='PAGES',
+                             help=f'Pages fetched in the background while the current one is written '
+                                  f'(default: {DEFAULT_DEPTH}; 0 fetches one page at a time)')
+    user_parser.add_argument('--profile-ttl', type=int, default=profile_cache.DEFAULT_TTL,
+                             help='Seconds a cached profile is used before it is loaded again (0 always loads it)')
     
     # Subparser for the new GraphQL data fetching
     graphql_parser = subparsers.add_parser('graphql', help='Fetch data directly from Instagram GraphQL API')
     graphql_parser.add_argument('--query-hash', default='37479f2b8209594dde7facb0d904896a', 
                               help='GraphQL query hash (default: 37479f2b8209594dde7facb0d904896a)')
-    graphql_parser.add_argument('--variables', default='{"id":"7093386149","first":12}',
-                              help='GraphQL variables as JSON string')
+    graphql_parser.add_argument('--variables', default='{"id":"7093386149","first":50}',
+                              help='GraphQL variables as JSON string ("first" sets the page size)')
     graphql_parser.add_argument('--output', help='Output JSON filename')
+    graphql_parser.add_argument('--max-pages', type=int, help='Stop after this many pages (default: follow every page)')
+    graphql_parser.add_argument('--limit', type=int, help='Stop after this many nodes')
+    graphql_parser.add_argument('--format', choices=['json', 'ndjson'], default='json',
+                                help='Output format; ndjson streams one node per line')
+    graphql_parser.add_argument('--spec', metavar='FILE',
+                                help='Run every query in FILE concurrently (one JSON object per line with '
+                                     'query_hash, variables and output); --max-pages, --limit and --format '
+                                     'become per-query defaults')
+    graphql_parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                                help=f'Queries in flight at once with --spec (default: {DEFAULT_CONCURRENCY})')
+    graphql_parser.add_argument('--rate', type=float, default=DOCUMENTED_RATE,
+                                help=f'Request rate in requests/second shared by all queries (default: {DOCUMENTED_RATE:.3f})')
+    graphql_parser.add_argument('--burst', type=int, default=6, help='Maximum number of requests sent back-to-back')
+    graphql_parser.add_argument('--archive', metavar='DIR',
+                                help='Append the raw response pages to the archive in DIR instead of writing an export '
+                                     '(continues an interrupted crawl of the same query)')
+    
+    # Subparser for turning an archive back into an export, offline
+    replay_parser = subparsers.add_parser('replay', help='Export the nodes of a page archive without any requests')
+    replay_parser.add_argument('archive', metavar='DIR', help='Archive written by graphql --archive')
+    replay_parser.add_argument('--query-hash', help='Only export pages of this query (default: every page)')
+    replay_parser.add_argument('--output', help='Output filename (default: DIR.json)')
+    replay_parser.add_argument('--format', choices=['json', 'ndjson'], default='json',
+                               help='Output format; ndjson streams one node per line')
+    
+    # Subparser for joining the followers and following of a user export
+    analyze_parser = subparsers.add_parser('analyze', help='Find mutuals and one-sided follows in a user export')
+    analyze_parser.add_argument('username', help='Account exported with the user command')
+    analyze_parser.add_argument('--followers', metavar='FILE',
+                                help='Followers export (default: the one in USERNAME_data)')
+    analyze_parser.add_argument('--following', metavar='FILE',
+                                help='Following export (default: the one in USERNAME_data)')
+    analyze_parser.add_argument('--output-dir', help='Directory for the results (default: USERNAME_data/analysis)')
+    analyze_parser.add_argument('--max-memory', type=int, default=analyze.DEFAULT_MAX_MEMORY, metavar='MB',
+                                help=f'Records held in memory before sorted runs are spilled to disk '
+                                     f'(default: {analyze.DEFAULT_MAX_MEMORY} MB; bounded only for ndjson exports)')
+    
+    # Subparser for downloading the profile pictures referenced by exports
+    avatars_parser = subparsers.add_parser('avatars', help='Download the profile pictures of any exports, '
+                                                           'each distinct picture stored once')
+    avatars_parser.add_argument('exports', nargs='+', metavar='EXPORT',
+                                help='JSON or NDJSON exports (from main.py, user, graphql or replay)')
+    avatars_parser.add_argument('--dir', default=avatars.DEFAULT_DIR,
+                                help=f'Content-addressed picture store (default: {avatars.DEFAULT_DIR})')
+    avatars_parser.add_argument('--concurrency', type=int, default=avatars.DEFAULT_CONCURRENCY,
+                                help=f'Downloads in flight at once (default: {avatars.DEFAULT_CONCURRENCY})')
+    avatars_parser.add_argument('--metrics', metavar='FILE',
+                                help='Write request and download metrics to FILE at exit '
+                                     '(JSON, or Prometheus text if FILE ends in .prom)')
+    avatars_parser.add_argument('--metrics-port', type=int, metavar='PORT',
+                                help='Serve metrics in Prometheus text format on http://127.0.0.1:PORT/metrics')
+    for subparser in (user_parser, graphql_parser, replay_parser):
+        subparser.add_argument('--compact', action='store_true',
+                               help='Write JSON without indentation (faster and smaller; uses orjson if installed)')
+    for subparser in (user_parser, graphql_parser, replay_parser, analyze_parser):
+        subparser.add_argument('--compress', choices=output.COMPRESSIONS,
+                               help='Compress output files as they are written (zstd needs the zstandard package)')
+        subparser.add_argument('--metrics', metavar='FILE',
+                               help='Write request, retry, sleep and serialization metrics to FILE at exit '
+                                    '(JSON, or Prometheus text if FILE ends in .prom)')
+        subparser.add_argument('--metrics-port', type=int, metavar='PORT',
+                               help='Serve metrics in Prometheus text format on http://127.0.0.1:PORT/metrics')
     
     args = parser.parse_args()
     
@@ -121,18 +482,97 @@ def main():
     if not args.command:
         parser.print_help()
         return
+    try:
+        output.check_available(getattr(args, 'compress', None))
+    except RuntimeError as e:
+        parser.error(str(e))
+    
+    pool_size = args.pool_size
+    if args.command == 'avatars':
+        if args.concurrency < 1:
+            parser.error("--concurrency must be at least 1")
+        missing = [filename for filename in args.exports if not os.path.exists(filename)]
+        if missing:
+            parser.error(f"no such export: {', '.join(missing)}")
+        # Every download needs a connection of its own, or workers queue on the pool
+        pool_size = max(pool_size, args.concurrency)
+    
+    transport.configure(pool_size=pool_size, timeout=(transport.DEFAULT_TIMEOUT[0], args.timeout))
+    metrics.setup(args.metrics, args.metrics_port)
+    
+    from rich.console import Console
+    console = Console()
+    
+    if args.command == 'avatars':
+        avatars.sync(args.exports, args.dir, args.concurrency, console)
+        console.print(f"[yellow]Metrics: {metrics.registry.summary_line()}[/yellow]")
+        return
+    
+    if args.command == 'analyze':
+        if args.max_memory < 1:
+            parser.error("--max-memory must be at least 1 MB")
+        directory = f"{args.username}_data"
+        followers_file = args.followers or analyze.find_export(directory, "followers")
+        following_file = args.following or analyze.find_export(directory, "following")
+        if not followers_file or not following_file:
+            parser.error(f"no followers and following export in {directory}; run the user command first "
+                         "or pass --followers and --following")
+        analyze.analyze(followers_file, following_file, args.output_dir or os.path.join(directory, "analysis"),
+                        args.max_memory, args.compress, console)
+        return
+    
+    if args.command == 'replay':
+        extension = "ndjson" if args.format == "ndjson" else "json"
+        output_file = args.output or output.with_extension(f"{args.archive.rstrip('/')}.{extension}", args.compress)
+        export_archive(args.archive, output_file, args.query_hash, console, args.format, args.compact, args.compress)
+        return
+    
+    if args.command == 'graphql' and args.archive:
+        if args.spec or args.limit is not None or args.output:
+            parser.error("--archive cannot be combined with --spec, --limit or --output")
+        archive_graphql_data(args.query_hash, args.variables, args.archive, console, max_pages=args.max_pages)
+        console.print(f"[yellow]Metrics: {metrics.registry.summary_line()}[/yellow]")
+        return
     
     # Handle GraphQL command
+    if args.command == 'graphql' and args.spec:
+        if args.concurrency < 1:
+            parser.error("--concurrency must be at least 1")
+        if args.rate <= 0 or args.rate > DOCUMENTED_RATE:
+            parser.error(f"--rate must be between 0 and {DOCUMENTED_RATE:.3f} requests/second")
+        fetch_graphql_batch(args.spec, console, concurrency=args.concurrency, rate=args.rate, burst=args.burst,
+                            max_pages=args.max_pages, limit=args.limit, output_format=args.format,
+                            compact=args.compact, compression=args.compress)
+        console.print(f"[yellow]Metrics: {metrics.registry.summary_line()}[/yellow]")
+        return
+    
     if args.command == 'graphql':
-        fetch_graphql_data(args.query_hash, args.variables, args.output, console)
+        fetch_graphql_data(args.query_hash, args.variables, args.output, console,
+                           max_pages=args.max_pages, limit=args.limit, output_format=args.format,
+                           compact=args.compact, compression=args.compress)
+        console.print(f"[yellow]Metrics: {metrics.registry.summary_line()}[/yellow]")
         return
     
     # Original functionality for user data export
+    if args.posts < 0 or args.prefetch < 0:
+        parser.error("--posts and --prefetch cannot be negative")
+    if args.fields is not None:
+        try:
+            args.fields = parse_fields(args.fields)
+        except ValueError as e:
+            parser.error(f"--fields: {e}")
+        if "id" not in args.fields and (args.snapshot or args.db):
+            parser.error("--fields must include id when --snapshot or --db is used")
+    profile_cache.shared(ttl=args.profile_ttl)
     username = args.username
     console.print(f"[bold blue]Instagram Data Exporter for user: {username}[/bold blue]")
     
-    # Create Instaloader instance
+    # Create Instaloader instance, paced by the adaptive scheduler and retrying in place like main.py's
+    import instaloader
+    scheduler = AdaptiveScheduler()
     loader = instaloader.Instaloader(
+        sleep=False,  # Pacing is left to the scheduler
+        rate_controller=instaloader_rate_controller(scheduler),
         download_pictures=False,
         download_videos=False,
         download_video_thumbnails=False,
@@ -141,13 +581,19 @@ def main():
         save_metadata=False,
         compress_json=False
     )
+    transport.share_with_instaloader(loader.context)
+    wrap_instaloader(loader.context, RetryPolicy(scheduler=scheduler))
     
     # Attempt login
     try:
         session_file = f"{os.path.expanduser('~')}/.instaloader_session"
+        auth = auth_cache.shared()
         
-        # Try to load existing session
-        if os.path.exists(session_file):
+        # Reuse a recently verified session without any login round-trips
+        if auth.load() and auth.is_fresh() and auth.cookies.get("csrftoken"):
+            loader.load_session(auth.username, auth.cookies)
+            console.print(f"[green]Using cached session for {auth.username}[/green]")
+        elif os.path.exists(session_file):
             console.print("[yellow]Loading existing session...[/yellow]")
             try:
                 loader.load_session_from_file(None, session_file)
@@ -172,7 +618,17 @@ def main():
     # Get profile
     try:
         console.print("[yellow]Loading profile data...[/yellow]")
-        profile = instaloader.Profile.from_username(loader.context, username)
+        profiles = profile_cache.shared()
+        cached = profiles.profile(loader.context, username)
+        if cached is not None and not cached.is_private:
+            profile = cached
+            console.print(f"[green]Using cached profile (ID {profile.userid})[/green]")
+        else:
+            try:
+                profile = instaloader.Profile.from_username(loader.context, username)
+            except instaloader.exceptions.ProfileNotExistsException:
+                profiles.invalidate(username)
+                raise
         
         # Create output directory if it doesn't exist
         output_dir = f"{username}_data"
@@ -196,93 +652,66 @@ def main():
             "profile_pic_url": profile.profile_pic_url
         }
         
-        with open(f"{output_dir}/account_info.json", "w") as f:
-            json.dump(account_info, f, indent=4)
-        console.print(f"[green]Account info saved to {output_dir}/account_info.json[/green]")
+        if profile is not cached:
+            profiles.store(profile)
+        account_file = output.write_json(output.with_extension(f"{output_dir}/account_info.json", args.compress),
+                                         account_info, args.compact, args.compress)
+        console.print(f"[green]Account info saved to {account_file}[/green]")
+        
+        history = HistoryDB(args.db) if args.db else None
+        if history is not None:
+            history.record_user(dict(account_info, id=profile.userid))
         
         # Get followers
         if not profile.is_private:
             console.print("[yellow]Downloading followers list (this may take time)...[/yellow]")
-            followers = []
-            count = 0
-            
-            for follower in profile.get_followers():
-                followers.append({
-                    "username": follower.username,
-                    "full_name": follower.full_name,
-                    "profile_pic_url": follower.profile_pic_url,
-                    "is_private": follower.is_private,
-                    "is_verified": follower.is_verified
-                })
-                count += 1
-                if count % 50 == 0:
-                    console.print(f"[yellow]Retrieved {count} followers...[/yellow]")
-            
-            with open(f"{output_dir}/followers.json", "w") as f:
-                json.dump({
-                    "timestamp": timestamp,
-                    "count": len(followers),
-                    "followers": followers
-                }, f, indent=4)
-            console.print(f"[green]Followers saved to {output_dir}/followers.json[/green]")
+            followers = raw_nodes(profile, "followers") if args.fields else profile.get_followers()
+            export_profiles(followers, output_dir, "followers", timestamp, args.format, console,
+                            SnapshotStore(username, "followers") if args.snapshot else None, history, username,
+                            args.compact, args.compress, args.fields, args.prefetch)
             
             # Get following
             console.print("[yellow]Downloading following list (this may take time)...[/yellow]")
-            following = []
-            count = 0
-            
-            for followee in profile.get_followees():
-                following.append({
-                    "username": followee.username,
-                    "full_name": followee.full_name,
-                    "profile_pic_url": followee.profile_pic_url,
-                    "is_private": followee.is_private,
-                    "is_verified": followee.is_verified
-                })
-                count += 1
-                if count % 50 == 0:
-                    console.print(f"[yellow]Retrieved {count} following...[/yellow]")
+            following = raw_nodes(profile, "following") if args.fields else profile.get_followees()
+            export_profiles(following, output_dir, "following", timestamp, args.format, console,
+                            SnapshotStore(username, "following") if args.snapshot else None, history, username,
+                            args.compact, args.compress, args.fields, args.prefetch)
             
-            with open(f"{output_dir}/following.json", "w") as f:
-                json.dump({
-                    "timestamp": timestamp,
-                    "count": len(following),
-                    "following": following
-                }, f, indent=4)
-            console.print(f"[green]Following saved to {output_dir}/following.json[/green]")
-            
-            # Get recent posts (limited to 12 to avoid rate limiting)
+            # Get recent posts (limited to --posts to avoid rate limiting); islice stops
+            # the prefetcher before it asks for a page past the limit
             console.print("[yellow]Downloading recent posts data...[/yellow]")
             posts = []
-            count = 0
             
-            for post in profile.get_posts():
-                if count >= 12:  # Limit to recent 12 posts
-                    break
-                    
-                posts.append({
-                    "shortcode": post.shortcode,
-                    "url": f"https://www.instagram.com/p/{post.shortcode}/",
-                    "date": str(post.date_utc),
-                    "caption": post.caption,
-                    "likes": post.likes,
-                    "comments": post.comments,
-                    "type": "video" if post.is_video else "image"
-                })
-                count += 1
+            recent = itertools.islice(profile.get_posts(), args.posts)
+            with Prefetcher(recent, args.prefetch) as pipeline:
+                for post in pipeline:
+                    posts.append({
+                        "shortcode": post.shortcode,
+                        "url": f"https://www.instagram.com/p/{post.shortcode}/",
+                        "date": str(post.date_utc),
+                        "caption": post.caption,
+                        "likes": post.likes,
+                        "comments": post.comments,
+                        "type": "video" if post.is_video else "image"
+                    })
             
-            with open(f"{output_dir}/recent_posts.json", "w") as f:
-                json.dump({
-                    "timestamp": timestamp,
-                    "count": len(posts),
-                    "posts": posts
-                }, f, indent=4)
-            console.print(f"[green]Recent posts saved to {output_dir}/recent_posts.json[/green]")
+            posts_file = output.write_json(output.with_extension(f"{output_dir}/recent_posts.json", args.compress), {
+                "timestamp": timestamp,
+                "count": len(posts),
+                "posts": posts
+            }, args.compact, args.compress)
+            console.print(f"[green]Recent posts saved to {posts_file}[/green]")
+            metrics.inc("records_total", len(posts), source="export.py", edge="posts")
+            if history is not None:
+                history.record_posts(username, posts)
         else:
             console.print("[yellow]This is a private account. Can only save public information.[/yellow]")
             
         console.print("[bold green]Data export completed successfully![/bold green]")
         console.print(f"[bold blue]All data saved in the '{output_dir}' folder[/bold blue]")
+        if history is not None:
+            console.print(f"[bold blue]History database updated: {history.path}[/bold blue]")
+        console.print(f"[yellow]Metrics: {metrics.registry.summary_line()}[/yellow]")
         
     except Exception as e:
         console.print(f"[bold red]Error: {e}[/bold red]")
@@ -0,0 +1,24 @@
+"""
+Advisory file locks serializing read-merge-write saves across processes
+"""
+
+import contextlib
+
+try:
+    import fcntl
+except ImportError:  # Windows: saves stay atomic, only concurrent merges can race
+    fcntl = None
+
+
+@contextlib.contextmanager
+def locked(path):
+    """Hold an exclusive lock on path (created if missing) for the duration of the block"""
+    if fcntl is None:
+        yield
+        return
+    with open(path, "a+b") as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
@@ -6,6 +6,7 @@ from rich.console import Console
 from argparse import ArgumentParser
 import datetime, instaloader, os, time, json, sys, webbrowser
 from instaloader.exceptions import LoginException, ConnectionException
+from ndjson_writer import NDJSONWriter
 
 class InstaFollowers:
     def __init__(self, username: str):
@@ -81,8 +82,8 @@ class InstaFollowers:
             self.console.print(f"[bold red]Manual login failed: {e}[/bold red]")
             return False
     
-    def get_followers(self):
-        """Get followers for the specified username"""
+    def get_followers(self, writer=None):
+        """Get followers for the specified username, streaming to writer if given"""
         try:
             self.console.print(f"[bold blue]Fetching followers for {self.username}...[/bold blue]")
             
@@ -110,20 +111,31 @@ class InstaFollowers:
             # Collect followers data
             with self.console.status("[bold green]Downloading followers list...") as status:
                 for follower in profile.get_followers():
-                    followers.append({
+                    record = {
                         "username": follower.username,
                         "full_name": follower.full_name,
                         "profile_pic_url": follower.profile_pic_url,
                         "is_private": follower.is_private,
                         "is_verified": follower.is_verified
-                    })
+                    }
+                    if writer is not None:
+                        writer.write(record)
+                    else:
+                        followers.append(record)
                     
                     count += 1
                     if count % 50 == 0:
                         self.console.print(f"[yellow]Retrieved {count} followers so far...[/yellow]")
             
             # Return collected data
-            self.console.print(f"[bold green]Successfully collected {len(followers)} followers![/bold green]")
+            self.console.print(f"[bold green]Successfully collected {count} followers![/bold green]")
+            if writer is not None:
+                return {
+                    "timestamp": str(datetime.datetime.now()),
+                    "username": self.username,
+                    "followers_count": followers_count,
+                    "exported": count
+                }
             return {
                 "timestamp": str(datetime.datetime.now()),
                 "username": self.username,
@@ -153,13 +165,25 @@ class InstaFollowers:
             self.console.print(f"[bold red]Error saving data: {str(e)}[/bold red]")
             return False
     
-    def run(self):
+    def run(self, output_format="json", output=None):
         """Main execution flow"""
         # Attempt login
         if not self.login():
             self.console.print("[bold red]Login failed. Cannot continue.[/bold red]")
             return False
         
+        # Stream followers straight to disk
+        if output_format == "ndjson":
+            filename = output or f"{self.username}_followers.ndjson"
+            with NDJSONWriter(filename) as writer:
+                followers_data = self.get_followers(writer=writer)
+                if not followers_data:
+                    writer.abort()
+                    return False
+                writer.close(username=self.username, followers_count=followers_data["followers_count"])
+            self.console.print(f"[bold green]Data saved to {filename}![/bold green]")
+            return True
+        
         # Get followers data
         followers_data = self.get_followers()
         
@@ -179,11 +203,17 @@ def main():
     )
     parser.add_argument("-u", "--username", help="Instagram username to fetch followers from", required=True)
     parser.add_argument("-o", "--output", help="Output JSON filename (default: USERNAME_followers.json)")
+    parser.add_argument("-f", "--format", choices=["json", "ndjson"], default="json",
+                        help="Output format; ndjson streams one follower per line as it is fetched")
     
     args = parser.parse_args()
     
     # Initialize and run
     exporter = InstaFollowers(args.username)
+    if args.format == "ndjson":
+        exporter.run(output_format="ndjson", output=args.output)
+        return
+    
     success = exporter.run()
     
     # Save to specified output file if provided
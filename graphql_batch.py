@@ -0,0 +1,286 @@
+"""
+Concurrent runner for many independent GraphQL queries
+"""
+
+import datetime, json, time
+
+import metrics, output, transport
+from graphql_paginator import GRAPHQL_URL, GraphQLError, find_edge, page_params
+from ndjson_writer import NDJSONWriter
+from rate_scheduler import parse_retry_after
+from retry import THROTTLED, TRANSIENT, RetryPolicy, classify
+
+# asyncio is imported where it is used so that loading this module (as export.py
+# does for its --help defaults) stays cheap.
+
+DEFAULT_CONCURRENCY = 8
+MAX_RETRIES = 3  # Retries of a single page after a throttle or a transient error
+
+
+def read_specs(path, output_format="json", max_pages=None, limit=None, compact=False, compression=None):
+    """
+    Read query specs from a file, one JSON object per line:
+
+        {"query_hash": "...", "variables": {"id": "123", "first": 50}, "output": "123.json"}
+
+    output, format, max_pages, limit, compact and compress are optional;
+    missing ones fall back to the given defaults. Blank lines and lines starting with # are skipped.
+    """
+    specs = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+
+            try:
+                spec = json.loads(line)
+                if not isinstance(spec, dict) or not spec.get("query_hash"):
+                    raise ValueError("a spec needs at least a query_hash")
+                variables = spec.get("variables") or {}
+                if isinstance(variables, str):
+                    variables = json.loads(variables)
+            except ValueError as e:
+                raise ValueError(f"{path}:{line_number}: {e}") from None
+
+            spec_format = spec.get("format", output_format)
+            spec_compression = spec.get("compress", compression)
+            spec_output = spec.get("output") or output.with_extension(
+                f"{spec['query_hash']}_{len(specs) + 1}.{spec_format}", spec_compression)
+            specs.append({
+                "query_hash": spec["query_hash"],
+                "variables": variables,
+                "format": spec_format,
+                "output": spec_output,
+                "max_pages": spec.get("max_pages", max_pages),
+                "limit": spec.get("limit", limit),
+                "compact": spec.get("compact", compact),
+                "compression": output.compression_for(spec_output, spec_compression),
+            })
+    return specs
+
+
+def cookie_dict(cookies):
+    """Plain name -> value mapping from a dict or a cookie jar"""
+    if not cookies:
+        return None
+    if isinstance(cookies, dict):
+        return dict(cookies)
+    return {cookie.name: cookie.value for cookie in cookies}
+
+
+class AiohttpClient:
+    """
+    GraphQL GETs over one aiohttp session whose connection pool is sized to the concurrency
+
+    The session is bound to the event loop it is created on, so it is only
+    opened by GraphQLBatch.run(), on the loop that drives the requests.
+    """
+
+    def __init__(self, cookies=None, concurrency=DEFAULT_CONCURRENCY):
+        import aiohttp  # Raises ImportError right away, so callers can fall back to threads
+
+        self.cookies = cookie_dict(cookies)
+        self.concurrency = concurrency
+        self.session = None
+
+    async def open(self):
+        import aiohttp
+
+        connect_timeout, read_timeout = transport.request_timeout()
+        self.session = aiohttp.ClientSession(
+            headers=transport.DEFAULT_HEADERS,
+            cookies=self.cookies,
+            connector=aiohttp.TCPConnector(limit=self.concurrency),
+            timeout=aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout),
+        )
+
+    async def get(self, params):
+        import asyncio, aiohttp
+
+        # Requests bypass the shared requests adapter, so they are measured here
+        started = time.perf_counter()
+        try:
+            # Not sent through the requests adapter, so a configured base URL (the mock server) is applied here
+            async with self.session.get(transport.rewrite_url(GRAPHQL_URL), params=params) as response:
+                body = await response.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            # Surfaced as an OSError, like requests' network errors, so retry.classify() sees it as transient
+            raise ConnectionError(f"{type(e).__name__}: {e}") from e
+        metrics.inc("requests_total", status=str(response.status))
+        metrics.observe("request_seconds", time.perf_counter() - started)
+        metrics.observe("response_bytes", len(body))
+        return response.status, response.reason, response.headers, body.decode("utf-8", "replace")
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+
+class ThreadedClient:
+    """Fallback without aiohttp: the shared requests session, called from worker threads"""
+
+    def __init__(self, cookies=None):
+        self.session = transport.get_session()
+        self.cookies = cookies
+
+    async def get(self, params):
+        import asyncio
+        response = await asyncio.to_thread(self.session.get, GRAPHQL_URL, params=params,
+                                           headers=transport.DEFAULT_HEADERS, cookies=self.cookies,
+                                           timeout=transport.request_timeout())
+        return response.status_code, response.reason, response.headers, response.text
+
+    async def open(self):
+        pass
+
+    async def close(self):
+        pass
+
+
+class GraphQLBatch:
+    """
+    Run many query specs concurrently
+
+    Up to `concurrency` specs are in flight at once. Pages of one spec are
+    still fetched in order (each needs the previous end_cursor), but every
+    request, across all specs, takes a token from the shared scheduler, so
+    the batch as a whole stays within the configured rate. Each spec is
+    written to its own output as soon as it completes; ndjson outputs are
+    written page by page.
+    """
+
+    def __init__(self, client, scheduler, concurrency=DEFAULT_CONCURRENCY, console=None, max_retries=MAX_RETRIES):
+        self.client = client
+        self.scheduler = scheduler
+        self.concurrency = max(1, concurrency)
+        self.console = console
+        self.max_retries = max_retries
+        # Only its delays are used: the retry loop itself has to await
+        self.policy = RetryPolicy(attempts=max_retries, scheduler=scheduler)
+        self.results = []
+
+    def print(self, message):
+        if self.console is not None:
+            self.console.print(message)
+
+    async def fetch_page(self, spec, after):
+        """Request one page of a spec and return its edge, retrying throttles and transient errors"""
+        params = page_params(spec["query_hash"], spec["variables"], spec["variables"].get("first", 50), after)
+
+        for attempt in range(self.max_retries + 1):
+            await self.scheduler.acquire_async()
+            try:
+                status, reason, headers, text = await self.client.get(params)
+                if status != 200:
+                    raise GraphQLError(f"HTTP {status} - {reason}: {text[:200]}", status,
+                                       parse_retry_after(headers.get("Retry-After")))
+                data = json.loads(text)
+            except Exception as error:
+                kind = classify(error)
+                if getattr(error, "status_code", None) in (401, 429):
+                    self.scheduler.on_throttle(error.retry_after)
+                if kind not in (TRANSIENT, THROTTLED) or attempt == self.max_retries:
+                    raise
+                metrics.inc("retries_total", reason=kind)
+                if kind == THROTTLED:
+                    delay = self.scheduler.backoff_delay()
+                else:
+                    delay = max(getattr(error, "retry_after", None) or 0, self.policy.delay(attempt + 1))
+                await self.scheduler.sleep_async(delay, reason="backoff")
+                continue
+
+            self.scheduler.on_success()
+            edge = find_edge(data)
+            if edge is None:
+                raise GraphQLError("Response did not contain a paginated edge", status)
+            return edge
+
+    async def run_spec(self, spec):
+        """Fetch every page of one spec into its output file"""
+        async with self.semaphore:
+            started = time.monotonic()
+            writer = None
+            nodes = []
+            yielded = pages = 0
+            count = end_cursor = None
+            has_next_page = True
+
+            try:
+                if spec["format"] == "ndjson":
+                    writer = NDJSONWriter(spec["output"], compression=spec["compression"])
+                while has_next_page and (spec["max_pages"] is None or pages < spec["max_pages"]):
+                    edge = await self.fetch_page(spec, end_cursor)
+                    pages += 1
+                    count = edge.get("count", count)
+                    metrics.observe("records_per_page", len(edge.get("edges", [])))
+
+                    for item in edge.get("edges", []):
+                        if spec["limit"] is not None and yielded >= spec["limit"]:
+                            break
+                        yielded += 1
+                        if writer is not None:
+                            writer.write(item["node"])
+                        else:
+                            nodes.append(item["node"])
+
+                    page_info = edge.get("page_info") or {}
+                    end_cursor = page_info.get("end_cursor")
+                    has_next_page = bool(page_info.get("has_next_page")) and bool(end_cursor)
+                    if spec["limit"] is not None and yielded >= spec["limit"]:
+                        break
+
+                data = {
+                    "timestamp": str(datetime.datetime.now()),
+                    "query_hash": spec["query_hash"],
+                    "variables": spec["variables"],
+                    "count": count,
+                    "pages": pages,
+                    "has_next_page": has_next_page,
+                    "end_cursor": end_cursor,
+                }
+                if writer is not None:
+                    writer.close(**data)
+                else:
+                    data["nodes"] = nodes
+                    output.write_json(spec["output"], data, spec["compact"], spec["compression"])
+            except Exception as e:
+                if writer is not None:
+                    writer.abort()
+                return dict(self.result(spec, started, yielded, pages), success=False, error=str(e))
+            metrics.inc("records_total", yielded, source="graphql")
+
+            return dict(self.result(spec, started, yielded, pages), success=True, error=None)
+
+    def result(self, spec, started, nodes, pages):
+        return {
+            "query_hash": spec["query_hash"],
+            "variables": spec["variables"],
+            "output": spec["output"],
+            "nodes": nodes,
+            "pages": pages,
+            "seconds": round(time.monotonic() - started, 2),
+        }
+
+    async def run(self, specs):
+        """Run every spec, reporting each one as it completes"""
+        import asyncio
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        tasks = []
+        try:
+            await self.client.open()
+            tasks = [asyncio.create_task(self.run_spec(spec)) for spec in specs]
+            for task in asyncio.as_completed(tasks):
+                result = await task
+                self.results.append(result)
+                if result["success"]:
+                    self.print(f"[green]✓ {result['output']}: {result['nodes']} nodes from {result['pages']} pages "
+                               f"in {result['seconds']:.1f}s[/green]")
+                else:
+                    self.print(f"[bold red]✗ {result['output']}: {result['error']}[/bold red]")
+        finally:
+            for task in tasks:
+                task.cancel()
+            await self.client.close()
+        return self.results
@@ -0,0 +1,189 @@
+"""
+Cursor-following paginator for Instagram's GraphQL endpoint
+"""
+
+import json
+
+import metrics, transport
+from page_archive import scan_page_info
+from rate_scheduler import parse_retry_after
+
+GRAPHQL_URL = "https://www.instagram.com/graphql/query"
+FOLLOWERS_QUERY_HASH = "37479f2b8209594dde7facb0d904896a"
+FOLLOWING_QUERY_HASH = "58712303d941c6855d4e888c5f0cd22f"
+
+
+class GraphQLError(Exception):
+    """A GraphQL page request failed"""
+
+    def __init__(self, message, status_code=None, retry_after=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def find_edge(data, edge=None):
+    """Return the paginated edge (a dict with edges and page_info) from a GraphQL response"""
+    user = (data.get("data") or {}).get("user") or {}
+    if edge is not None:
+        return user.get(edge)
+
+    for value in user.values():
+        if isinstance(value, dict) and "edges" in value and "page_info" in value:
+            return value
+    return None
+
+
+def page_params(query_hash, variables, page_size, after=None):
+    """Query string for one page of a paginated GraphQL query"""
+    variables = dict(variables, first=page_size)
+    if after:
+        variables["after"] = after
+    else:
+        variables.pop("after", None)
+
+    return {
+        "query_hash": query_hash,
+        "variables": json.dumps(variables, separators=(",", ":")),
+    }
+
+
+RECORD_FIELDS = ("id", "username", "full_name", "profile_pic_url", "is_private", "is_verified")
+
+
+def parse_fields(value):
+    """Tuple of record fields from a comma-separated list; raises ValueError for unknown fields"""
+    fields = tuple(dict.fromkeys(field.strip() for field in value.split(",") if field.strip()))
+    unknown = [field for field in fields if field not in RECORD_FIELDS]
+    if unknown:
+        raise ValueError(f"unknown field(s) {', '.join(unknown)}; choose from {', '.join(RECORD_FIELDS)}")
+    if not fields:
+        raise ValueError("no fields given")
+    return fields
+
+
+def node_to_record(node, fields=RECORD_FIELDS):
+    """Convert a raw follower/following node into an export record with only the given fields"""
+    record = {field: node.get(field) for field in fields}
+    if "id" in record:
+        record["id"] = int(record["id"]) if record["id"] else None
+    return record
+
+
+class GraphQLPaginator:
+    """
+    Iterate over every node of a paginated GraphQL edge
+
+    Pages are requested one at a time, following page_info.end_cursor until
+    has_next_page is false or max_pages/limit is reached. Nodes are yielded
+    as soon as their page arrives. on_page is called once all nodes of a
+    page have been consumed, which is the point where end_cursor can be
+    safely committed as a checkpoint. With a retry policy a failed page
+    request is retried in place instead of ending the iteration.
+
+    With a PageArchive every response body is also appended to it as it
+    was received. With decode=False as well, pages are not decoded at all
+    (the cursor is read straight from the bytes where possible) and no nodes
+    are yielded: iterating just archives every page.
+    """
+
+    def __init__(self, session, query_hash, variables, edge=None, after=None, page_size=None,
+                 max_pages=None, limit=None, scheduler=None, on_page=None, cookies=None,
+                 headers=None, timeout=None, retry=None, archive=None, decode=True):
+        if isinstance(variables, str):
+            variables = json.loads(variables)
+
+        self.session = session if session is not None else transport.get_session()
+        self.query_hash = query_hash
+        self.variables = dict(variables)
+        self.edge = edge
+        self.page_size = page_size or self.variables.get("first", 50)
+        self.max_pages = max_pages
+        self.limit = limit
+        self.scheduler = scheduler
+        self.on_page = on_page
+        self.cookies = cookies
+        self.headers = headers if headers is not None else transport.DEFAULT_HEADERS
+        self.timeout = timeout if timeout is not None else transport.request_timeout()
+        self.retry = retry
+        self.archive = archive
+        self.decode = decode
+
+        self.end_cursor = after
+        self.has_next_page = True
+        self.count = None
+        self.pages = 0
+        self.yielded = 0
+
+    def fetch_page(self):
+        """Request the page after the current end_cursor and return its edge"""
+        if self.retry is not None:
+            return self.retry.call(self._fetch_page)
+        return self._fetch_page()
+
+    def _fetch_page(self):
+        params = page_params(self.query_hash, self.variables, self.page_size, self.end_cursor)
+
+        if self.scheduler is not None:
+            self.scheduler.acquire()
+        response = self.session.get(GRAPHQL_URL, params=params, headers=self.headers,
+                                    cookies=self.cookies, timeout=self.timeout)
+
+        if response.status_code != 200:
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            if self.scheduler is not None and response.status_code in (401, 429):
+                self.scheduler.on_throttle(retry_after)
+            raise GraphQLError(f"HTTP {response.status_code} - {response.reason}: {response.text[:200]}",
+                               response.status_code, retry_after)
+
+        if self.scheduler is not None:
+            self.scheduler.on_success()
+
+        if self.archive is None:
+            data = response.json()
+        else:
+            body = response.content
+            scanned = None if self.decode else scan_page_info(body)
+            if scanned is not None:
+                count, has_next_page, end_cursor = scanned
+                self.archive.append(body, self.query_hash, self.variables, self.end_cursor, end_cursor, has_next_page)
+                return {"count": count, "edges": [],
+                        "page_info": {"has_next_page": has_next_page, "end_cursor": end_cursor}}
+            data = json.loads(body)
+
+        if "data" in data and (data["data"] or {}).get("user") is None:
+            raise GraphQLError("User not found", 404)
+        edge = find_edge(data, self.edge)
+        if edge is None:
+            raise GraphQLError("Response did not contain a paginated edge", response.status_code)
+
+        if self.archive is not None:
+            page_info = edge.get("page_info") or {}
+            self.archive.append(body, self.query_hash, self.variables, self.end_cursor,
+                                page_info.get("end_cursor"), bool(page_info.get("has_next_page")))
+            if not self.decode:
+                edge = dict(edge, edges=[])
+        return edge
+
+    def __iter__(self):
+        while self.has_next_page:
+            if self.max_pages is not None and self.pages >= self.max_pages:
+                return
+
+            edge = self.fetch_page()
+            self.pages += 1
+            self.count = edge.get("count", self.count)
+            metrics.observe("records_per_page", len(edge.get("edges", [])))
+
+            for item in edge.get("edges", []):
+                if self.limit is not None and self.yielded >= self.limit:
+                    return
+                self.yielded += 1
+                yield item["node"]
+
+            page_info = edge.get("page_info") or {}
+            self.end_cursor = page_info.get("end_cursor")
+            self.has_next_page = bool(page_info.get("has_next_page")) and bool(self.end_cursor)
+
+            if self.on_page is not None:
+                self.on_page(self)
@@ -3,10 +3,10 @@
 Quick test script for GraphQL API access
 """
 
-import requests
 import json
 import sys
 from rich.console import Console
+import transport
 
 console = Console()
 
@@ -14,15 +14,7 @@ def main():
     # The URL from the user's request
     url = "https://www.instagram.com/graphql/query?query_hash=37479f2b8209594dde7facb0d904896a&variables=%7B%22id%22%3A%227093386149%22%2C%22first%22%3A12%7D"
     
-    # Set up headers to mimic a browser
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/115.0.0.0 Safari/537.36',
-        'Accept': 'application/json',
-        'Accept-Language': 'en-US,en;q=0.9',
-        'Referer': 'https://www.instagram.com/',
-        'X-IG-App-ID': '936619743392459',
-        'X-Requested-With': 'XMLHttpRequest',
-    }
+    # Browser-like headers and keep-alive pooling come from the shared transport
     
     console.print("[bold blue]Testing direct access to Instagram GraphQL API...[/bold blue]")
     console.print(f"[yellow]URL: {url}[/yellow]")
@@ -30,7 +22,7 @@ def main():
     try:
         # Try without cookies first
         console.print("[yellow]Attempting to fetch data without authentication...[/yellow]")
-        response = requests.get(url, headers=headers)
+        response = transport.get(url)
         
         if response.status_code == 200:
             data = response.json()
@@ -48,7 +40,7 @@ def main():
             console.print("[yellow]Trying with browser cookies...[/yellow]")
             cookies = browser_cookie3.chrome(domain_name='.instagram.com')
             
-            response = requests.get(url, headers=headers, cookies=cookies)
+            response = transport.get(url, cookies=cookies)
             
             if response.status_code == 200:
                 data = response.json()
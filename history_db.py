@@ -0,0 +1,221 @@
+"""
+Indexed SQLite history of every exported account
+"""
+
+import datetime, threading
+
+DEFAULT_DB = "instagram_history.db"
+BATCH_SIZE = 1000  # Rows per executemany call
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY,
+    username TEXT,
+    full_name TEXT,
+    is_private INTEGER,
+    is_verified INTEGER,
+    profile_pic_url TEXT,
+    updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS users_username ON users (username);
+
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    account TEXT NOT NULL,
+    edge TEXT NOT NULL,
+    taken_at TEXT NOT NULL,
+    count INTEGER,
+    source TEXT
+);
+CREATE INDEX IF NOT EXISTS snapshots_account_time ON snapshots (account, edge, taken_at);
+
+CREATE TABLE IF NOT EXISTS edges (
+    account TEXT NOT NULL,
+    edge TEXT NOT NULL,
+    user_id INTEGER NOT NULL,
+    first_seen TEXT NOT NULL,
+    last_seen TEXT NOT NULL,
+    first_snapshot INTEGER NOT NULL,
+    last_snapshot INTEGER NOT NULL,
+    PRIMARY KEY (account, edge, user_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS edges_user ON edges (user_id);
+CREATE INDEX IF NOT EXISTS edges_last_snapshot ON edges (account, edge, last_snapshot);
+
+CREATE TABLE IF NOT EXISTS posts (
+    shortcode TEXT PRIMARY KEY,
+    account TEXT NOT NULL,
+    taken_at TEXT,
+    caption TEXT,
+    likes INTEGER,
+    comments INTEGER,
+    type TEXT,
+    url TEXT,
+    updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS posts_account_time ON posts (account, taken_at);
+"""
+
+UPSERT_USER = """
+INSERT INTO users (id, username, full_name, is_private, is_verified, profile_pic_url, updated_at)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (id) DO UPDATE SET
+    username = coalesce(excluded.username, users.username),
+    full_name = coalesce(excluded.full_name, users.full_name),
+    is_private = coalesce(excluded.is_private, users.is_private),
+    is_verified = coalesce(excluded.is_verified, users.is_verified),
+    profile_pic_url = coalesce(excluded.profile_pic_url, users.profile_pic_url),
+    updated_at = excluded.updated_at
+"""
+
+UPSERT_EDGE = """
+INSERT INTO edges (account, edge, user_id, first_seen, last_seen, first_snapshot, last_snapshot)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (account, edge, user_id) DO UPDATE SET
+    last_seen = excluded.last_seen,
+    last_snapshot = excluded.last_snapshot
+"""
+
+UPSERT_POST = """
+INSERT INTO posts (shortcode, account, taken_at, caption, likes, comments, type, url, updated_at)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (shortcode) DO UPDATE SET
+    caption = excluded.caption,
+    likes = excluded.likes,
+    comments = excluded.comments,
+    updated_at = excluded.updated_at
+"""
+
+
+def now():
+    return datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+
+def batched(iterable, size=BATCH_SIZE):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class HistoryDB:
+    """
+    SQLite store of users, follower/following edges, snapshots and posts
+
+    Every user is one row in `users`. An edge row records when a user was
+    first and last seen following (or followed by) an account, so "when did
+    X first follow" and "who is gone since the last snapshot" are single
+    index lookups. `snapshots` keeps the count of every export over time.
+    The database runs in WAL mode and is safe to share between threads.
+    """
+
+    def __init__(self, path=DEFAULT_DB):
+        import sqlite3
+
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def record_snapshot(self, account, records, edge="followers", taken_at=None, source=None):
+        """
+        Store one export of an account's followers (or following)
+
+        records may be any iterable of export records and is consumed in
+        batches, so memory stays flat. Records without an id are skipped.
+        Returns the new snapshot id.
+        """
+        taken_at = taken_at or now()
+
+        with self.lock, self.conn:
+            snapshot_id = self.conn.execute(
+                "INSERT INTO snapshots (account, edge, taken_at, source) VALUES (?, ?, ?, ?)",
+                (account, edge, taken_at, source),
+            ).lastrowid
+
+            count = 0
+            for batch in batched(record for record in records if record.get("id") is not None):
+                self.conn.executemany(UPSERT_USER, [
+                    (int(r["id"]), r.get("username"), r.get("full_name"), r.get("is_private"),
+                     r.get("is_verified"), r.get("profile_pic_url"), taken_at)
+                    for r in batch
+                ])
+                self.conn.executemany(UPSERT_EDGE, [
+                    (account, edge, int(r["id"]), taken_at, taken_at, snapshot_id, snapshot_id)
+                    for r in batch
+                ])
+                count += len(batch)
+
+            self.conn.execute("UPDATE snapshots SET count = ? WHERE id = ?", (count, snapshot_id))
+        return snapshot_id
+
+    def record_user(self, record, taken_at=None):
+        """Store a single profile, e.g. the exported account itself"""
+        with self.lock, self.conn:
+            self.conn.execute(UPSERT_USER, (
+                int(record["id"]), record.get("username"), record.get("full_name"), record.get("is_private"),
+                record.get("is_verified"), record.get("profile_pic_url"), taken_at or now(),
+            ))
+
+    def record_posts(self, account, posts, taken_at=None):
+        taken_at = taken_at or now()
+        with self.lock, self.conn:
+            for batch in batched(posts):
+                self.conn.executemany(UPSERT_POST, [
+                    (p["shortcode"], account, p.get("date"), p.get("caption"), p.get("likes"),
+                     p.get("comments"), p.get("type"), p.get("url"), taken_at)
+                    for p in batch
+                ])
+
+    def history(self, account, edge="followers"):
+        """(taken_at, count) of every snapshot of an account, oldest first"""
+        return self.conn.execute(
+            "SELECT taken_at, count FROM snapshots WHERE account = ? AND edge = ? ORDER BY taken_at",
+            (account, edge),
+        ).fetchall()
+
+    def latest_snapshot(self, account, edge="followers"):
+        row = self.conn.execute(
+            "SELECT id FROM snapshots WHERE account = ? AND edge = ? ORDER BY taken_at DESC LIMIT 1",
+            (account, edge),
+        ).fetchone()
+        return row["id"] if row else None
+
+    def first_seen(self, account, username, edge="followers"):
+        """When username was first (and last) seen in an account's followers, or None"""
+        # CROSS JOIN pins the order: username index first, then one primary-key probe into edges
+        return self.conn.execute(
+            "SELECT u.id, u.username, e.first_seen, e.last_seen FROM users u "
+            "CROSS JOIN edges e ON e.account = ? AND e.edge = ? AND e.user_id = u.id "
+            "WHERE u.username = ?",
+            (account, edge, username),
+        ).fetchone()
+
+    def current(self, account, edge="followers"):
+        """Users in the latest snapshot of an account"""
+        return self.conn.execute(
+            "SELECT u.* FROM edges e JOIN users u ON u.id = e.user_id "
+            "WHERE e.account = ? AND e.edge = ? AND e.last_snapshot = ?",
+            (account, edge, self.latest_snapshot(account, edge)),
+        ).fetchall()
+
+    def lost(self, account, edge="followers", since=None):
+        """Users who were seen before but are missing from the latest snapshot"""
+        query = ("SELECT u.*, e.first_seen, e.last_seen FROM edges e JOIN users u ON u.id = e.user_id "
+                 "WHERE e.account = ? AND e.edge = ? AND e.last_snapshot < ?")
+        params = [account, edge, self.latest_snapshot(account, edge)]
+        if since is not None:
+            query += " AND e.last_seen >= ?"
+            params.append(since)
+        return self.conn.execute(query + " ORDER BY e.last_seen DESC", params).fetchall()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,353 @@
+"""
+SQLite job queue coordinating exports across worker processes and hosts
+"""
+
+import contextlib, datetime, json, os, socket, threading, time
+
+import metrics
+from batch import output_path
+from checkpoint import Checkpoint
+from ndjson_writer import part_path
+
+metrics.register("queue_claims_total", "Jobs claimed from the queue, new or reclaimed after an expired lease")
+metrics.register("queue_jobs_total", "Queued jobs finished by this worker, by result")
+
+DEFAULT_QUEUE = "instagram_jobs.db"
+DEFAULT_LEASE = 300  # Seconds a claimed job stays reserved without a heartbeat
+DEFAULT_MAX_ATTEMPTS = 5  # Claims of a job before it is marked failed
+DEFAULT_POLL = 10  # Seconds an idle worker waits before looking for work again
+COPY_CHUNK = 1024 * 1024
+EDGES = ("followers",)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    target TEXT NOT NULL,
+    edge TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    owner TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    checkpoint TEXT,
+    records INTEGER,
+    output TEXT,
+    error TEXT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS jobs_active ON jobs (target, edge) WHERE status IN ('pending', 'leased');
+CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (status, lease_until);
+"""
+
+# One statement, so claiming is atomic under SQLite's write lock however many processes compete
+CLAIM = """
+UPDATE jobs SET status = 'leased', owner = ?, lease_until = ?, attempts = attempts + 1, updated_at = ?
+WHERE id = (
+    SELECT id FROM jobs
+    WHERE status = 'pending' OR (status = 'leased' AND lease_until < ?)
+    ORDER BY id LIMIT 1
+)
+RETURNING *
+"""
+
+
+def now():
+    return datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+
+def worker_id(number=0):
+    """Owner name of a worker thread, unique across hosts and processes"""
+    return f"{socket.gethostname()}:{os.getpid()}:{number}"
+
+
+def copy_prefix(source, destination, length):
+    """Copy the first length bytes of source to destination, returning how many there were"""
+    copied = 0
+    with open(source, "rb") as src, open(destination, "wb") as dst:
+        while copied < length:
+            chunk = src.read(min(length - copied, COPY_CHUNK))
+            if not chunk:
+                break
+            dst.write(chunk)
+            copied += len(chunk)
+    return copied
+
+
+class LeaseLost(Exception):
+    """Raised into a crawl once another worker has taken over its job"""
+
+
+class JobQueue:
+    """
+    Queue of (target, edge) export jobs in an SQLite database
+
+    A worker claims a job with a lease that expires lease seconds later
+    unless it is renewed by a heartbeat; a job whose lease has expired (its
+    worker died or hung) is handed to the next worker that asks. Heartbeats
+    also carry the crawl's checkpoint, so whoever picks a job up again
+    resumes from the last committed cursor. A target is only queued once
+    while it is pending or running. The database runs in WAL mode and can be
+    shared by any number of threads and processes on one filesystem.
+    """
+
+    def __init__(self, path=DEFAULT_QUEUE, timeout=30):
+        import sqlite3
+
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=timeout, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def add(self, target, edge="followers"):
+        """Queue a job, returning False if the target is already pending or running"""
+        if edge not in EDGES:
+            raise ValueError(f"unsupported edge {edge!r} (expected one of: {', '.join(EDGES)})")
+        stamp = now()
+        with self.lock, self.conn:
+            cursor = self.conn.execute(
+                "INSERT OR IGNORE INTO jobs (target, edge, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                (target, edge, stamp, stamp),
+            )
+        return cursor.rowcount == 1
+
+    def claim(self, owner, lease=DEFAULT_LEASE, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        """Lease the oldest available job to owner, or return None if there is none"""
+        with self.lock, self.conn:
+            clock = time.time()
+            # Jobs that keep losing their worker are given up on rather than reclaimed forever
+            self.conn.execute(
+                "UPDATE jobs SET status = 'failed', owner = NULL, error = 'lease expired', updated_at = ? "
+                "WHERE status = 'leased' AND lease_until < ? AND attempts >= ?",
+                (now(), clock, max_attempts),
+            )
+            row = self.conn.execute(CLAIM, (owner, clock + lease, now(), clock)).fetchone()
+        if row is None:
+            return None
+
+        job = dict(row)
+        job["checkpoint"] = json.loads(job["checkpoint"]) if job["checkpoint"] else None
+        metrics.inc("queue_claims_total", result="reclaimed" if job["attempts"] > 1 else "new")
+        return job
+
+    def heartbeat(self, job_id, owner, lease=DEFAULT_LEASE, checkpoint=None, records=None):
+        """Renew a lease (and store progress), returning False if owner no longer holds it"""
+        with self.lock, self.conn:
+            cursor = self.conn.execute(
+                "UPDATE jobs SET lease_until = ?, checkpoint = coalesce(?, checkpoint), "
+                "records = coalesce(?, records), updated_at = ? "
+                "WHERE id = ? AND owner = ? AND status = 'leased'",
+                (time.time() + lease, json.dumps(checkpoint) if checkpoint else None, records, now(),
+                 job_id, owner),
+            )
+        return cursor.rowcount == 1
+
+    def complete(self, job_id, owner, records=None, output=None):
+        """Mark a job done, returning False if owner had already lost it"""
+        with self.lock, self.conn:
+            cursor = self.conn.execute(
+                "UPDATE jobs SET status = 'done', owner = NULL, lease_until = NULL, checkpoint = NULL, "
+                "records = ?, output = ?, error = NULL, updated_at = ? "
+                "WHERE id = ? AND owner = ? AND status = 'leased'",
+                (records, output, now(), job_id, owner),
+            )
+        return cursor.rowcount == 1
+
+    def fail(self, job_id, owner, error, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        """
+        Release a job after a failed export
+
+        It goes back to pending, keeping its checkpoint, until it has been
+        attempted max_attempts times, and is then marked failed.
+        """
+        with self.lock, self.conn:
+            cursor = self.conn.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "owner = NULL, lease_until = NULL, error = ?, updated_at = ? "
+                "WHERE id = ? AND owner = ? AND status = 'leased'",
+                (max_attempts, error, now(), job_id, owner),
+            )
+        return cursor.rowcount == 1
+
+    def stats(self):
+        """Number of jobs in each status"""
+        with self.lock:
+            rows = self.conn.execute("SELECT status, count(*) AS jobs FROM jobs GROUP BY status").fetchall()
+        return {row["status"]: row["jobs"] for row in rows}
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class QueueWorker:
+    """
+    Claim jobs from a JobQueue and export them until the queue is empty or the worker is stopped
+
+    Exports go through a BatchExporter, so every worker thread shares one
+    session and one request budget. Each attempt at a job is streamed to its
+    own file in the batch's output directory (streamed to FILE.part, as
+    every resumable export is), renamed to the usual
+    USERNAME_followers.ndjson once the job is marked done. While it runs, a heartbeat
+    thread renews the lease every third of the lease, and every checkpoint
+    the crawl commits is stored with the job. A job picked up again after a
+    failure or an expired lease is resumed from that checkpoint, provided
+    the previous attempt's file is in the same directory. A worker that
+    finds its lease taken over (say it was paused for longer than the lease)
+    stops at its next checkpoint, and only ever wrote to its own file.
+    """
+
+    def __init__(self, queue, batch, lease=DEFAULT_LEASE, max_attempts=DEFAULT_MAX_ATTEMPTS, until_empty=False,
+                 poll_interval=DEFAULT_POLL):
+        self.queue = queue
+        self.batch = batch
+        self.console = batch.console
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.until_empty = until_empty
+        self.poll_interval = poll_interval
+        self.stopped = threading.Event()
+        self.results = []
+
+    def heartbeat(self, job, owner, done, lost):
+        """Renew the job's lease until done is set, or flag lost once it is gone"""
+        while not done.wait(self.lease / 3):
+            if not self.queue.heartbeat(job["id"], owner, self.lease):
+                lost.set()
+                return
+
+    def take_over(self, job, attempt_output):
+        """
+        Carry the job's stored checkpoint over to this attempt's output file
+
+        The job's checkpoint may come from another host, so it takes
+        precedence over a local one. The records it covers are copied from
+        the previous attempt's .part file (or its finished file, if it lost
+        the job just before marking it done), which is then removed; without
+        either the crawl starts over.
+        """
+        checkpoint = Checkpoint(job["target"], job["edge"])
+        if not checkpoint.restore(job["checkpoint"]) or not checkpoint.output:
+            return False
+        for previous in (part_path(checkpoint.output), checkpoint.output):
+            try:
+                copied = copy_prefix(previous, part_path(attempt_output), checkpoint.output_offset)
+            except OSError:
+                copied = 0
+            if copied == checkpoint.output_offset:
+                break
+        else:
+            self.console.print(f"[yellow]Partial output {part_path(checkpoint.output)} of job {job['id']} "
+                               f"is missing, starting over...[/yellow]")
+            return False
+
+        checkpoint.output = attempt_output
+        checkpoint.save()
+        with contextlib.suppress(OSError):
+            os.remove(previous)
+        return True
+
+    def export(self, job, owner):
+        """Export one claimed job, returning its result record"""
+        username = job["target"]
+        exporter = self.batch.make_exporter(username)
+        filename = output_path(username, "ndjson", self.batch.output_dir)
+        # Every attempt writes its own file, so a worker that lost its lease can't clobber the next one's
+        attempt_output = f"{filename}.{job['id']}-{job['attempts']}"
+        self.take_over(job, attempt_output)
+
+        done, lost = threading.Event(), threading.Event()
+
+        def on_checkpoint(checkpoint):
+            if lost.is_set() or not self.queue.heartbeat(job["id"], owner, self.lease, checkpoint.to_dict(),
+                                                         checkpoint.records_written):
+                lost.set()
+                raise LeaseLost(f"lease on job {job['id']} ({username}) was taken over")
+
+        exporter.on_checkpoint = on_checkpoint
+        beat = threading.Thread(target=self.heartbeat, args=(job, owner, done, lost), name="heartbeat", daemon=True)
+        beat.start()
+        started = time.monotonic()
+        error = None
+        try:
+            success = exporter.export(output_format="ndjson", output=attempt_output, resume=True)
+        except Exception as e:
+            success = False
+            error = str(e)
+        finally:
+            done.set()
+            beat.join()
+
+        if success and not lost.is_set():
+            # Only the current lease holder may publish the file; whoever took the job over resumes from it
+            if self.queue.complete(job["id"], owner, exporter.records, filename):
+                os.replace(attempt_output, filename)
+                metrics.inc("queue_jobs_total", result="ok")
+            else:
+                lost.set()
+        elif not lost.is_set():
+            error = error or "export failed"
+            self.queue.fail(job["id"], owner, error, self.max_attempts)
+            metrics.inc("queue_jobs_total", result="failed")
+        if lost.is_set():
+            # Whoever holds the job now carries on from its stored checkpoint; nothing to release
+            metrics.inc("queue_jobs_total", result="lost")
+            error = "lease lost"
+
+        return {
+            "id": job["id"],
+            "username": username,
+            "success": bool(success) and not lost.is_set(),
+            "records": exporter.records,
+            "attempt": job["attempts"],
+            "output": filename if success and not lost.is_set() else None,
+            "seconds": round(time.monotonic() - started, 2),
+            "error": error,
+        }
+
+    def work(self, number=0):
+        """Claim and export jobs on this thread until there are none left or the worker stops"""
+        owner = worker_id(number)
+        while not self.stopped.is_set():
+            job = self.queue.claim(owner, self.lease, self.max_attempts)
+            if job is None:
+                if self.until_empty:
+                    return
+                self.stopped.wait(self.poll_interval)
+                continue
+
+            resumed = f" (attempt {job['attempts']})" if job["attempts"] > 1 else ""
+            self.console.print(f"[blue]{owner} claimed job {job['id']}: {job['target']} {job['edge']}{resumed}[/blue]")
+            result = self.export(job, owner)
+            self.results.append(result)
+            if result["success"]:
+                self.console.print(f"[green]✓ {result['username']}: {result['records']} followers "
+                                   f"in {result['seconds']:.1f}s[/green]")
+            else:
+                self.console.print(f"[bold red]✗ {result['username']}: {result['error']}[/bold red]")
+
+            if self.batch.primary.retry.breaker.is_open:
+                # The session is unusable: every further claim would only burn an attempt
+                self.console.print("[bold red]Authentication keeps failing; this worker stops claiming jobs.[/bold red]")
+                self.stopped.set()
+
+    def run(self, workers=1):
+        """Work the queue on workers threads, returning the per-job results"""
+        from concurrent.futures import ThreadPoolExecutor
+
+        if self.batch.output_dir:
+            os.makedirs(self.batch.output_dir, exist_ok=True)
+
+        self.console.print(f"[bold blue]Working queue {self.queue.path} with {workers} workers "
+                           f"({self.lease:.0f}s leases)...[/bold blue]")
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="queue") as executor:
+            futures = [executor.submit(self.work, number) for number in range(workers)]
+            try:
+                for future in futures:
+                    future.result()
+            except BaseException:
+                self.stopped.set()
+                raise
+        return self.results
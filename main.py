@@ -2,19 +2,73 @@
 Instagram Followers Exporter
 """
 
-from rich.console import Console
 from argparse import ArgumentParser
-import datetime, instaloader, os, time, json, sys, webbrowser, requests, urllib.parse
-from instaloader.exceptions import LoginException, ConnectionException
-import http.cookiejar
+import datetime, os, time, sys, threading
+import auth_cache
+from batch import BatchExporter, DEFAULT_WORKERS, read_targets
+from checkpoint import Checkpoint
+from graphql_paginator import GraphQLPaginator, GraphQLError, FOLLOWERS_QUERY_HASH, RECORD_FIELDS, node_to_record, parse_fields
+from history_db import DEFAULT_DB, HistoryDB
+from job_queue import DEFAULT_LEASE, DEFAULT_MAX_ATTEMPTS, DEFAULT_QUEUE, JobQueue, LeaseLost, QueueWorker
+import metrics, output, profile_cache, progress
+from ndjson_writer import NDJSONWriter, part_path, read_ndjson
+from page_archive import PageArchive
+from prefetch import DEFAULT_DEPTH, Prefetcher
+from progress import LOG_FORMATS, Progress
+from snapshots import FULL_EVERY, SnapshotStore
+import transport
+from watch import DEFAULT_INTERVAL, DEFAULT_THRESHOLD, Watcher
+from rate_scheduler import AdaptiveScheduler, DOCUMENTED_RATE, instaloader_rate_controller
+from retry import AUTH, THROTTLED, CircuitOpenError, RetryPolicy, classify, wrap_instaloader
+
+# Heavy modules (instaloader, requests, rich, webbrowser) are imported where they are
+# first needed, so --version, --help and argument errors start at interpreter speed.
+
+# Commit a pagination checkpoint every this many followers
+CHECKPOINT_EVERY = 50
+
+# Serializes session refreshes when several exports share one login
+LOGIN_LOCK = threading.Lock()
 
 class InstaFollowers:
-    def __init__(self, username: str):
+    def __init__(self, username: str, scheduler=None, insta=None, retry=None, max_retries=3):
+        import instaloader
+        
         self.username = username
-        self.console = Console()
+        self.console = progress.make_console()
+        self.show_status = True
+        self.records = 0
+        self.snapshots = None  # SnapshotStore when follower history is tracked
+        self.history = None  # HistoryDB when exports are also stored in SQLite
+        self.compact = False  # Write JSON without indentation
+        self.compression = None  # "gzip" or "zstd" to compress the JSON output
+        self.fields = None  # Record fields projected straight from the raw nodes, or None for full records
+        self.archive = None  # PageArchive keeping the raw pages of the direct API route
+        self.prefetch = DEFAULT_DEPTH  # Follower pages fetched ahead while the current one is written
+        self.on_checkpoint = None  # Called with the checkpoint after every commit, e.g. to renew a job lease
+        self.progress = Progress()  # Count, phase and ETA of the current export, rendered by export()
+        
+        # One verified cookie jar is shared by every code path in the process
+        self.auth = auth_cache.shared()
+        self.profiles = profile_cache.shared()
+        
+        # All queries are paced by the adaptive scheduler instead of fixed sleeps
+        self.scheduler = scheduler or AdaptiveScheduler()
+        
+        # Failing requests are retried in place; batch workers share the primary's
+        # policy, so repeated auth failures stop every export on the session
+        self.retry = retry or RetryPolicy(attempts=max_retries, scheduler=self.scheduler,
+                                          on_auth_error=self.refresh_session)
+        
+        # Batch workers reuse the already logged-in loader of the primary exporter
+        if insta is not None:
+            self.insta = insta
+            return
         
         # Configure instaloader with minimal options and quiet authentication
         self.insta = instaloader.Instaloader(
+            sleep=False,  # Pacing is left to the scheduler
+            rate_controller=instaloader_rate_controller(self.scheduler),
             quiet=True,  # Set to True to suppress authentication prompts
             download_pictures=False,
             download_videos=False, 
@@ -25,6 +79,10 @@ class InstaFollowers:
             compress_json=False,
             max_connection_attempts=3
         )
+        
+        # Direct requests share instaloader's authenticated session and connection pool
+        transport.share_with_instaloader(self.insta.context)
+        wrap_instaloader(self.insta.context, self.retry)
     
     @property
     def date(self):
@@ -32,7 +90,7 @@ class InstaFollowers:
             return datetime.datetime.now(datetime.UTC)
         except AttributeError:
             return datetime.datetime.now(datetime.timezone.utc)
-            
+    
     def get_browser_cookies(self):
         """Get Instagram cookies directly from the browser"""
         try:
@@ -62,38 +120,71 @@ class InstaFollowers:
             return None
             
     def login(self, force_new=False):
-        """Handle login to Instagram using browser cookies only - no password prompts"""
+        """
+        Handle login to Instagram using browser cookies only - no password prompts
+        
+        A session verified within the auth cache TTL is reused as-is, so warm
+        starts need no browser, cookie extraction or verification request.
+        """
+        with metrics.timer("login_seconds"):
+            success = self._login(force_new)
+        metrics.inc("logins_total", result="ok" if success else "failed")
+        return success
+    
+    def _login(self, force_new):
+        import instaloader, webbrowser
+        
         self.console.print("[bold blue]Starting Instagram login...[/bold blue]")
         
         # Session file path
         session_file = f"{os.path.expanduser('~')}/.instaloader_session"
         
         # Remove session if forcing a new login
-        if force_new and os.path.exists(session_file):
-            try:
-                os.remove(session_file)
-                self.console.print("[yellow]Forced new login: removed old session file[/yellow]")
-            except Exception:
-                pass
+        if force_new:
+            self.auth.clear()
+            if os.path.exists(session_file):
+                try:
+                    os.remove(session_file)
+                    self.console.print("[yellow]Forced new login: removed old session file[/yellow]")
+                except Exception:
+                    pass
+        
+        # Reuse a recently verified session without touching the network
+        if self.auth.load() and self.auth.is_fresh() and self.use_cookies(self.auth.cookies, self.auth.username):
+            self.console.print(f"[green]Using cached session for {self.auth.username} "
+                               f"(verified {self.auth.age / 60:.0f} minutes ago)[/green]")
+            return True
+        
+        # Cached cookies past their TTL only need one verification request
+        if self.auth.cookies and self.use_cookies(self.auth.cookies, self.auth.username):
+            self.console.print("[yellow]Re-verifying cached session...[/yellow]")
+            if self.verify_session():
+                return True
         
         # Try to use existing session first (if not forcing new)
         if not force_new and os.path.exists(session_file):
             try:
                 self.console.print("[yellow]Trying to use existing session...[/yellow]")
                 self.insta.load_session_from_file(None, session_file)
-                self.console.print("[green]Loaded existing session successfully![/green]")
-                return True
+                if self.verify_session():
+                    self.console.print("[green]Loaded existing session successfully![/green]")
+                    return True
             except Exception as e:
                 self.console.print(f"[yellow]Could not use existing session: {e}[/yellow]")
-                self.console.print("[yellow]Will try browser cookie authentication...[/yellow]")
-        
-        # Help user log in via browser first
-        self.console.print("[yellow]Opening web browser for Instagram login...[/yellow]")
-        self.console.print("[bold yellow]IMPORTANT: Please log into Instagram in the browser window.[/bold yellow]")
-        self.console.print("[bold yellow]Complete all verification steps in the browser if required.[/bold yellow]")
-        self.console.print("[bold yellow]After logging in successfully, return here to continue.[/bold yellow]")
+            self.console.print("[yellow]Will try browser cookie authentication...[/yellow]")
         
         try:
+            # The browser may already hold a valid session, so only open it if needed
+            cookies = self.get_browser_cookies()
+            if cookies and self.use_browser_cookies(cookies) and self.verify_session(session_file):
+                return True
+            
+            # Help user log in via browser first
+            self.console.print("[yellow]Opening web browser for Instagram login...[/yellow]")
+            self.console.print("[bold yellow]IMPORTANT: Please log into Instagram in the browser window.[/bold yellow]")
+            self.console.print("[bold yellow]Complete all verification steps in the browser if required.[/bold yellow]")
+            self.console.print("[bold yellow]After logging in successfully, return here to continue.[/bold yellow]")
+            
             # Open Instagram website to ensure user is logged in
             webbrowser.open("https://www.instagram.com/")
             
@@ -104,29 +195,9 @@ class InstaFollowers:
             # Direct browser cookie authentication - no interactive_login to avoid password prompts
             cookies = self.get_browser_cookies()
             if cookies:
-                # Create a cookie jar and add it to instaloader's session
-                cookie_jar = http.cookiejar.CookieJar()
-                for cookie in cookies:
-                    cookie_jar.set_cookie(cookie)
-                
-                self.insta.context._session.cookies.update(cookie_jar)
-                self.console.print("[green]Successfully imported cookies from browser![/green]")
-                
-                # Try to save session for future use
-                try:
-                    self.insta.save_session_to_file(session_file)
-                    self.console.print("[yellow]Session saved for future use[/yellow]")
-                except Exception as save_error:
-                    self.console.print(f"[yellow]Could not save session: {save_error}[/yellow]")
-                
-                # Test the session
-                try:
-                    test_profile = instaloader.Profile.from_username(self.insta.context, "instagram")
-                    self.console.print(f"[green]Login successful! Session verified with {test_profile.username}[/green]")
+                if self.use_browser_cookies(cookies) and self.verify_session(session_file):
                     return True
-                except Exception as test_error:
-                    self.console.print(f"[yellow]Session test failed: {test_error}[/yellow]")
-                    self.console.print("[yellow]Cookie authentication may not have worked properly.[/yellow]")
+                self.console.print("[yellow]Cookie authentication may not have worked properly.[/yellow]")
             else:
                 self.console.print("[bold red]Could not retrieve Instagram cookies from any browser.[/bold red]")
                 self.console.print("[yellow]Make sure you're logged into Instagram in Chrome, Safari, or Firefox.[/yellow]")
@@ -162,45 +233,89 @@ class InstaFollowers:
             self.console.print(f"[bold red]Login process failed: {e}[/bold red]")
             self.console.print("[yellow]Please manually log into Instagram in your browser before trying again.[/yellow]")
             return False
-            
-            # Test the session with a simple request
-            try:
-                self.console.print("[yellow]Testing Instagram session...[/yellow]")
-                test_profile = instaloader.Profile.from_username(self.insta.context, "instagram")
-                self.console.print(f"[green]Session test successful (verified {test_profile.username})![/green]")
-            except Exception as test_error:
-                self.console.print(f"[bold red]Session test failed: {test_error}[/bold red]")
-                self.console.print("[yellow]Instagram may be asking for additional verification.[/yellow]")
-                self.console.print("[yellow]Try checking the browser window for any challenges.[/yellow]")
-                return False
-            
-            # Save session for future use
+    
+    def use_cookies(self, cookies, username=None):
+        """Load a plain cookie dict into instaloader's session"""
+        if not cookies.get("csrftoken"):
+            return False
+        self.insta.load_session(username, cookies)
+        return True
+    
+    def use_browser_cookies(self, cookies):
+        """Load a browser cookie jar into instaloader's session"""
+        self.console.print("[green]Successfully imported cookies from browser![/green]")
+        return self.use_cookies({cookie.name: cookie.value for cookie in cookies})
+    
+    def verify_session(self, session_file=None):
+        """Verify the current session with a single request and cache it on success"""
+        try:
+            username = self.insta.test_login()
+        except Exception as test_error:
+            self.console.print(f"[yellow]Session test failed: {test_error}[/yellow]")
+            return False
+        
+        if not username:
+            self.console.print("[yellow]Session test failed: Instagram does not recognise this session[/yellow]")
+            return False
+        
+        self.insta.context.username = username
+        self.auth.store(self.insta.save_session(), username)
+        self.console.print(f"[green]Login successful! Session verified as {username}[/green]")
+        
+        # Try to save session for future use
+        if session_file:
             try:
                 self.insta.save_session_to_file(session_file)
                 self.console.print("[yellow]Session saved for future use[/yellow]")
-            except Exception:
-                pass
-                
-            return True
-        except Exception as e:
-            self.console.print(f"[bold red]Browser login failed: {e}[/bold red]")
-            self.console.print("[yellow]Please make sure you can access Instagram.com in your browser[/yellow]")
-            self.console.print("[yellow]and that you're properly logged in before trying again.[/yellow]")
+            except Exception as save_error:
+                self.console.print(f"[yellow]Could not save session: {save_error}[/yellow]")
+        return True
+    
+    def refresh_session(self, error):
+        """
+        Handle a 401/403 for the retry policy, returning True if the request should be retried
+        
+        Instagram also answers 401 when it is throttling, so the session is
+        checked with one request first and only re-logged in if it is gone.
+        """
+        # Batch workers share one session, so one at a time
+        with LOGIN_LOCK:
+            if self.verify_session():
+                self.scheduler.on_throttle()
+                self.scheduler.sleep(self.scheduler.backoff_delay(), reason="backoff")
+                return True
             
-            # Return failure instead of trying manual login
-            return False
+            self.console.print("[yellow]Session expired, logging in again...[/yellow]")
+            self.auth.invalidate()
+            return self.login()
     
-    def get_followers(self, max_retries=3):
-        """Get followers for the specified username with robust error handling"""
+    def get_followers(self, max_retries=3, writer=None, checkpoint=None):
+        """
+        Get followers for the specified username with robust error handling
+
+        If a writer is given, each follower is streamed to it as it arrives
+        instead of being collected in memory. Pagination state is committed to
+        the checkpoint as the crawl progresses, so retries (and, for persisted
+        checkpoints, later runs) resume from the last committed cursor.
+        """
+        import instaloader
+        
         retry_count = 0
-        wait_time = 30  # Start with 30 seconds wait
+        
+        # Without a persisted checkpoint, still keep one in memory for retries
+        if checkpoint is None:
+            checkpoint = Checkpoint(self.username, "followers", directory=None)
+        followers = []
+        user_id = None
+        followers_count = None
         
         while retry_count <= max_retries:
             try:
                 self.console.print(f"[bold blue]Fetching followers for {self.username}...[/bold blue]")
                 
-                # Get profile
-                profile = instaloader.Profile.from_username(self.insta.context, self.username)
+                # Get profile, from the profile cache if it was fetched recently
+                self.progress.phase = "profile"
+                profile = self.load_profile()
                 
                 # Check if profile exists
                 if not profile:
@@ -213,6 +328,7 @@ class InstaFollowers:
                     return None
                 
                 # Get followers count
+                user_id = profile.userid
                 followers_count = profile.followers
                 self.console.print(f"[yellow]This account has {followers_count} followers. Collecting data...[/yellow]")
                 
@@ -221,42 +337,60 @@ class InstaFollowers:
                     self.console.print("[bold yellow]⚠️ This account has many followers. Instagram may rate-limit the requests.[/bold yellow]")
                     self.console.print("[bold yellow]⚠️ We'll try to handle this by using delays between requests.[/bold yellow]")
                 
-                # Prepare data structures
-                followers = []
-                count = 0
+                # Prepare data structures, rewinding to the last committed checkpoint
+                count = self.rewind_to_checkpoint(checkpoint, followers, writer)
                 
-                # Collect followers data with rate limiting awareness
-                with self.console.status("[bold green]Downloading followers list...") as status:
-                    # Get follower iterator
-                    follower_iterator = profile.get_followers()
-                    
-                    # Process followers with built-in delays to avoid rate limiting
-                    for follower in follower_iterator:
-                        followers.append({
-                            "username": follower.username,
-                            "full_name": follower.full_name,
-                            "profile_pic_url": follower.profile_pic_url,
-                            "is_private": follower.is_private,
-                            "is_verified": follower.is_verified
-                        })
+                # Collect followers data with rate limiting awareness; export() renders the progress
+                self.progress.total = followers_count
+                self.progress.update(count)
+                self.progress.phase = "followers"
+                
+                # Get follower iterator
+                follower_iterator = self.follower_iterator(profile, checkpoint)
+                
+                # The next pages are fetched in the background while this one is written;
+                # checkpoints are frozen there, in step with the follower they belong to
+                with Prefetcher(follower_iterator, self.prefetch,
+                                snapshot=lambda: follower_iterator.freeze()._asdict(),
+                                snapshot_every=CHECKPOINT_EVERY, start=count) as pipeline:
+                    for follower in pipeline:
+                        # Commit before handling this follower: a thawed iterator yields it again
+                        if pipeline.state is not None:
+                            self.commit_checkpoint(checkpoint, writer, count, frozen=pipeline.state)
                         
-                        count += 1
+                        if self.fields:
+                            record = node_to_record(follower, self.fields)
+                        else:
+                            record = {
+                                "id": follower.userid,
+                                "username": follower.username,
+                                "full_name": follower.full_name,
+                                "profile_pic_url": follower.profile_pic_url,
+                                "is_private": follower.is_private,
+                                "is_verified": follower.is_verified
+                            }
                         
-                        # Add small delays to avoid rate limiting
-                        if count % 10 == 0:
-                            time.sleep(0.5)  # 500ms delay every 10 followers
+                        if writer is not None:
+                            writer.write(record)
+                        else:
+                            followers.append(record)
                         
-                        if count % 50 == 0:
-                            self.console.print(f"[yellow]Retrieved {count} followers so far...[/yellow]")
-                            time.sleep(1.5)  # Longer delay every 50 followers
+                        count += 1
                         
-                        # For larger batches, take a break to avoid triggering rate limits
-                        if count % 200 == 0:
-                            self.console.print(f"[yellow]Taking a short break to avoid rate limits (retrieved {count} so far)...[/yellow]")
-                            time.sleep(5)  # 5 second pause every 200 followers
+                        # Requests are paced by the scheduler; the count is only rendered at a fixed rate
+                        self.progress.update(count)
                 
                 # Return collected data
-                self.console.print(f"[bold green]Successfully collected {len(followers)} followers![/bold green]")
+                self.console.print(f"[bold green]Successfully collected {count} followers![/bold green]")
+                checkpoint.clear()
+                if writer is not None:
+                    return {
+                        "timestamp": str(datetime.datetime.now()),
+                        "username": self.username,
+                        "followers_count": followers_count,
+                        "exported": count
+                    }
+                
                 return {
                     "timestamp": str(datetime.datetime.now()),
                     "username": self.username,
@@ -264,58 +398,48 @@ class InstaFollowers:
                     "followers": followers
                 }
                 
-            except instaloader.exceptions.ConnectionException as e:
-                error_message = str(e).lower()
+            except CircuitOpenError as e:
+                return self.partial_result(e, followers, writer, followers_count)
                 
-                # Check for rate limiting or unauthorized errors
-                if "401" in error_message or "unauthorized" in error_message or "wait" in error_message:
-                    # Extract user ID from error message if possible
-                    user_id = None
-                    if "graphql/query" in error_message and "variables=" in error_message:
-                        try:
-                            # Try to extract user ID from the error URL
-                            start_idx = error_message.find('"id":"')
-                            if start_idx > 0:
-                                start_idx += 6  # length of '"id":"'
-                                end_idx = error_message.find('"', start_idx)
-                                if end_idx > 0:
-                                    user_id = error_message[start_idx:end_idx]
-                                    self.console.print(f"[yellow]Extracted user ID from error: {user_id}[/yellow]")
-                        except:
-                            pass
+            except instaloader.exceptions.ConnectionException as e:
+                # The failing request has already been retried in place by self.retry
+                if classify(e) in (AUTH, THROTTLED):
+                    # If the profile lookup itself failed, the cache may still know the user ID
+                    if not user_id:
+                        user_id = self.profiles.user_id(self.username)
                     
                     # Try direct API request as a fallback if we have the user_id
                     if user_id:
                         self.console.print("[bold yellow]Standard API returned 401 Unauthorized[/bold yellow]")
                         self.console.print("[yellow]Trying direct API access as fallback...[/yellow]")
                         
-                        direct_data = self.try_direct_api_request(user_id=user_id)
+                        direct_data = self.try_direct_api_request(user_id=user_id, writer=writer, checkpoint=checkpoint,
+                                                                  followers=followers, followers_count=followers_count)
                         if direct_data:
-                            self.console.print("[bold green]Successfully retrieved data via direct API request![/bold green]")
+                            if direct_data.get("complete", True):
+                                self.console.print("[bold green]Successfully retrieved data via direct API request![/bold green]")
                             return direct_data
                     
                     # If GraphQL didn't work or we couldn't extract user_id, try standard retries
                     retry_count += 1
+                    metrics.inc("retries_total", reason="crawl")
                     
                     if retry_count <= max_retries:
-                        self.console.print(f"[bold yellow]Instagram is rate limiting requests. Waiting for {wait_time} seconds before retry {retry_count}/{max_retries}...[/bold yellow]")
+                        # Resumes from the last checkpoint; the session is only
+                        # refreshed by the retry policy, when it has really expired
+                        wait_time = self.scheduler.backoff_delay()
+                        self.console.print(f"[bold yellow]Instagram is rate limiting requests. Waiting for {wait_time:.0f} seconds before retry {retry_count}/{max_retries}...[/bold yellow]")
                         self.console.print(f"[yellow]Error details: {e}[/yellow]")
-                        time.sleep(wait_time)
-                        wait_time *= 2  # Exponential backoff
-                        
-                        # Try to refresh session
-                        self.console.print("[yellow]Attempting to refresh session...[/yellow]")
-                        try:
-                            # Re-login if needed
-                            self.login()
-                        except Exception as login_error:
-                            self.console.print(f"[yellow]Session refresh failed: {login_error}[/yellow]")
+                        self.progress.phase = "backoff"
+                        self.scheduler.sleep(wait_time, reason="backoff")
                     else:
-                        # Last attempt - try direct API request without user_id as fallback
+                        # Last attempt - try direct API request as fallback
                         self.console.print("[bold yellow]Maximum retries reached. Trying direct API access as fallback...[/bold yellow]")
-                        direct_data = self.try_direct_api_request()
+                        direct_data = self.try_direct_api_request(user_id=user_id, writer=writer, checkpoint=checkpoint,
+                                                                  followers=followers, followers_count=followers_count)
                         if direct_data:
-                            self.console.print("[bold green]Successfully retrieved data via direct API request![/bold green]")
+                            if direct_data.get("complete", True):
+                                self.console.print("[bold green]Successfully retrieved data via direct API request![/bold green]")
                             return direct_data
                             
                         # If that failed too, show helpful messages
@@ -324,12 +448,14 @@ class InstaFollowers:
                         self.console.print("[yellow]1. Try again later (wait at least 30 minutes)[/yellow]")
                         self.console.print("[yellow]2. Try accessing Instagram normally in your browser first[/yellow]")
                         self.console.print("[yellow]3. Ensure you have proper permissions to access this data[/yellow]")
-                        raise
+                        return self.partial_result(e, followers, writer, followers_count)
                 else:
                     # For other connection errors
                     self.console.print(f"[bold red]Connection error: {e}[/bold red]")
-                    raise
+                    return self.partial_result(e, followers, writer, followers_count)
                     
+            except LeaseLost:
+                raise
             except Exception as e:
                 self.console.print(f"[bold red]Error fetching followers: {str(e)}[/bold red]")
                 return None
@@ -338,81 +464,244 @@ class InstaFollowers:
         self.console.print("[bold red]All retry attempts failed. Could not retrieve followers.[/bold red]")
         return None
     
-    def try_direct_api_request(self, user_id=None, count=12):
+    def load_profile(self):
         """
-        Simplified direct request to Instagram API based on graphql_test.py
-        when the standard instaloader approach fails with 401 errors
+        The target's Profile, rebuilt from the profile cache while it is fresh
+        
+        Otherwise the profile is loaded and cached, so retries and later runs
+        within the TTL start paginating from the user ID straight away.
+        Private profiles are always loaded, in case they have been followed since.
         """
-        self.console.print("[bold blue]Attempting direct API access as fallback...[/bold blue]")
+        import instaloader
         
-        # If we have a user ID, use it; otherwise use a default URL
-        if user_id:
-            url = f"https://www.instagram.com/graphql/query?query_hash=37479f2b8209594dde7facb0d904896a&variables=%7B%22id%22%3A%22{user_id}%22%2C%22first%22%3A{count}%7D"
-        else:
-            # Use the URL directly from graphql_test.py as fallback
-            url = "https://www.instagram.com/graphql/query?query_hash=37479f2b8209594dde7facb0d904896a&variables=%7B%22id%22%3A%227093386149%22%2C%22first%22%3A12%7D"
-        
-        # Set up headers to mimic a browser - same as in graphql_test.py
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/115.0.0.0 Safari/537.36',
-            'Accept': 'application/json',
-            'Accept-Language': 'en-US,en;q=0.9',
-            'Referer': 'https://www.instagram.com/',
-            'X-IG-App-ID': '936619743392459',
-            'X-Requested-With': 'XMLHttpRequest',
+        profile = self.profiles.profile(self.insta.context, self.username)
+        if profile is not None and not profile.is_private:
+            self.console.print(f"[green]Using cached profile of {self.username} (ID {profile.userid})[/green]")
+            return profile
+        
+        try:
+            profile = instaloader.Profile.from_username(self.insta.context, self.username)
+        except instaloader.exceptions.ProfileNotExistsException:
+            self.profiles.invalidate(self.username)
+            raise
+        self.profiles.store(profile)
+        return profile
+    
+    def partial_result(self, reason, followers, writer, followers_count):
+        """What was collected before giving up, marked as incomplete"""
+        self.console.print(f"[bold yellow]Stopping with a partial export: {reason}[/bold yellow]")
+        followers_data = {
+            "timestamp": str(datetime.datetime.now()),
+            "username": self.username,
+            "followers_count": followers_count,
+            "complete": False,
+            "error": str(reason),
         }
+        if writer is not None:
+            followers_data["exported"] = writer.count
+        else:
+            followers_data["followers"] = followers
+        return followers_data
+    
+    def follower_iterator(self, profile, checkpoint=None):
+        """Follower NodeIterator, thawed from the checkpoint when one is available"""
+        from instaloader.exceptions import InvalidArgumentException
+        from instaloader.nodeiterator import FrozenNodeIterator
+        
+        if checkpoint is None or not checkpoint.is_resumable:
+            return self.followers_of(profile)
         
-        self.console.print(f"[yellow]URL: {url}[/yellow]")
+        # Checkpoints committed by the direct API route only carry the cursor
+        if checkpoint.frozen is None:
+            return self.followers_of(
+                profile,
+                first_data={'edges': [], 'page_info': {'has_next_page': checkpoint.has_next_page,
+                                                       'end_cursor': checkpoint.end_cursor}},
+            )
         
         try:
-            # First try to get browser cookies (like in graphql_test.py)
-            import browser_cookie3
-            self.console.print("[yellow]Getting cookies from Chrome browser...[/yellow]")
-            cookies = browser_cookie3.chrome(domain_name='.instagram.com')
+            frozen = FrozenNodeIterator(**checkpoint.frozen)
+            if frozen.query_variables.get("id") != str(profile.userid):
+                raise InvalidArgumentException("Checkpoint belongs to a different profile.")
             
-            # Make the request with cookies
-            response = requests.get(url, headers=headers, cookies=cookies)
-            
-            if response.status_code == 200:
-                data = response.json()
-                
-                # Save the raw data for inspection
-                output_file = f"{self.username}_direct_api.json"
-                with open(output_file, 'w', encoding='utf-8') as f:
-                    json.dump(data, f, indent=4, ensure_ascii=False)
-                
-                self.console.print(f"[bold green]✅ Successfully fetched data and saved to {output_file}[/bold green]")
-                
-                # Process and extract followers
-                if 'data' in data and 'user' in data['data']:
-                    user_data = data['data']['user']
-                    
-                    # Extract basic information
-                    followers_data = {
-                        "timestamp": str(datetime.datetime.now()),
-                        "username": self.username,
-                        "source": "direct_api_request"
-                    }
-                    
-                    # Add any available follower count
-                    if 'edge_followed_by' in user_data:
-                        followers_data["followers_count"] = user_data['edge_followed_by']['count']
-                    
-                    return followers_data
-                else:
-                    self.console.print("[yellow]Data saved but couldn't extract follower information[/yellow]")
-                    return None
-            else:
-                self.console.print(f"[bold red]Request failed: {response.status_code} - {response.reason}[/bold red]")
-                self.console.print(f"[yellow]Response: {response.text[:200]}...[/yellow]")
+            # Seed the iterator with the saved page so resuming costs no extra request
+            iterator = self.followers_of(profile, frozen.query_hash, frozen.query_variables,
+                                         frozen.query_referer, first_data=frozen.remaining_data)
+            iterator.thaw(frozen)
+            return iterator
+        except (TypeError, InvalidArgumentException) as e:
+            self.console.print(f"[yellow]Could not resume from checkpoint: {e}[/yellow]")
+            self.console.print("[yellow]Starting from the first page instead...[/yellow]")
+            checkpoint.reset()
+            return self.followers_of(profile)
+    
+    def followers_of(self, profile, query_hash=FOLLOWERS_QUERY_HASH, variables=None, referer=None,
+                     first_data=None):
+        """
+        Follower NodeIterator built straight from the user id
+        
+        Unlike Profile.get_followers() this doesn't reload the profile's
+        metadata first, so a profile from the cache costs no request at all.
+        With --fields the raw nodes are yielded as they are, skipping the
+        Profile built (and HD picture looked up) for every follower.
+        """
+        import instaloader
+        from instaloader.nodeiterator import NodeIterator
+        
+        return NodeIterator(
+            self.insta.context,
+            query_hash,
+            lambda d: d['data']['user']['edge_followed_by'],
+            (lambda n: n) if self.fields else (lambda n: instaloader.Profile(self.insta.context, n)),
+            variables if variables is not None else {'id': str(profile.userid)},
+            referer or f'https://www.instagram.com/{profile.username}/',
+            first_data=first_data,
+        )
+    
+    def rewind_to_checkpoint(self, checkpoint, followers, writer):
+        """Drop anything collected after the last committed checkpoint, returning the record count"""
+        if checkpoint.is_resumable:
+            count = checkpoint.records_written
+            del followers[count:]
+            if writer is not None:
+                writer.truncate(checkpoint.output_offset, count)
+            self.console.print(f"[yellow]Resuming from checkpoint after {count} followers...[/yellow]")
+            return count
+        
+        checkpoint.reset()
+        del followers[:]
+        if writer is not None:
+            writer.truncate()
+        return 0
+    
+    def commit_checkpoint(self, checkpoint, writer, count, frozen=None, end_cursor=None, has_next_page=True):
+        """
+        Commit the pagination position once every record before it is on disk
+
+        on_checkpoint sees the new position before it is saved locally, so a
+        worker that has lost its job (LeaseLost) never overwrites the
+        checkpoint the job's new owner resumes from.
+        """
+        if writer is not None:
+            checkpoint.commit(end_cursor=end_cursor, records_written=count, output=writer.filename,
+                              output_offset=writer.tell(), frozen=frozen, has_next_page=has_next_page, save=False)
+        else:
+            checkpoint.commit(end_cursor=end_cursor, records_written=count, frozen=frozen,
+                              has_next_page=has_next_page, save=False)
+        if self.on_checkpoint is not None:
+            self.on_checkpoint(checkpoint)
+        checkpoint.save()
+    
+    def try_direct_api_request(self, user_id=None, writer=None, checkpoint=None, followers=None, followers_count=None):
+        """
+        Page through the followers GraphQL edge directly (as in graphql_test.py)
+        when the standard instaloader approach fails with 401 errors
+        
+        Records go through the same writer/list and checkpoint as the
+        instaloader route, so the fallback continues from wherever that route
+        stopped and produces a complete export.
+        """
+        self.console.print("[bold blue]Attempting direct API access as fallback...[/bold blue]")
+        
+        if not user_id:
+            self.console.print("[bold red]No user ID available for direct API access[/bold red]")
+            return None
+        
+        if checkpoint is None:
+            checkpoint = Checkpoint(self.username, "followers", directory=None)
+        if followers is None:
+            followers = []
+        
+        # The shared session already carries instaloader's cookies once logged in
+        session = transport.get_session()
+        cookies = None
+        if not session.cookies.get("sessionid") and self.auth.load():
+            cookies = self.auth.cookies
+        elif not session.cookies.get("sessionid"):
+            try:
+                # Otherwise fall back to browser cookies (like in graphql_test.py)
+                import browser_cookie3
+                self.console.print("[yellow]Getting cookies from Chrome browser...[/yellow]")
+                cookies = browser_cookie3.chrome(domain_name='.instagram.com')
+            except ImportError:
+                self.console.print("[yellow]browser_cookie3 not available - install with: pip install browser-cookie3[/yellow]")
                 return None
-                
-        except ImportError:
-            self.console.print("[yellow]browser_cookie3 not available - install with: pip install browser-cookie3[/yellow]")
+            except Exception as e:
+                self.console.print(f"[bold red]Error in direct API request: {e}[/bold red]")
+                return None
+        
+        count = self.rewind_to_checkpoint(checkpoint, followers, writer)
+        
+        def store(node):
+            nonlocal count
+            record = node_to_record(node, self.fields or RECORD_FIELDS)
+            if writer is not None:
+                writer.write(record)
+            else:
+                followers.append(record)
+            count += 1
+            self.progress.update(count)
+        
+        def commit(paginator):
+            self.commit_checkpoint(checkpoint, writer, count, end_cursor=paginator.end_cursor,
+                                   has_next_page=paginator.has_next_page)
+        
+        paginator = GraphQLPaginator(
+            session,
+            FOLLOWERS_QUERY_HASH,
+            {"id": str(user_id)},
+            edge="edge_followed_by",
+            after=checkpoint.end_cursor,
+            page_size=50,
+            scheduler=self.scheduler,
+            on_page=commit,
+            cookies=cookies,
+            retry=self.retry,
+            archive=self.archive,
+        )
+        paginator.has_next_page = checkpoint.has_next_page
+        
+        self.progress.total = self.progress.total or followers_count
+        self.progress.update(count)
+        self.progress.phase = "direct"
+        try:
+            # Finish the page the instaloader route was in the middle of
+            if checkpoint.frozen is not None:
+                for edge in (checkpoint.frozen.get("remaining_data") or {}).get("edges", []):
+                    store(edge["node"])
+                commit(paginator)
+            
+            for node in paginator:
+                store(node)
+        except CircuitOpenError as e:
+            return self.partial_result(e, followers, writer, followers_count)
+        except GraphQLError as e:
+            self.console.print(f"[bold red]Request failed: {e}[/bold red]")
+            if e.status_code == 404:
+                # The cached user ID no longer exists
+                self.profiles.invalidate(self.username)
             return None
+        except LeaseLost:
+            # Another worker owns the job now; falling back to another route would crawl without a lease
+            raise
         except Exception as e:
             self.console.print(f"[bold red]Error in direct API request: {e}[/bold red]")
             return None
+        
+        checkpoint.clear()
+        self.console.print(f"[bold green]✅ Collected {count} followers in {paginator.pages} direct API requests[/bold green]")
+        
+        followers_data = {
+            "timestamp": str(datetime.datetime.now()),
+            "username": self.username,
+            "followers_count": paginator.count if paginator.count is not None else followers_count,
+            "source": "direct_api_request"
+        }
+        if writer is not None:
+            followers_data["exported"] = count
+        else:
+            followers_data["followers"] = followers
+        return followers_data
             
     def save_to_json(self, data, filename=None):
         """Save followers data to JSON file"""
@@ -421,20 +710,18 @@ class InstaFollowers:
             return False
         
         if filename is None:
-            filename = f"{self.username}_followers.json"
+            filename = output.with_extension(f"{self.username}_followers.json", self.compression)
             
         try:
-            with open(filename, "w", encoding="utf-8") as f:
-                json.dump(data, f, indent=4, ensure_ascii=False)
+            output.write_json(filename, data, self.compact, self.compression)
             self.console.print(f"[bold green]Data saved to {filename}![/bold green]")
             return True
         except Exception as e:
             self.console.print(f"[bold red]Error saving data: {str(e)}[/bold red]")
             return False
     
-    def run(self, force_login=False):
-        """Main execution flow with improved error handling"""
-        # Show anti-rate limiting tips
+    def print_tips(self):
+        """Anti-rate limiting tips shown before an interactive run"""
         self.console.print("\n[bold blue]===== Instagram API Rate Limiting Tips =====[/bold blue]")
         self.console.print("[yellow]1. Instagram strictly limits automated access to their API[/yellow]")
         self.console.print("[yellow]2. For accounts with many followers, data may be incomplete[/yellow]")
@@ -442,6 +729,12 @@ class InstaFollowers:
         self.console.print("[yellow]4. Using a VPN might help if your IP is being rate-limited[/yellow]")
         self.console.print("[yellow]5. Always respect Instagram's terms of service and rate limits[/yellow]")
         self.console.print("[bold blue]===========================================[/bold blue]\n")
+    
+    def run(self, force_login=False, output_format="json", output=None, resume=False):
+        """Main execution flow with improved error handling"""
+        # Show anti-rate limiting tips, unless the output is for cron or another program
+        if progress.interactive():
+            self.print_tips()
         
         # Attempt login
         if not self.login(force_new=force_login):
@@ -453,15 +746,41 @@ class InstaFollowers:
             self.console.print("[yellow]4. Try again after ensuring you can access Instagram.com normally[/yellow]")
             return False
         
+        self.console.print("[yellow]Starting data collection (this might take a while for larger accounts)...[/yellow]")
+        return self.export(output_format=output_format, output=output, resume=resume)
+    
+    def export(self, output_format="json", output=None, resume=False):
+        """Collect and save followers over an already logged-in session, rendering progress at a fixed rate"""
+        self.progress = Progress(self.console, self.username, spinner=self.show_status).start()
+        success = False
         try:
+            success = self._export(output_format, output, resume)
+        finally:
+            self.progress.close(success=bool(success), records=self.records)
+        return success
+    
+    def _export(self, output_format, output, resume):
+        try:
+            if output_format == "ndjson":
+                return self.stream_followers(output, resume=resume)
+            
             # Get followers data with built-in retry mechanism
-            self.console.print("[yellow]Starting data collection (this might take a while for larger accounts)...[/yellow]")
-            followers_data = self.get_followers(max_retries=3)
+            followers_data = self.get_followers(max_retries=self.retry.attempts)
             
             # Save to JSON
             if followers_data:
-                saved = self.save_to_json(followers_data)
+                self.records = len(followers_data["followers"])
+                metrics.inc("records_total", self.records, source="main.py")
+                saved = self.save_to_json(followers_data, output)
+                if saved and followers_data.get("complete") is False:
+                    # A partial list would show up as lost followers in the snapshots and history
+                    self.console.print(f"[bold yellow]Saved a partial export of {self.records} followers; "
+                                       f"snapshot and history not updated[/bold yellow]")
+                    return False
                 if saved:
+                    self.progress.phase = "saving"
+                    self.track_snapshot(followers_data["followers"])
+                    self.save_history(followers_data["followers"])
                     self.console.print("\n[bold green]✅ Data collection completed successfully![/bold green]")
                     return True
             
@@ -471,9 +790,213 @@ class InstaFollowers:
         except KeyboardInterrupt:
             self.console.print("\n[yellow]Data collection interrupted by user.[/yellow]")
             return False
+        except LeaseLost:
+            raise
         except Exception as e:
             self.console.print(f"[bold red]Error during data collection: {str(e)}[/bold red]")
             return False
+    
+    def stream_followers(self, filename=None, resume=False):
+        """Stream followers to an NDJSON file, one record per line"""
+        if filename is None:
+            filename = f"{self.username}_followers.ndjson"
+        
+        # Pick up a previous crawl of the same target if asked to
+        checkpoint = Checkpoint(self.username, "followers")
+        resume_offset = None
+        if resume and checkpoint.load():
+            if checkpoint.is_resumable and checkpoint.output == filename and os.path.exists(part_path(filename)):
+                resume_offset = checkpoint.output_offset
+                self.console.print(f"[green]Found checkpoint from {checkpoint.updated} ({checkpoint.records_written} followers written)[/green]")
+            else:
+                self.console.print("[yellow]Checkpoint is stale or for another output file, starting over...[/yellow]")
+                checkpoint.reset()
+        elif resume:
+            self.console.print("[yellow]No checkpoint found, starting from the beginning...[/yellow]")
+        
+        writer = NDJSONWriter(filename, resume_offset=resume_offset, resume_count=checkpoint.records_written,
+                              resumable=True)
+        try:
+            followers_data = self.get_followers(max_retries=self.retry.attempts, writer=writer, checkpoint=checkpoint)
+        except BaseException:
+            writer.abort()
+            if checkpoint.is_resumable:
+                self.console.print(f"[yellow]Progress saved. Run again with --resume to continue from {checkpoint.records_written} followers.[/yellow]")
+            raise
+        
+        if not followers_data or followers_data.get("complete") is False:
+            writer.abort()
+            self.console.print(f"[bold red]Export incomplete - partial data left in {writer.path}[/bold red]")
+            if checkpoint.is_resumable:
+                self.console.print("[yellow]Run again with --resume to continue from the last checkpoint.[/yellow]")
+            return False
+        
+        writer.close(username=self.username, followers_count=followers_data.get("followers_count"))
+        self.records = writer.count
+        metrics.inc("records_total", self.records, source="main.py")
+        self.console.print(f"[bold green]Streamed {writer.count} followers to {filename}![/bold green]")
+        self.progress.phase = "saving"
+        self.track_snapshot(read_ndjson(filename))
+        self.save_history(read_ndjson(filename))
+        self.console.print("\n[bold green]✅ Data collection completed successfully![/bold green]")
+        return True
+    
+    def save_history(self, records):
+        """Store this export in the SQLite history database"""
+        if self.history is None:
+            return None
+        
+        try:
+            snapshot_id = self.history.record_snapshot(self.username, records, source="main.py")
+        except Exception as e:
+            self.console.print(f"[bold red]Could not save to history database: {e}[/bold red]")
+            return None
+        
+        self.console.print(f"[green]Saved to history database {self.history.path} (snapshot {snapshot_id})[/green]")
+        return snapshot_id
+    
+    def track_snapshot(self, records):
+        """Add this export to the snapshot history and report who followed and unfollowed"""
+        if self.snapshots is None:
+            return None
+        
+        try:
+            entry = self.snapshots.record(records)
+        except Exception as e:
+            self.console.print(f"[bold red]Could not save snapshot: {e}[/bold red]")
+            return None
+        
+        if entry["delta"] is None:
+            self.console.print(f"[green]Saved first snapshot of {entry['count']} followers; "
+                               "changes will be reported from the next run[/green]")
+        else:
+            self.console.print(f"[bold blue]Since the last snapshot: {entry['added']} new, {entry['lost']} lost, "
+                               f"{entry['unchanged']} unchanged[/bold blue]")
+            print_changes(self.console, entry["added_records"], entry["lost_records"])
+        return entry
+
+
+def print_changes(console, added, lost, limit=20):
+    """List new and lost followers, at most `limit` of each"""
+    for label, records, colour in (("New", added, "green"), ("Lost", lost, "red")):
+        for record in records[:limit]:
+            console.print(f"[{colour}]{label}: {record.get('username') or record['id']} ({record.get('full_name') or ''})[/{colour}]")
+        if len(records) > limit:
+            console.print(f"[{colour}]... and {len(records) - limit} more {label.lower()}[/{colour}]")
+
+
+def print_scheduler_stats(console, scheduler):
+    stats = scheduler.summary()
+    console.print(f"[yellow]Request scheduler: {stats['requests']} requests, achieved {stats['achieved_rate']:.3f} req/s "
+                  f"(target {stats['target_rate']:.3f}, now {stats['current_rate']:.3f}), "
+                  f"{stats['throttles']} throttled, {stats['slept_seconds']}s waiting[/yellow]")
+    console.print(f"[yellow]Metrics: {metrics.registry.summary_line()}[/yellow]")
+
+
+def snapshot_options(args):
+    """SnapshotStore arguments from the command line, or None if history is not tracked"""
+    if not args.snapshot:
+        return None
+    return {"full_every": args.full_every, "keep_urls": args.snapshot_urls}
+
+
+def show_changes(console, username, hours):
+    """Report follower changes from the snapshot history"""
+    store = SnapshotStore(username)
+    if not store.snapshots:
+        console.print(f"[bold red]No snapshots of {username} yet. Export with --snapshot first.[/bold red]")
+        return False
+    
+    since = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=hours)
+    added, lost = store.changes_since(since)
+    console.print(f"[bold blue]{username} in the last {hours:g} hours: {len(added)} new, {len(lost)} lost "
+                  f"({store.snapshots[-1]['count']} followers at {store.snapshots[-1]['timestamp']})[/bold blue]")
+    print_changes(console, added, lost)
+    return True
+
+
+def show_history(console, history, username):
+    """Print the follower count of every stored export of an account"""
+    rows = history.history(username)
+    if not rows:
+        console.print(f"[bold red]No exports of {username} in {history.path} yet.[/bold red]")
+        return False
+    
+    previous = None
+    for row in rows:
+        change = "" if previous is None else f" ({row['count'] - previous:+d})"
+        console.print(f"[yellow]{row['taken_at']}  {row['count']} followers{change}[/yellow]")
+        previous = row["count"]
+    
+    lost = history.lost(username)
+    if lost:
+        console.print(f"[red]{len(lost)} followers seen before are missing from the latest export[/red]")
+    return True
+
+
+def run_batch(targets, args, scheduler, console, history=None):
+    """Log in once, then export every target over the shared session and request budget"""
+    primary = InstaFollowers(targets[0], scheduler=scheduler, max_retries=args.max_retries)
+    primary.console = console
+    primary.history = history
+    primary.compact = args.compact
+    primary.compression = args.compress
+    primary.fields = args.fields
+    primary.archive = PageArchive(args.archive) if args.archive else None
+    primary.prefetch = args.prefetch
+    if not primary.login(force_new=args.force_login):
+        console.print("[bold red]Login failed. Cannot continue.[/bold red]")
+        return False
+    
+    batch = BatchExporter(primary, workers=args.workers, output_format=args.format,
+                          output_dir=args.output_dir, resume=args.resume,
+                          snapshot_options=snapshot_options(args))
+    try:
+        batch.run(targets)
+    finally:
+        if batch.results:
+            batch.print_summary()
+            batch.save_summary()
+        print_scheduler_stats(console, scheduler)
+    return all(result["success"] for result in batch.results)
+
+
+def enqueue(console, path, targets):
+    """Add a followers job for every target not already pending or running in the queue"""
+    queue = JobQueue(path)
+    added = sum(queue.add(username) for username in targets)
+    console.print(f"[green]Queued {added} of {len(targets)} accounts in {path} "
+                  f"({len(targets) - added} already pending or running)[/green]")
+    console.print(f"[bold]Queue: {queue.stats()}[/bold]")
+
+
+def run_worker(args, scheduler, console, history=None):
+    """Log in once, then export jobs claimed from the queue until it is empty or interrupted"""
+    queue = JobQueue(args.queue)
+    primary = InstaFollowers(None, scheduler=scheduler, max_retries=args.max_retries)
+    primary.console = console
+    primary.history = history
+    primary.fields = args.fields
+    primary.archive = PageArchive(args.archive) if args.archive else None
+    primary.prefetch = args.prefetch
+    if not primary.login(force_new=args.force_login):
+        console.print("[bold red]Login failed. Cannot continue.[/bold red]")
+        return False
+    
+    batch = BatchExporter(primary, output_format="ndjson", output_dir=args.output_dir,
+                          snapshot_options=snapshot_options(args))
+    worker = QueueWorker(queue, batch, lease=args.lease, max_attempts=args.max_attempts,
+                         until_empty=args.until_empty)
+    try:
+        worker.run(args.workers)
+    except KeyboardInterrupt:
+        # Claimed jobs keep their checkpoints and are picked up again once their leases expire
+        console.print("\n[yellow]Worker stopped.[/yellow]")
+    finally:
+        console.print(f"[bold]{sum(r['success'] for r in worker.results)}/{len(worker.results)} jobs exported; "
+                      f"queue: {queue.stats()}[/bold]")
+        print_scheduler_stats(console, scheduler)
+    return all(result["success"] for result in worker.results)
 
 
 def main():
@@ -482,36 +1005,217 @@ def main():
         prog="Instagram Followers Exporter",
         description="Export Instagram followers list to JSON",
     )
-    parser.add_argument("-u", "--username", help="Instagram username to fetch followers from", required=True)
+    targets = parser.add_mutually_exclusive_group(required=True)
+    targets.add_argument("-u", "--username", help="Instagram username to fetch followers from")
+    targets.add_argument("--batch", metavar="FILE",
+                         help="Export every username listed in FILE (one per line, - for stdin)")
+    targets.add_argument("--enqueue", metavar="FILE",
+                         help="Add every username listed in FILE to the --queue job queue, without crawling")
+    targets.add_argument("--work", action="store_true",
+                         help="Export jobs claimed from the --queue job queue (always as NDJSON in --output-dir)")
     parser.add_argument("-o", "--output", help="Output JSON filename (default: USERNAME_followers.json)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="Number of accounts exported concurrently in --batch and --work mode")
+    parser.add_argument("--output-dir", help="Directory for per-account files in --batch and --work mode "
+                                             "(default: current directory)")
+    parser.add_argument("--queue", default=DEFAULT_QUEUE, metavar="PATH",
+                        help=f"SQLite job queue shared by --enqueue and --work processes (default: {DEFAULT_QUEUE})")
+    parser.add_argument("--lease", type=float, default=DEFAULT_LEASE, metavar="SECONDS",
+                        help=f"Seconds a claimed job stays reserved without a heartbeat before another worker "
+                             f"may take it over (default: {DEFAULT_LEASE})")
+    parser.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS,
+                        help=f"Times a job is claimed before it is marked failed (default: {DEFAULT_MAX_ATTEMPTS})")
+    parser.add_argument("--until-empty", action="store_true",
+                        help="Stop --work once no job is left to claim instead of waiting for new ones")
     parser.add_argument("--force-login", action="store_true", help="Force a new login session, ignoring cached credentials")
-    parser.add_argument("--max-retries", type=int, default=3, help="Maximum number of retries for rate-limited requests")
+    parser.add_argument("--auth-ttl", type=int, default=auth_cache.DEFAULT_TTL,
+                        help="Seconds a verified login is trusted before it is re-verified")
+    parser.add_argument("--profile-ttl", type=int, default=profile_cache.DEFAULT_TTL,
+                        help="Seconds a cached user ID and profile are used before the profile is loaded again "
+                             "(0 always loads it)")
+    parser.add_argument("--max-retries", type=int, default=3,
+                        help="Maximum number of retries of a failing request (and of resuming the crawl after them)")
+    parser.add_argument("-f", "--format", choices=["json", "ndjson"], default="json",
+                        help="Output format; ndjson streams one follower per line as it is fetched")
+    parser.add_argument("--compact", action="store_true",
+                        help="Write JSON without indentation (faster and smaller; uses orjson if installed)")
+    parser.add_argument("--compress", choices=output.COMPRESSIONS,
+                        help="Compress the JSON output as it is written (zstd needs the zstandard package)")
+    parser.add_argument("--fields", metavar="FIELDS",
+                        help=f"Comma-separated follower fields to export, read straight from the follower list "
+                             f"(from: {','.join(RECORD_FIELDS)}; default: all, with HD profile pictures)")
+    parser.add_argument("--archive", metavar="DIR",
+                        help="Also keep the raw pages fetched by the direct API route in the page archive in DIR "
+                             "(see export.py replay)")
+    parser.add_argument("--prefetch", type=int, default=DEFAULT_DEPTH, metavar="PAGES",
+                        help=f"Follower pages fetched in the background while the current one is written "
+                             f"(default: {DEFAULT_DEPTH}; 0 fetches one page at a time)")
+    parser.add_argument("--rate", type=float, default=DOCUMENTED_RATE,
+                        help=f"Target request rate in requests/second (default: {DOCUMENTED_RATE:.3f}, Instagram's documented limit)")
+    parser.add_argument("--burst", type=int, default=6, help="Maximum number of requests sent back-to-back")
+    parser.add_argument("--pool-size", type=int, default=transport.DEFAULT_POOL_SIZE,
+                        help="Number of keep-alive connections kept in the shared HTTP pool")
+    parser.add_argument("--timeout", type=float, default=transport.DEFAULT_TIMEOUT[1],
+                        help="Read timeout in seconds for direct requests")
+    parser.add_argument("--resume", action="store_true",
+                        help="Resume an interrupted ndjson export from its last saved checkpoint")
+    parser.add_argument("--snapshot", action="store_true",
+                        help="Keep a follower history and report new and lost followers since the last run")
+    parser.add_argument("--full-every", type=int, default=FULL_EVERY,
+                        help="Keep a full copy of every Nth snapshot and only deltas in between")
+    parser.add_argument("--snapshot-urls", action="store_true",
+                        help="Also keep the latest profile picture URL of every user in the snapshot history")
+    parser.add_argument("--watch", type=float, nargs="?", const=DEFAULT_INTERVAL, metavar="SECONDS",
+                        help=f"Keep running and poll the account's counts every SECONDS (default: {DEFAULT_INTERVAL}), "
+                             "exporting the followers again only when their count changes")
+    parser.add_argument("--watch-threshold", type=int, default=DEFAULT_THRESHOLD, metavar="N",
+                        help=f"Change in the follower count that triggers a new export in --watch mode "
+                             f"(default: {DEFAULT_THRESHOLD})")
+    parser.add_argument("--watch-log", metavar="FILE",
+                        help="Where --watch appends one JSON line per poll (default: USERNAME_watch.ndjson)")
+    parser.add_argument("--changes-since", type=float, metavar="HOURS",
+                        help="Show followers gained and lost in the last HOURS from the snapshot history, without crawling")
+    parser.add_argument("--db", nargs="?", const=DEFAULT_DB, metavar="PATH",
+                        help=f"Also store every export in an SQLite history database (default: {DEFAULT_DB})")
+    parser.add_argument("--history", action="store_true",
+                        help="Show the follower count history of -u/--username from --db, without crawling")
+    parser.add_argument("--metrics", metavar="FILE",
+                        help="Write request, retry, sleep and serialization metrics to FILE at exit "
+                             "(JSON, or Prometheus text if FILE ends in .prom)")
+    parser.add_argument("--metrics-port", type=int, metavar="PORT",
+                        help="Serve metrics in Prometheus text format on http://127.0.0.1:PORT/metrics while running")
+    parser.add_argument("--quiet", action="store_true",
+                        help="Only print errors: no banners, spinner or progress (for cron)")
+    parser.add_argument("--log-format", choices=LOG_FORMATS, default="rich",
+                        help="rich for the terminal, or json for one JSON event per line on stdout "
+                             "(logs, progress and results; rich is not loaded)")
+    parser.add_argument("--progress-interval", type=float, metavar="SECONDS",
+                        help=f"Seconds between progress updates (default: {progress.SPINNER_INTERVAL:g} for the "
+                             f"spinner, {progress.LINE_INTERVAL:g} for batch lines, {progress.EVENT_INTERVAL:g} "
+                             f"for JSON events)")
     parser.add_argument("--version", action="version", version="%(prog)s 1.0.0")
     
     args = parser.parse_args()
     
-    # Initialize and run
-    console = Console()
-    console.print("[bold blue]Instagram Followers Exporter v1.0.0[/bold blue]")
-    console.print("[yellow]This tool exports Instagram followers data to JSON format[/yellow]")
-    
-    # Show warning about Instagram's policies
-    console.print("\n[bold red]⚠️ DISCLAIMER ⚠️[/bold red]")
-    console.print("[yellow]Instagram's Terms of Service restrict automated data collection.[/yellow]")
-    console.print("[yellow]Use this tool responsibly and respect Instagram's policies.[/yellow]")
-    console.print("[yellow]This tool is for educational purposes only.[/yellow]\n")
+    if args.resume and args.format != "ndjson":
+        parser.error("--resume requires --format ndjson")
+    if args.compress and args.format == "ndjson":
+        parser.error("--compress cannot be used with --format ndjson, whose checkpoints need an uncompressed file")
+    try:
+        output.check_available(args.compress)
+    except RuntimeError as e:
+        parser.error(str(e))
+    if args.rate <= 0 or args.rate > DOCUMENTED_RATE:
+        parser.error(f"--rate must be between 0 and {DOCUMENTED_RATE:.3f} requests/second")
+    if (args.batch or args.work) and args.output:
+        parser.error("--output cannot be used with --batch or --work; use --output-dir")
+    if args.work and args.compress:
+        parser.error("--compress cannot be used with --work, whose jobs are resumed from NDJSON checkpoints")
+    if args.lease <= 0:
+        parser.error("--lease must be positive")
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.prefetch < 0:
+        parser.error("--prefetch cannot be negative")
+    if args.progress_interval is not None and args.progress_interval <= 0:
+        parser.error("--progress-interval must be positive")
+    if args.watch is not None and not args.username:
+        parser.error("--watch requires -u/--username")
+    if args.watch is not None and args.watch <= 0:
+        parser.error("--watch interval must be positive")
     
-    exporter = InstaFollowers(args.username)
-    success = exporter.run(force_login=args.force_login)
+    if args.changes_since is not None and not args.username:
+        parser.error("--changes-since requires -u/--username")
+    if args.history and not (args.username and args.db):
+        parser.error("--history requires -u/--username and --db")
+    if args.fields is not None:
+        try:
+            args.fields = parse_fields(args.fields)
+        except ValueError as e:
+            parser.error(f"--fields: {e}")
+    if args.fields and "id" not in args.fields and (args.snapshot or args.db):
+        parser.error("--fields must include id when --snapshot or --db is used")
     
-    # Save to specified output file if provided
-    if success and args.output:
+    batch_targets = None
+    if args.batch:
         try:
-            with open(f"{args.username}_followers.json", 'r') as f:
-                followers_data = json.load(f)
-            exporter.save_to_json(followers_data, args.output)
-        except Exception as e:
-            console.print(f"[bold red]Error saving to custom output file: {e}[/bold red]")
+            batch_targets = read_targets(args.batch)
+        except OSError as e:
+            parser.error(f"cannot read --batch file: {e}")
+        if not batch_targets:
+            parser.error("--batch file contains no usernames")
+    if args.enqueue:
+        try:
+            batch_targets = read_targets(args.enqueue)
+        except OSError as e:
+            parser.error(f"cannot read --enqueue file: {e}")
+    
+    transport.configure(pool_size=args.pool_size, timeout=(transport.DEFAULT_TIMEOUT[0], args.timeout))
+    auth_cache.shared(ttl=args.auth_ttl)
+    profile_cache.shared(ttl=args.profile_ttl)
+    metrics.setup(args.metrics, args.metrics_port)
+    
+    # Initialize and run; every exporter picks up the same console format
+    progress.configure(args.log_format, args.quiet, args.progress_interval)
+    console = progress.make_console()
+    
+    if args.enqueue:
+        enqueue(console, args.queue, batch_targets)
+        return
+    
+    if args.changes_since is not None:
+        show_changes(console, args.username, args.changes_since)
+        return
+    
+    history = None
+    if args.db:
+        history = HistoryDB(args.db)
+    
+    if args.history:
+        show_history(console, history, args.username)
+        return
+    
+    scheduler = AdaptiveScheduler(rate=args.rate, burst=args.burst)
+    if progress.interactive():
+        console.print("[bold blue]Instagram Followers Exporter v1.0.0[/bold blue]")
+        console.print("[yellow]This tool exports Instagram followers data to JSON format[/yellow]")
+        
+        # Show warning about Instagram's policies
+        console.print("\n[bold red]⚠️ DISCLAIMER ⚠️[/bold red]")
+        console.print("[yellow]Instagram's Terms of Service restrict automated data collection.[/yellow]")
+        console.print("[yellow]Use this tool responsibly and respect Instagram's policies.[/yellow]")
+        console.print("[yellow]This tool is for educational purposes only.[/yellow]\n")
+        console.print(f"[yellow]Request scheduler: target {scheduler.target_rate:.3f} req/s, burst {scheduler.burst:.0f}[/yellow]")
+    
+    if batch_targets:
+        run_batch(batch_targets, args, scheduler, console, history)
+        return
+    if args.work:
+        run_worker(args, scheduler, console, history)
+        return
+    
+    exporter = InstaFollowers(args.username, scheduler=scheduler, max_retries=args.max_retries)
+    exporter.history = history
+    exporter.compact = args.compact
+    exporter.compression = args.compress
+    exporter.fields = args.fields
+    exporter.archive = PageArchive(args.archive) if args.archive else None
+    exporter.prefetch = args.prefetch
+    if args.snapshot:
+        exporter.snapshots = SnapshotStore(args.username, **snapshot_options(args))
+    try:
+        if args.watch is not None:
+            # One warm session for every poll and crawl
+            if exporter.login(force_new=args.force_login):
+                Watcher(exporter, args.watch, args.watch_threshold, args.watch_log, args.format, args.output).run()
+            else:
+                console.print("[bold red]Login failed. Cannot watch.[/bold red]")
+            return
+        
+        # Output is written once, straight to its final destination
+        exporter.run(force_login=args.force_login, output_format=args.format, output=args.output, resume=args.resume)
+    finally:
+        print_scheduler_stats(console, scheduler)
 
 
 if __name__ == "__main__":
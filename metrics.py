@@ -0,0 +1,241 @@
+"""
+Counters and histograms for the export hot paths
+"""
+
+import atexit, bisect, datetime, json, os, threading, time
+
+# Upper bounds of the histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BYTES_BUCKETS = (1_000, 10_000, 50_000, 100_000, 500_000, 1_000_000, 5_000_000)
+RECORDS_BUCKETS = (1, 10, 12, 25, 50, 100, 200)
+
+PREFIX = "insta_"
+
+# Metric name -> (help text, histogram buckets or None for a counter); modules with metrics of their
+# own add them with register(), and anything else is registered without help text when first updated
+METRICS = {
+    "requests_total": ("HTTP requests sent, by status code", None),
+    "request_seconds": ("Request latency including the response body", LATENCY_BUCKETS),
+    "response_bytes": ("Response body size", BYTES_BUCKETS),
+    "records_per_page": ("Nodes in each GraphQL page", RECORDS_BUCKETS),
+    "records_total": ("Records exported", None),
+    "retries_total": ("Retried requests or crawls, by reason", None),
+    "sleep_seconds_total": ("Seconds spent waiting, by reason", None),
+    "logins_total": ("Login attempts, by result", None),
+    "login_seconds": ("Time spent logging in", LATENCY_BUCKETS),
+    "serialize_seconds_total": ("Seconds spent encoding and writing output", None),
+}
+
+
+def register(name, help_text, buckets=None):
+    """Describe a metric for the Prometheus output; with buckets it is a histogram"""
+    METRICS[name] = (help_text, buckets)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last bucket is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.max = value if self.max is None else max(self.max, value)
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "mean": round(self.sum / self.count, 6) if self.count else None,
+            "max": self.max,
+            "buckets": {str(bound): count for bound, count in zip(self.buckets + ("+Inf",), self.counts)},
+        }
+
+
+class Metrics:
+    """
+    Process-wide metrics registry
+
+    Counters and histograms are keyed by name plus optional labels, e.g.
+    requests_total{status="429"}. Updates take one lock and a few
+    additions, cheap enough for the per-request and per-record paths.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.counters = {}
+        self.histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            if key not in self.counters:
+                METRICS.setdefault(name, (None, None))
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                buckets = METRICS.setdefault(name, (None, LATENCY_BUCKETS))[1] or LATENCY_BUCKETS
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def timer(self, name, **labels):
+        """Context manager adding the time spent in its block to a counter (or histogram)"""
+        return _Timer(self, name, labels)
+
+    def value(self, name, **labels):
+        """Counter value, or histogram sum; summed over every label set unless labels are given"""
+        with self.lock:
+            total = 0
+            for (key, key_labels), value in self.counters.items():
+                if key == name and (not labels or dict(key_labels) == labels):
+                    total += value
+            for (key, key_labels), histogram in self.histograms.items():
+                if key == name and (not labels or dict(key_labels) == labels):
+                    total += histogram.sum
+            return total
+
+    def count(self, name, **labels):
+        """Number of observations of a histogram"""
+        with self.lock:
+            return sum(histogram.count for (key, key_labels), histogram in self.histograms.items()
+                       if key == name and (not labels or dict(key_labels) == labels))
+
+    def reset(self):
+        with self.lock:
+            self.started = time.time()
+            self.counters.clear()
+            self.histograms.clear()
+
+    def snapshot(self):
+        """All metrics as a JSON-serializable dict"""
+        with self.lock:
+            data = {
+                "started": datetime.datetime.fromtimestamp(self.started).isoformat(),
+                "seconds": round(time.time() - self.started, 3),
+                "counters": {},
+                "histograms": {},
+            }
+            for (name, labels), value in sorted(self.counters.items()):
+                data["counters"][name + _label_text(labels)] = round(value, 6)
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                data["histograms"][name + _label_text(labels)] = histogram.as_dict()
+            return data
+
+    def save(self, filename):
+        import output  # output imports metrics
+        with output.replacing(filename) as tmp_path:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.snapshot(), f, indent=4)
+
+    def prometheus(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        with self.lock:
+            for name, (help_text, buckets) in list(METRICS.items()):
+                counters = [(labels, value) for (key, labels), value in self.counters.items() if key == name]
+                histograms = [(labels, h) for (key, labels), h in self.histograms.items() if key == name]
+                if not counters and not histograms:
+                    continue
+
+                if help_text:
+                    lines.append(f"# HELP {PREFIX}{name} {help_text}")
+                lines.append(f"# TYPE {PREFIX}{name} {'histogram' if buckets else 'counter'}")
+                for labels, value in sorted(counters):
+                    lines.append(f"{PREFIX}{name}{_label_text(labels)} {value}")
+                for labels, histogram in sorted(histograms, key=lambda item: item[0]):
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + ("+Inf",), histogram.counts):
+                        cumulative += count
+                        lines.append(f"{PREFIX}{name}_bucket{_label_text(labels + (('le', bound),))} {cumulative}")
+                    lines.append(f"{PREFIX}{name}_sum{_label_text(labels)} {histogram.sum}")
+                    lines.append(f"{PREFIX}{name}_count{_label_text(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def summary_line(self):
+        """One-line summary of where the time went"""
+        requests = self.count("request_seconds")
+        return (f"{requests} requests ({self.value('requests_total', status='401')} x 401, "
+                f"{self.value('requests_total', status='429')} x 429) took {self.value('request_seconds'):.1f}s "
+                f"for {self.value('response_bytes') / 1e6:.1f} MB; waited {self.value('sleep_seconds_total'):.1f}s, "
+                f"{self.value('retries_total'):.0f} retries, {self.value('logins_total'):.0f} logins, "
+                f"{self.value('serialize_seconds_total'):.2f}s writing output")
+
+
+class _Timer:
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.started
+        if METRICS.get(self.name, (None, None))[1] is None:
+            self.metrics.inc(self.name, elapsed, **self.labels)
+        else:
+            self.metrics.observe(self.name, elapsed, **self.labels)
+        return False
+
+
+def _label_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+registry = Metrics()
+inc = registry.inc
+observe = registry.observe
+timer = registry.timer
+
+
+def serve(port, host="127.0.0.1"):
+    """Expose the registry as Prometheus text on http://HOST:PORT/metrics from a background thread"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
+
+
+def setup(filename=None, port=None):
+    """Write the metrics to filename at exit (.prom for Prometheus text, JSON otherwise) and/or serve them"""
+    if filename:
+        def dump():
+            if filename.endswith(".prom"):
+                with open(filename, "w", encoding="utf-8") as f:
+                    f.write(registry.prometheus())
+            else:
+                registry.save(filename)
+        atexit.register(dump)
+    if port:
+        return serve(port)
+    return None
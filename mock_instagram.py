@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Instagram endpoints the exporters use
+
+Serves the profile page, the followers/following GraphQL edges, the posts
+timeline, the per-user profile queries and the profile pictures on the CDN,
+with responses shaped like instagram_data.json. Users are synthesized from their position in the list,
+so an account with a million followers costs no memory. Latency, 401s,
+429s (with Retry-After) and 503s can be injected to exercise the retry paths.
+
+Point the exporters at it with transport.configure(base_url=...), which is
+what benchmark.py does, or run it on its own:
+
+    python mock_instagram.py --port 8765 --followers 1000000 --latency 0.05
+"""
+
+import argparse, base64, json, random, re, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+TARGET_USERNAME = "mock_target"
+TARGET_ID = 7093386149
+VIEWER_USERNAME = "mock_viewer"
+VIEWER_ID = 1000
+FIRST_USER_ID = 40000000000  # Synthetic user i has id FIRST_USER_ID + i
+FIRST_POST_PK = 3600000000000000000
+MAX_PAGE = 50  # Largest page the server hands out, whatever "first" asks for
+
+FOLLOWERS_QUERY_HASH = "37479f2b8209594dde7facb0d904896a"
+FOLLOWING_QUERY_HASH = "58712303d941c6855d4e888c5f0cd22f"
+TEST_LOGIN_QUERY_HASH = "d6f4427fbe92d846298cf93df0b937d3"
+PROFILE_DOC_ID = "27937681195819736"
+POSTS_DOC_ID = "28975909992013618"
+POST_DOC_ID = "27128499623469141"
+
+
+def encode_cursor(offset):
+    # Real cursors are opaque base64 blobs of about this length
+    return base64.b64encode(f"QVFD{offset:012d}".ljust(96, "_").encode()).decode()
+
+
+def decode_cursor(cursor):
+    if not cursor:
+        return 0
+    return int(base64.b64decode(cursor).decode()[4:16])
+
+
+def user_index(user_id):
+    """Position of a synthetic user in the follower list, or None for other ids"""
+    index = int(user_id) - FIRST_USER_ID
+    return index if index >= 0 else None
+
+
+def profile_pic_url(user_id):
+    # About as long as the signed CDN URLs in instagram_data.json
+    digest = f"{user_id * 2654435761 % 16 ** 40:040x}"
+    return (f"https://scontent.cdninstagram.com/v/t51.2885-19/{user_id}_{digest[:17]}_n.jpg"
+            f"?stp=dst-jpg_s150x150_tt6&_nc_ht=scontent.cdninstagram.com&_nc_cat=111"
+            f"&_nc_oc={digest}{digest[:28]}&_nc_ohc={digest[:23]}&_nc_gid={digest[:22]}"
+            f"&edm=AOG-cTkBAAAA&ccb=7-5&oh=00_{digest}{digest[:6]}&oe={digest[:8].upper()}&_nc_sid=17ea04")
+
+
+AVATAR_VARIANTS = 64  # Distinct pictures; users share them, like the default avatar on the real CDN
+
+
+def avatar_body(user_id):
+    """A few KB standing in for a user's JPEG, identical for every user_id with the same variant"""
+    variant = int(user_id) % AVATAR_VARIANTS
+    return b"\xff\xd8\xff\xe0" + bytes((variant + i) % 256 for i in range(4096)) + b"\xff\xd9"
+
+
+def synthetic_user(index):
+    """Follower node as returned by the followers/following edges"""
+    user_id = FIRST_USER_ID + index
+    return {
+        "id": str(user_id),
+        "username": f"user{index:07d}",
+        "full_name": f"Mock User {index}",
+        "profile_pic_url": profile_pic_url(user_id),
+        "is_verified": index % 97 == 0,
+        "followed_by_viewer": index % 3 == 0,
+        "requested_by_viewer": False,
+    }
+
+
+class MockInstagram:
+    """
+    Synthetic data and fault injection settings shared by every handler thread
+
+    Only the target account has followers, followees and posts; each
+    synthetic user is a public account without any of its own.
+    """
+
+    def __init__(self, followers=1000, following=100, posts=24, latency=0.0, fail_401=0.0, fail_429=0.0,
+                 retry_after=1, seed=0, fail_503=0.0):
+        self.followers = followers
+        self.following = following
+        self.posts = posts
+        self.latency = latency
+        self.fail_401 = fail_401
+        self.fail_429 = fail_429
+        self.fail_503 = fail_503
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Zero the counters, e.g. between benchmark scenarios"""
+        with self.lock:
+            self.requests = 0
+            self.bytes = 0
+            self.injected = {401: 0, 429: 0, 503: 0}
+            self.endpoints = {}
+
+    def stats(self):
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "bytes": self.bytes,
+                "injected_401": self.injected[401],
+                "injected_429": self.injected[429],
+                "injected_503": self.injected[503],
+                "endpoints": dict(self.endpoints),
+            }
+
+    def count(self, endpoint, size):
+        with self.lock:
+            self.requests += 1
+            self.bytes += size
+            self.endpoints[endpoint] = self.endpoints.get(endpoint, 0) + 1
+
+    def inject(self):
+        """Status code of an injected failure for this request, or None"""
+        with self.lock:
+            roll = self.random.random()
+            status = None
+            if roll < self.fail_401:
+                status = 401
+            elif roll < self.fail_401 + self.fail_429:
+                status = 429
+            elif roll < self.fail_401 + self.fail_429 + self.fail_503:
+                status = 503
+            if status is not None:
+                self.injected[status] += 1
+            return status
+
+    # Data
+
+    def profile_node(self, user_id):
+        """Profile in the shape of the GraphQL profile query and the profile page"""
+        user_id = int(user_id)
+        if user_id == TARGET_ID:
+            username, full_name = TARGET_USERNAME, "Mock Target"
+            followers, following, posts = self.followers, self.following, self.posts
+        elif user_id == VIEWER_ID:
+            username, full_name = VIEWER_USERNAME, "Mock Viewer"
+            followers = following = posts = 0
+        elif user_index(user_id) is not None:
+            index = user_index(user_id)
+            username, full_name = f"user{index:07d}", f"Mock User {index}"
+            followers = following = posts = 0
+        else:
+            return None
+
+        return {
+            "pk": str(user_id),
+            "id": str(user_id),
+            "username": username,
+            "full_name": full_name,
+            "biography": f"Synthetic account {username}",
+            "external_url": None,
+            "is_private": False,
+            "is_verified": user_id != TARGET_ID and (user_index(user_id) or 1) % 97 == 0,
+            "is_business": False,
+            "category": None,
+            "follower_count": followers,
+            "following_count": following,
+            "media_count": posts,
+            "profile_pic_url": profile_pic_url(user_id),
+            "hd_profile_pic_url_info": {"url": profile_pic_url(user_id)},
+            "friendship_status": {"following": True, "followed_by": False, "blocking": False,
+                                  "incoming_request": False, "outgoing_request": False},
+        }
+
+    def user_id_for(self, username):
+        if username == TARGET_USERNAME:
+            return TARGET_ID
+        if username == VIEWER_USERNAME:
+            return VIEWER_ID
+        match = re.fullmatch(r"user(\d{7})", username)
+        return FIRST_USER_ID + int(match.group(1)) if match else None
+
+    def edge_page(self, user_id, edge, after, first):
+        total = 0
+        if int(user_id) == TARGET_ID:
+            total = self.followers if edge == "edge_followed_by" else self.following
+
+        start = decode_cursor(after)
+        end = min(total, start + max(1, min(int(first or 12), MAX_PAGE)))
+        # Followees start halfway through the followers, so the two lists partly overlap (mutuals)
+        offset = 0 if edge == "edge_followed_by" else self.followers // 2
+        has_next_page = end < total
+        return {
+            "count": total,
+            "page_info": {"has_next_page": has_next_page, "end_cursor": encode_cursor(end) if has_next_page else None},
+            "edges": [{"node": synthetic_user(offset + i)} for i in range(start, end)],
+        }
+
+    def media(self, index):
+        """Post in the shape of the logged-in posts timeline"""
+        pk = FIRST_POST_PK + index
+        code = base64.urlsafe_b64encode(pk.to_bytes(8, "big")).decode().rstrip("=")
+        media_type = (1, 1, 2, 8)[index % 4]
+        media = {
+            "pk": str(pk),
+            "id": f"{pk}_{TARGET_ID}",
+            "code": code,
+            "media_type": media_type,
+            "taken_at": 1750000000 - index * 86400,
+            "caption": {"text": f"Mock post {index} #benchmark"},
+            "has_liked": False,
+            "like_count": 1000 - index,
+            "comment_count": index * 3,
+            "image_versions2": {"candidates": [{"url": profile_pic_url(pk), "width": 1080, "height": 1080}]},
+            "user": {"pk": str(TARGET_ID), "username": TARGET_USERNAME, "full_name": "Mock Target",
+                     "is_private": False, "profile_pic_url": profile_pic_url(TARGET_ID)},
+        }
+        if media_type == 2:
+            media.update(video_versions=[{"url": profile_pic_url(pk + 1), "width": 720, "height": 1280}],
+                         video_duration=15.0, view_count=5000 - index, play_count=9000 - index)
+        return media
+
+    def post_index(self, shortcode):
+        try:
+            index = int.from_bytes(base64.urlsafe_b64decode(shortcode + "=" * (-len(shortcode) % 4)), "big") - FIRST_POST_PK
+        except ValueError:
+            return None
+        return index if 0 <= index < self.posts else None
+
+    def posts_page(self, after, first):
+        start = decode_cursor(after)
+        end = min(self.posts, start + max(1, min(int(first or 12), MAX_PAGE)))
+        has_next_page = end < self.posts
+        return {
+            "page_info": {"has_next_page": has_next_page, "end_cursor": encode_cursor(end) if has_next_page else None},
+            "edges": [{"node": self.media(i)} for i in range(start, end)],
+        }
+
+    # Endpoints
+
+    def handle(self, method, host, path, params):
+        """Return (endpoint name, status, headers, body) for one request"""
+        if self.latency:
+            time.sleep(self.latency)
+
+        failure = self.inject()
+        if failure == 429:
+            return "injected", 429, {"Retry-After": str(self.retry_after)}, {
+                "message": "Please wait a few minutes before you try again.", "status": "fail"}
+        if failure == 503:
+            return "injected", 503, {}, {"message": "Service temporarily unavailable", "status": "fail"}
+        if failure == 401:
+            return "injected", 401, {}, {
+                "message": "Please wait a few minutes before you try again.", "require_login": True, "status": "fail"}
+
+        variables = json.loads(params.get("variables") or "{}")
+
+        if host == "www.instagram.com" and path == "/graphql/query":
+            query_hash = params.get("query_hash")
+            doc_id = params.get("doc_id")
+
+            if query_hash in (FOLLOWERS_QUERY_HASH, FOLLOWING_QUERY_HASH):
+                edge = "edge_followed_by" if query_hash == FOLLOWERS_QUERY_HASH else "edge_follow"
+                page = self.edge_page(variables.get("id", 0), edge, variables.get("after"), variables.get("first"))
+                return edge, 200, {}, {"data": {"user": {edge: page}}, "status": "ok"}
+            if query_hash == TEST_LOGIN_QUERY_HASH:
+                return "test_login", 200, {}, {"data": {"user": {"username": VIEWER_USERNAME}}, "status": "ok"}
+            if doc_id == PROFILE_DOC_ID:
+                return "profile", 200, {}, {"data": {"user": self.profile_node(variables.get("id", 0))},
+                                            "status": "ok"}
+            if doc_id == POSTS_DOC_ID:
+                page = self.posts_page(variables.get("after"), variables.get("first"))
+                return "posts", 200, {}, {
+                    "data": {"xdt_api__v1__feed__user_timeline_graphql_connection": page}, "status": "ok"}
+            if doc_id == POST_DOC_ID:
+                index = self.post_index(variables.get("shortcode", ""))
+                items = [self.media(index)] if index is not None else []
+                return "post", 200, {}, {"data": {"xdt_api__v1__media__shortcode__web_info": {"items": items}},
+                                         "status": "ok"}
+            return "unknown", 400, {}, {"message": "Unknown query", "status": "fail"}
+
+        if host == "i.instagram.com":
+            match = re.fullmatch(r"/api/v1/users/(\d+)/info/", path)
+            node = self.profile_node(match.group(1)) if match else None
+            if node is not None:
+                return "user_info", 200, {}, {"user": node, "status": "ok"}
+
+        if host == "scontent.cdninstagram.com":
+            match = re.fullmatch(r"/v/t51\.2885-19/(\d+)_\w+_n\.jpg", path)
+            if match:
+                return "avatar", 200, {"Content-Type": "image/jpeg"}, avatar_body(match.group(1))
+
+        if host == "www.instagram.com" and method == "GET":
+            match = re.fullmatch(r"/([\w.]+)/", path)
+            user_id = self.user_id_for(match.group(1)) if match else None
+            if user_id is not None:
+                # The profile page embeds the profile query result in a JSON script tag
+                embedded = {"require": [{"__bbox": {"result": {"data": {
+                    "xig_user_by_username": self.profile_node(user_id)}}}}]}
+                html = (f'<!DOCTYPE html><html><head><title>@{match.group(1)}</title></head><body>'
+                        f'<script type="application/json">{json.dumps(embedded)}</script></body></html>')
+                return "profile_page", 200, {"Content-Type": "text/html; charset=utf-8"}, html
+
+        return "not_found", 404, {}, {"message": "Page not found", "status": "fail"}
+
+
+class Handler(BaseHTTPRequestHandler):
+    # Keep-alive, so the benchmarks measure the client's connection reuse
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; don't let them wait on delayed ACKs
+    disable_nagle_algorithm = True
+    mock = None
+
+    def respond(self, method):
+        # Paths are /HOST/PATH, as produced by transport.rewrite_url
+        url = urlsplit(self.path)
+        host, _, path = url.path.lstrip("/").partition("/")
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            params.update({key: values[-1] for key, values in parse_qs(self.rfile.read(length).decode()).items()})
+
+        endpoint, status, headers, body = self.mock.handle(method, host, "/" + path, params)
+        if isinstance(body, bytes):
+            payload = body
+        elif isinstance(body, str):
+            payload = body.encode("utf-8")
+        else:
+            payload = json.dumps(body, separators=(",", ":")).encode("utf-8")
+            headers.setdefault("Content-Type", "application/json; charset=utf-8")
+
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+        self.mock.count(endpoint, len(payload))
+
+    def do_GET(self):
+        self.respond("GET")
+
+    def do_POST(self):
+        self.respond("POST")
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(mock, host="127.0.0.1", port=0):
+    """Start the server on a background thread and return it; port 0 picks a free port"""
+    handler = type("MockHandler", (Handler,), {"mock": mock})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="mock-instagram", daemon=True).start()
+    return server
+
+
+def base_url(server):
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local mock of the Instagram endpoints used by the exporters")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--followers", type=int, default=1000, help="Followers of the target account")
+    parser.add_argument("--following", type=int, default=100, help="Accounts the target account follows")
+    parser.add_argument("--posts", type=int, default=24, help="Posts of the target account")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response")
+    parser.add_argument("--fail-401", type=float, default=0.0, help="Fraction of requests answered with 401")
+    parser.add_argument("--fail-429", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--fail-503", type=float, default=0.0, help="Fraction of requests answered with 503")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with injected 429s")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the failure injection")
+    args = parser.parse_args()
+
+    mock = MockInstagram(followers=args.followers, following=args.following, posts=args.posts,
+                         latency=args.latency, fail_401=args.fail_401, fail_429=args.fail_429,
+                         retry_after=args.retry_after, seed=args.seed, fail_503=args.fail_503)
+    server = serve(mock, args.host, args.port)
+    print(f"Mock Instagram listening on {base_url(server)} (target account: {TARGET_USERNAME}, id {TARGET_ID})")
+    print(f"Use transport.configure(base_url=\"{base_url(server)}\") to send requests here")
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        server.shutdown()
+        print(json.dumps(mock.stats(), indent=4))
+
+
+if __name__ == "__main__":
+    main()
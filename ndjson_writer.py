@@ -0,0 +1,141 @@
+"""
+Streaming NDJSON writer for follower exports
+"""
+
+import datetime, json, os, time
+
+import metrics, output
+
+
+def part_path(filename):
+    """Where a resumable export of filename is written until it is complete"""
+    return f"{filename}.part"
+
+
+class NDJSONWriter:
+    """
+    Write one JSON record per line as records arrive, keeping memory flat
+
+    Records are written (and compressed with "gzip" or "zstd", if asked) to a
+    temporary file that is renamed into place when closed, so a file under its
+    final name is never half-written. A resumable export is written to
+    FILENAME.part instead, which an aborted export leaves behind so that it
+    can be resumed from a checkpoint or rewound. Compressed files can't be
+    truncated, so they can't be resumable.
+    """
+
+    def __init__(self, filename: str, flush_every: int = 100, resume_offset=None, resume_count=0, compression=None,
+                 resumable=False):
+        self.filename = filename
+        self.flush_every = max(1, flush_every)
+        self.count = 0
+        self.serialize_seconds = 0.0  # Reported to metrics once, when the file is closed
+        self.compression = output.compression_for(filename, compression)
+        self.resumable = resumable or resume_offset is not None
+
+        if not self.resumable:
+            self.file = output.AtomicFile(filename, self.compression)
+            self.path = self.file.tmp_path
+            return
+        if self.compression:
+            raise ValueError("Compressed NDJSON exports can't be resumed")
+
+        self.path = part_path(filename)
+        # Resuming truncates anything written after the last committed offset
+        if resume_offset is not None and os.path.exists(self.path):
+            self.file = open(self.path, "r+b")
+            self.file.truncate(resume_offset)
+            self.file.seek(resume_offset)
+            self.count = resume_count
+        else:
+            self.file = open(self.path, "wb")
+
+    def write(self, record):
+        """Append a single record and flush periodically"""
+        started = time.perf_counter()
+        self.file.write(output.dumps_line(record))
+        self.count += 1
+
+        if self.count % self.flush_every == 0:
+            self.flush()
+        self.serialize_seconds += time.perf_counter() - started
+
+    def write_line(self, line):
+        """Append a record that is already encoded as one NDJSON line"""
+        self.file.write(line)
+        self.count += 1
+        if self.count % self.flush_every == 0:
+            self.flush()
+
+    def flush(self):
+        self.file.flush()
+
+    def tell(self):
+        """Flush and return the byte offset just past the last written record"""
+        self.flush()
+        return self.file.tell()
+
+    def truncate(self, offset=0, count=0):
+        """Discard everything written after offset (used when a crawl rewinds to a checkpoint)"""
+        if not self.resumable:
+            raise ValueError("Only resumable NDJSON exports can be rewound")
+        self.file.flush()
+        self.file.seek(offset)
+        self.file.truncate()
+        self.count = count
+
+    def close(self, **summary):
+        """Write the trailing summary record and close the file"""
+        if self.file.closed:
+            return
+
+        summary_record = {
+            "count": self.count,
+            "timestamp": str(datetime.datetime.now()),
+        }
+        summary_record.update(summary)
+
+        self.file.write(output.dumps_line({"_summary": summary_record}))
+        if self.resumable:
+            self.file.close()
+            os.replace(self.path, self.filename)
+        else:
+            self.file.commit()
+        metrics.inc("serialize_seconds_total", self.serialize_seconds, format="ndjson")
+
+    def abort(self):
+        """
+        Close without a summary record, marking the export as incomplete
+
+        A resumable export stays in its .part file for the next attempt; any
+        other is renamed into place, where the missing summary record marks it
+        as incomplete.
+        """
+        if self.file.closed:
+            return
+        if self.resumable:
+            self.file.close()
+        else:
+            self.file.commit()
+        metrics.inc("serialize_seconds_total", self.serialize_seconds, format="ndjson")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+
+def read_ndjson(filename):
+    """Yield the records of an NDJSON export (plain, .gz or .zst), skipping the trailing summary"""
+    with output.open_binary(filename, output.compression_for(filename), "rb") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if "_summary" not in record:
+                yield record
@@ -0,0 +1,173 @@
+"""
+Single-pass, atomic output of exports with optional fast encoding and compression
+"""
+
+import contextlib, io, json, os, threading
+
+import metrics
+
+COMPRESSIONS = ("gzip", "zstd")
+EXTENSIONS = {"gzip": ".gz", "zstd": ".zst"}
+
+_orjson = None
+
+
+def fast_encoder():
+    """orjson if it is installed, else None"""
+    global _orjson
+    if _orjson is None:
+        try:
+            import orjson
+            _orjson = orjson
+        except ImportError:
+            _orjson = False
+    return _orjson or None
+
+
+def compression_for(filename, compression=None):
+    """The explicit compression, else the one implied by the file extension, else None"""
+    if compression:
+        return compression
+    for name, extension in EXTENSIONS.items():
+        if filename.endswith(extension):
+            return name
+    return None
+
+
+def with_extension(filename, compression):
+    """Add the compression's extension to filename unless it already has it"""
+    extension = EXTENSIONS.get(compression)
+    if extension and not filename.endswith(extension):
+        return filename + extension
+    return filename
+
+
+def check_available(compression):
+    """Raise RuntimeError up front if the compression's package is missing"""
+    if compression == "zstd":
+        try:
+            import zstandard  # noqa: F401
+        except ImportError:
+            raise RuntimeError("zstd compression needs the zstandard package: pip install zstandard") from None
+
+
+def open_binary(path, compression=None, mode="wb"):
+    """Open a plain, gzip or zstd file for binary reading or writing"""
+    if compression == "gzip":
+        import gzip
+        return gzip.open(path, mode, compresslevel=6)
+    if compression == "zstd":
+        check_available(compression)
+        import zstandard
+        if "r" in mode:
+            return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path, "rb")))
+        return zstandard.ZstdCompressor().stream_writer(open(path, mode))
+    return open(path, mode)
+
+
+def temp_path(path):
+    """A temporary file next to path, unique to this process and thread"""
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+@contextlib.contextmanager
+def replacing(path):
+    """
+    Yield a temporary path that is renamed over path once the block succeeds
+
+    Every writer gets its own temporary file, so processes saving the same
+    cache at once never write into each other's file; the last rename wins.
+    On failure the temporary file is removed and path is left untouched.
+    """
+    tmp_path = temp_path(path)
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def dumps(data, compact=False):
+    """
+    Encode data as UTF-8 JSON bytes
+
+    Pretty output is always the standard library's indent=4, so files look the
+    same wherever they were written; compact output uses orjson when available.
+    """
+    if not compact:
+        return json.dumps(data, indent=4, ensure_ascii=False).encode("utf-8")
+    orjson = fast_encoder()
+    if orjson is not None:
+        try:
+            return orjson.dumps(data)
+        except TypeError:
+            pass  # e.g. integers wider than 64 bits, which the standard library handles
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def dumps_line(record):
+    """One compact NDJSON line"""
+    return dumps(record, compact=True) + b"\n"
+
+
+class AtomicFile:
+    """
+    Output file that only appears under its final name once complete
+
+    Data is written (and compressed, if asked) to a temporary file next to
+    FILENAME, which is renamed over it on commit, so readers never see a half-written file.
+    """
+
+    def __init__(self, filename, compression=None):
+        self.filename = filename
+        self.tmp_path = temp_path(filename)
+        self.compression = compression_for(filename, compression)
+        self.file = open_binary(self.tmp_path, self.compression)
+
+    def write(self, data):
+        self.file.write(data)
+
+    def flush(self):
+        self.file.flush()
+
+    def tell(self):
+        return self.file.tell()
+
+    @property
+    def closed(self):
+        return self.file.closed
+
+    def commit(self):
+        self.file.close()
+        os.replace(self.tmp_path, self.filename)
+
+    def discard(self):
+        self.file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.discard()
+        return False
+
+
+def write_json(filename, data, compact=False, compression=None):
+    """Encode data once and write it atomically to its final destination"""
+    with metrics.timer("serialize_seconds_total", format="json"):
+        with AtomicFile(filename, compression) as f:
+            f.write(dumps(data, compact))
+    return filename
+
+
+def read_json(filename):
+    """Load a JSON export, compressed or not"""
+    with open_binary(filename, compression_for(filename), "rb") as f:
+        return json.loads(f.read())
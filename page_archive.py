@@ -0,0 +1,185 @@
+"""
+Append-only archive of raw GraphQL response pages
+"""
+
+import datetime, json, mmap, os, re, threading
+
+import metrics
+
+metrics.register("archive_bytes_total", "Response bytes written to the page archive")
+
+SEGMENT_SIZE = 64 * 1024 * 1024  # Start a new segment file once one grows past this
+INDEX_FILE = "index.ndjson"
+
+PAGE_INFO_PATTERN = re.compile(rb'"page_info":\s*\{\s*"has_next_page":\s*(true|false),\s*'
+                               rb'"end_cursor":\s*(null|"(?:[^"\\]|\\.)*")\s*\}')
+COUNT_PATTERN = re.compile(rb'"count":\s*(\d+)')
+
+
+def segment_name(number):
+    return f"pages-{number:05d}.bin"
+
+
+def query_key(query_hash, variables):
+    """The query and its variables, minus the ones that change from page to page"""
+    variables = {key: value for key, value in variables.items() if key not in ("after", "first")}
+    return query_hash, json.dumps(variables, sort_keys=True, separators=(",", ":"))
+
+
+def scan_page_info(body):
+    """
+    (count, has_next_page, end_cursor) read from a raw page without decoding it
+
+    Returns None unless the body holds exactly one page_info in the usual
+    key order, in which case the caller has to decode the page instead.
+    """
+    matches = PAGE_INFO_PATTERN.findall(body)
+    if len(matches) != 1 or body.count(b'"page_info"') != 1:
+        return None
+    has_next_page, end_cursor = matches[0]
+    counts = COUNT_PATTERN.findall(body)
+    count = int(counts[0]) if len(counts) == 1 else None
+    return count, has_next_page == b"true", json.loads(end_cursor)
+
+
+class PageArchive:
+    """
+    Write GraphQL response bodies, byte for byte, to segmented append-only files
+
+    Each page is appended to the current pages-NNNNN.bin segment, then a line
+    with its query, cursor, segment, offset and length is appended to
+    index.ndjson. A page only counts once its index line is written, so bytes
+    left behind by an interrupted write are never read. Reopening an archive
+    carries on where it stopped, and next_cursor() tells a crawl where to
+    resume. Read it back with ArchiveReader, without any network access.
+    """
+
+    def __init__(self, directory, segment_size=SEGMENT_SIZE):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+        self.entries = list(read_index(directory))
+        self.segment = max((entry["segment"] for entry in self.entries), default=0)
+        self.file = open(os.path.join(directory, segment_name(self.segment)), "ab")
+        self.index = open(os.path.join(directory, INDEX_FILE), "ab")
+        self.pages = 0
+        self.bytes = 0
+
+    def append(self, body, query_hash, variables, cursor=None, next_cursor=None, has_next_page=None):
+        """Store one raw response body and return its index entry"""
+        query_hash, key = query_key(query_hash, variables)
+        with self.lock:
+            if self.file.tell() and self.file.tell() + len(body) > self.segment_size:
+                self.file.close()
+                self.segment += 1
+                self.file = open(os.path.join(self.directory, segment_name(self.segment)), "ab")
+
+            offset = self.file.tell()
+            self.file.write(body)
+            self.file.flush()
+
+            entry = {
+                "query_hash": query_hash,
+                "variables": key,
+                "cursor": cursor,
+                "next_cursor": next_cursor,
+                "has_next_page": has_next_page,
+                "segment": self.segment,
+                "offset": offset,
+                "length": len(body),
+                "fetched_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            }
+            self.index.write(json.dumps(entry, separators=(",", ":")).encode("utf-8") + b"\n")
+            self.index.flush()
+            self.entries.append(entry)
+            self.pages += 1
+            self.bytes += len(body)
+        metrics.inc("archive_bytes_total", len(body))
+        return entry
+
+    def next_cursor(self, query_hash, variables):
+        """(has_next_page, end_cursor) after the last archived page of a query, or None if it has none"""
+        query_hash, key = query_key(query_hash, variables)
+        for entry in reversed(self.entries):
+            if entry["query_hash"] == query_hash and entry["variables"] == key:
+                return bool(entry["has_next_page"]), entry["next_cursor"]
+        return None
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+            self.index.close()
+
+
+def read_index(directory):
+    """Index entries of an archive in the order the pages were written"""
+    path = os.path.join(directory, INDEX_FILE)
+    if not os.path.exists(path):
+        return
+    with open(path, "rb") as f:
+        for line in f:
+            # A line cut short by a crash is the end of the archive
+            if not line.endswith(b"\n"):
+                return
+            yield json.loads(line)
+
+
+class ArchiveReader:
+    """
+    Memory-mapped access to an archive written by PageArchive
+
+    Segments are mapped on first use and pages are only decoded when asked
+    for, so scanning the index or copying raw pages costs no JSON parsing.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.entries = list(read_index(directory))
+        self.maps = {}
+
+    def pages(self, query_hash=None, variables=None):
+        """Index entries, optionally only those of one query (and its variables)"""
+        key = query_key(query_hash, variables)[1] if variables is not None else None
+        for entry in self.entries:
+            if query_hash is not None and entry["query_hash"] != query_hash:
+                continue
+            if key is not None and entry["variables"] != key:
+                continue
+            yield entry
+
+    def segment(self, number):
+        if number not in self.maps:
+            with open(os.path.join(self.directory, segment_name(number)), "rb") as f:
+                self.maps[number] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.maps[number]
+
+    def raw(self, entry):
+        """The response body of a page, exactly as it was received"""
+        return self.segment(entry["segment"])[entry["offset"]:entry["offset"] + entry["length"]]
+
+    def load(self, entry):
+        """The decoded response of a page"""
+        return json.loads(self.raw(entry))
+
+    def nodes(self, query_hash=None, variables=None, edge=None):
+        """Every node of the paginated edge, page by page, decoding one page at a time"""
+        from graphql_paginator import find_edge
+
+        for entry in self.pages(query_hash, variables):
+            found = find_edge(self.load(entry), edge) or {}
+            for item in found.get("edges", []):
+                yield item["node"]
+
+    def close(self):
+        for segment in self.maps.values():
+            segment.close()
+        self.maps = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
@@ -0,0 +1,124 @@
+"""
+Fetch the next pages of an iterator in the background while the current one is processed
+"""
+
+import queue, threading
+
+DEFAULT_DEPTH = 2  # Pages fetched ahead of the consumer
+
+_DONE = object()
+_ERROR = object()
+
+
+def instaloader_page_size():
+    """Nodes per page of instaloader's follower, following and post iterators (NodeIterator)"""
+    from instaloader.nodeiterator import NodeIterator
+    return NodeIterator._graphql_page_length
+
+
+class Prefetcher:
+    """
+    Iterate over a paginated iterator from a producer thread, up to depth pages ahead
+
+    The producer keeps the next pages coming (each request still waits for
+    the rate scheduler) while the consumer converts and writes the current
+    one. The queue is bounded, so a stalled consumer stops the producer
+    instead of letting it race ahead. Errors raised by the iterator are
+    re-raised in the consumer, at the position where they happened. Wrap
+    the iterator in itertools.islice to stop at a limit without fetching a
+    page past it.
+
+    snapshot is called on the producer thread right after every
+    snapshot_every-th item (counting from start), and its result is
+    available as .state while that item is being consumed. NodeIterator.freeze
+    has to be taken there: by the time the consumer sees the item, the
+    iterator itself may already be pages ahead.
+
+    With depth=0 nothing runs in the background and items are passed through
+    as they are fetched.
+    """
+
+    def __init__(self, iterable, depth=DEFAULT_DEPTH, page_size=None, snapshot=None, snapshot_every=None,
+                 start=0):
+        self.iterator = iter(iterable)
+        self.depth = depth
+        self.snapshot = snapshot
+        self.snapshot_every = snapshot_every
+        self.count = start
+        self.state = None
+        self.finished = False
+        self.stopped = threading.Event()
+        self.thread = None
+
+        if depth > 0:
+            self.queue = queue.Queue(maxsize=depth * (page_size or instaloader_page_size()))
+            self.thread = threading.Thread(target=self.produce, name="prefetch", daemon=True)
+            self.thread.start()
+
+    def take_snapshot(self):
+        """The snapshot due with the next item, if any"""
+        state = None
+        if self.snapshot is not None and self.count and self.count % self.snapshot_every == 0:
+            state = self.snapshot()
+        self.count += 1
+        return state
+
+    def produce(self):
+        try:
+            for item in self.iterator:
+                if not self.put((item, self.take_snapshot())):
+                    return
+        except BaseException as error:
+            self.put((_ERROR, error))
+            return
+        self.put((_DONE, None))
+
+    def put(self, entry):
+        """Queue an entry, giving up once the consumer has stopped"""
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.finished:
+            raise StopIteration
+
+        if self.thread is None:
+            try:
+                item = next(self.iterator)
+            except StopIteration:
+                self.finished = True
+                raise
+            self.state = self.take_snapshot()
+            return item
+
+        item, state = self.queue.get()
+        if item is _DONE:
+            self.finished = True
+            raise StopIteration
+        if item is _ERROR:
+            self.finished = True
+            raise state
+        self.state = state
+        return item
+
+    def close(self):
+        """Stop the producer and wait for the request it may be in the middle of"""
+        self.finished = True
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
@@ -0,0 +1,132 @@
+"""
+On-disk cache of username -> user id and profile metadata
+"""
+
+import json, os, threading, time
+
+import file_lock, output
+
+PROFILE_CACHE_FILE = os.path.join(os.path.expanduser("~"), ".instaloader_profile_cache.json")
+DEFAULT_TTL = 6 * 60 * 60  # Re-fetch a profile after six hours
+
+
+class ProfileCache:
+    """
+    Username -> user id, privacy, counts and profile node, plus when they were fetched
+
+    A fresh entry lets a crawl start paginating from the user id straight
+    away instead of loading the profile page first. Entries expire after
+    the TTL, are dropped when the profile no longer exists, and a username
+    is forgotten once its user id shows up under another name (a rename).
+    Every change is applied to the file as it is on disk at that moment, so
+    processes sharing the cache (queue workers) keep each other's entries.
+    """
+
+    def __init__(self, path=PROFILE_CACHE_FILE, ttl=DEFAULT_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.entries = {}
+        self.loaded = False
+        self.lock = threading.Lock()
+
+    def load(self):
+        """Load the cache from disk once per process"""
+        with self.lock:
+            if self.loaded:
+                return
+            self.loaded = True
+            self.entries = self.read()
+
+    def read(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f).get("profiles") or {}
+        except (OSError, ValueError, AttributeError):
+            return {}
+
+    def get(self, username):
+        """The entry for username if it was fetched within the TTL, else None"""
+        self.load()
+        entry = self.entries.get(username.lower())
+        if entry is None or time.time() - entry.get("fetched_at", 0) >= self.ttl:
+            return None
+        return entry
+
+    def user_id(self, username):
+        """Cached user id of username, even past the TTL (ids never change), or None"""
+        self.load()
+        entry = self.entries.get(username.lower())
+        return entry["id"] if entry else None
+
+    def profile(self, context, username):
+        """instaloader Profile rebuilt from a fresh entry without any request, or None"""
+        entry = self.get(username)
+        if entry is None:
+            return None
+
+        from instaloader import Profile
+        node = dict(entry["node"])
+        # instaloader leaves the post count out of its JSON structure
+        node.setdefault("edge_owner_to_timeline_media", {"count": entry["posts_count"]})
+        return Profile(context, node)
+
+    def store(self, profile):
+        """Remember an instaloader Profile whose metadata has been loaded"""
+        from instaloader import get_json_structure
+
+        entry = {
+            "id": profile.userid,
+            "username": profile.username,
+            "full_name": profile.full_name,
+            "is_private": profile.is_private,
+            "followers_count": profile.followers,
+            "following_count": profile.followees,
+            "posts_count": profile.mediacount,
+            "fetched_at": time.time(),
+            "node": get_json_structure(profile)["node"],
+        }
+        def change(entries):
+            # A rename leaves the old username pointing at this id
+            for username, other in list(entries.items()):
+                if other["id"] == entry["id"] and username != entry["username"]:
+                    del entries[username]
+            entries[entry["username"]] = entry
+        self.modify(change)
+        return entry
+
+    def invalidate(self, username):
+        """Forget username, e.g. after a 404"""
+        self.modify(lambda entries: entries.pop(username.lower(), None) is not None)
+
+    def modify(self, change):
+        """
+        Apply change(entries) to the entries on disk and save them, unless it returns False
+
+        The file is re-read under a lock first, so entries that other
+        processes saved since this one loaded the cache are kept.
+        """
+        with self.lock, file_lock.locked(f"{self.path}.lock"):
+            self.loaded = True
+            self.entries = self.read()
+            if change(self.entries) is not False:
+                self.save()
+
+    def save(self):
+        with output.replacing(self.path) as tmp_path:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"profiles": self.entries}, f, ensure_ascii=False)
+
+
+_shared = None
+_lock = threading.Lock()
+
+
+def shared(ttl=None):
+    """Return the process-wide profile cache"""
+    global _shared
+    with _lock:
+        if _shared is None:
+            _shared = ProfileCache()
+        if ttl is not None:
+            _shared.ttl = ttl
+        return _shared
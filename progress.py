@@ -0,0 +1,237 @@
+"""
+Fixed-rate progress reporting, and consoles for quiet and machine-readable runs
+"""
+
+import contextlib, datetime, json, re, sys, threading, time
+
+LOG_FORMATS = ("rich", "json")
+SPINNER_INTERVAL = 0.5  # Seconds between updates of the spinner text on a terminal
+LINE_INTERVAL = 10.0  # Seconds between progress lines when there is no spinner (batch workers)
+EVENT_INTERVAL = 5.0  # Seconds between JSON progress events
+SMOOTHING = 0.3  # Weight of the latest interval in the smoothed rate behind the ETA
+
+MARKUP = re.compile(r"\[/?(?:bold |dim |italic )*(?:bold|red|green|yellow|blue|magenta|cyan|white)?\]")
+
+_log_format = "rich"
+_quiet = False
+_interval = None
+
+
+def configure(log_format="rich", quiet=False, interval=None):
+    """Pick the console every later make_console() returns; call before creating exporters"""
+    global _log_format, _quiet, _interval
+    _log_format = log_format
+    _quiet = quiet
+    _interval = interval
+
+
+def interactive():
+    """True when output is for a person at a terminal: rich, and not --quiet"""
+    return _log_format == "rich" and not _quiet
+
+
+def make_console():
+    """A console for the configured format; rich is only imported for the rich format"""
+    if _log_format == "json":
+        return JSONConsole(quiet=_quiet)
+    if _quiet:
+        return QuietConsole()
+    from rich.console import Console
+    return Console()
+
+
+def level_of(message):
+    """error, warning or info, from the colour the message is printed in"""
+    head = message.lstrip()[:16]
+    if head.startswith("[") and "red" in head.split("]", 1)[0]:
+        return "error"
+    if head.startswith("[bold yellow]"):
+        return "warning"
+    return "info"
+
+
+def plain(message):
+    """A console message without its rich markup"""
+    return MARKUP.sub("", str(message)).strip()
+
+
+class JSONConsole:
+    """
+    Stand-in for rich's Console that writes one JSON event per line
+
+    print() becomes a "log" event with a level derived from the message's
+    colour, so every existing message keeps working; progress and results
+    are events of their own. With quiet only errors and results are kept.
+    Nothing from rich is imported.
+    """
+
+    def __init__(self, stream=None, quiet=False):
+        self.stream = stream or sys.stdout
+        self.quiet = quiet
+        self.lock = threading.Lock()
+
+    def event(self, name, **fields):
+        record = {"ts": datetime.datetime.now(datetime.timezone.utc).isoformat(), "event": name}
+        record.update(fields)
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        with self.lock:
+            self.stream.write(line)
+            self.stream.flush()
+
+    def print(self, *objects, **kwargs):
+        message = " ".join(str(value) for value in objects)
+        level = level_of(message)
+        if self.quiet and level != "error":
+            return
+        text = plain(message)
+        if text:
+            self.event("log", level=level, message=text)
+
+    def status(self, message):
+        return contextlib.nullcontext()
+
+
+class QuietConsole:
+    """A rich console that only shows errors: no spinners, banners or progress"""
+
+    quiet = True
+
+    def __init__(self):
+        from rich.console import Console
+        self.console = Console(stderr=True)
+
+    def print(self, *objects, **kwargs):
+        if objects and level_of(str(objects[0])) == "error":
+            self.console.print(*objects, **kwargs)
+
+    def status(self, message):
+        return contextlib.nullcontext()
+
+
+def format_eta(seconds):
+    if seconds is None:
+        return "?"
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+    return f"{seconds // 60}m{seconds % 60:02d}s"
+
+
+class Progress:
+    """
+    Throughput, ETA and phase of one crawl, rendered at a fixed rate
+
+    The crawl only stores its count with update(), which costs an attribute
+    write however fast records arrive. A ticker thread renders every
+    interval seconds instead: the spinner text on a terminal, a printed
+    line when several exports share the console (no spinner), or a
+    "progress" event for --log-format json. The ETA comes from a smoothed
+    rate, so it follows throttling instead of the average since the start.
+    Without a console (or with a quiet one) nothing is rendered.
+    """
+
+    def __init__(self, console=None, target=None, total=None, unit="followers", spinner=False, interval=None):
+        self.console = console
+        self.target = target
+        self.total = total
+        self.unit = unit
+        self.count = 0
+        self._phase = "starting"
+        self.events = hasattr(console, "event")
+        self.enabled = console is not None and not getattr(console, "quiet", False)
+        self.spinner = spinner and self.enabled and not self.events
+        if interval is None:
+            interval = _interval
+        if interval is None:
+            interval = EVENT_INTERVAL if self.events else SPINNER_INTERVAL if self.spinner else LINE_INTERVAL
+        self.interval = interval
+        self.rate = None
+        self.started = None
+        self.last = None  # (time, count) of the previous tick
+        self.status = None
+        self.stopped = threading.Event()
+        self.thread = None
+
+    @property
+    def phase(self):
+        return self._phase
+
+    @phase.setter
+    def phase(self, phase):
+        if phase != self._phase and self.enabled and self.events:
+            self.console.event("phase", target=self.target, phase=phase, count=self.count)
+        self._phase = phase
+
+    def update(self, count):
+        self.count = count
+
+    def eta(self):
+        if not self.total or not self.rate:
+            return None
+        return max(0.0, (self.total - self.count) / self.rate)
+
+    def tick(self, now):
+        """Fold the interval since the last tick into the smoothed rate"""
+        last_time, last_count = self.last
+        if now > last_time:
+            rate = (self.count - last_count) / (now - last_time)
+            self.rate = rate if self.rate is None else SMOOTHING * rate + (1 - SMOOTHING) * self.rate
+        self.last = (now, self.count)
+
+    def text(self):
+        total = f"/{self.total}" if self.total else ""
+        rate = f"{self.rate:.1f}/s" if self.rate is not None else "-/s"
+        return f"{self.target} {self.phase}: {self.count}{total} {self.unit}, {rate}, ETA {format_eta(self.eta())}"
+
+    def render(self):
+        if self.events:
+            eta = self.eta()
+            self.console.event("progress", target=self.target, phase=self.phase, count=self.count,
+                               total=self.total, rate=round(self.rate or 0.0, 2),
+                               eta_seconds=None if eta is None else round(eta))
+        elif self.status is not None:
+            self.status.update(f"[bold green]{self.text()}")
+        else:
+            self.console.print(f"[yellow]{self.text()}[/yellow]")
+
+    def run(self):
+        rendered = None
+        while not self.stopped.wait(self.interval):
+            self.tick(time.monotonic())
+            # Printed lines and events only repeat when something has moved
+            if self.status is not None or (self.count, self.phase) != rendered:
+                rendered = (self.count, self.phase)
+                self.render()
+
+    def start(self):
+        self.started = time.monotonic()
+        self.last = (self.started, self.count)
+        if not self.enabled:
+            return self
+        if self.spinner:
+            self.status = self.console.status(f"[bold green]{self.text()}")
+            self.status.start()
+        self.thread = threading.Thread(target=self.run, name="progress", daemon=True)
+        self.thread.start()
+        return self
+
+    def close(self, **result):
+        """Stop rendering; JSON consoles also get a "done" event with the totals and result"""
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.status is not None:
+            self.status.stop()
+            self.status = None
+        if self.events and self.started is not None:
+            elapsed = time.monotonic() - self.started
+            self.console.event("done", target=self.target, count=self.count, total=self.total,
+                               seconds=round(elapsed, 3), **result)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
@@ -0,0 +1,178 @@
+"""
+Adaptive request scheduling for Instagram queries
+"""
+
+import random, threading, time
+
+import metrics
+
+# Instaloader documents 200 GraphQL queries per query type within an 11 minute window
+DOCUMENTED_RATE = 200 / 660
+INCREASE = 0.05  # Share of the target rate won back by every successful request
+MIN_RATE = 0.1  # Share of the target rate the scheduler never slows down below
+
+
+class AdaptiveScheduler:
+    """
+    Token bucket whose refill rate adapts to what the server tells us
+
+    Every successful request nudges the rate up additively (towards the
+    configured target), every 429/401 halves it and, if the server sent a
+    Retry-After, blocks all requests until it has passed. While nothing is
+    throttled requests go out as fast as the bucket allows instead of
+    sleeping on a fixed schedule.
+
+    Both the step up (increase) and the floor (min_rate, unless given in
+    requests per second) are shares of the target rate, so recovery takes
+    the same number of requests whatever the target: with the defaults, ten
+    successes undo a halving from the target, so the rate stays close to it
+    even when one request in ten is throttled.
+    """
+
+    def __init__(self, rate=DOCUMENTED_RATE, burst=6, min_rate=None, increase=INCREASE, decrease=0.5,
+                 base_backoff=10.0, max_backoff=600.0):
+        self.target_rate = rate
+        self.rate = rate
+        self.burst = max(1.0, float(burst))
+        self.min_rate = min(min_rate, rate) if min_rate is not None else rate * MIN_RATE
+        self.increase = increase * rate
+        self.decrease = decrease
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+
+        self.tokens = self.burst
+        self.last_refill = time.monotonic()
+        self.blocked_until = 0.0
+        self.consecutive_throttles = 0
+        self.lock = threading.Lock()
+
+        # Statistics for reporting
+        self.started = time.monotonic()
+        self.requests = 0
+        self.throttles = 0
+        self.slept = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def reserve(self):
+        """Take a token and return how many seconds to wait before using it"""
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= 1
+            self.requests += 1
+
+            wait = 0.0
+            if self.tokens < 0:
+                wait = -self.tokens / self.rate
+            return max(wait, self.blocked_until - now)
+
+    def acquire(self):
+        """Block until the next request may be sent"""
+        self.sleep(self.reserve())
+
+    def sleep(self, seconds, reason="pacing"):
+        if seconds > 0:
+            with self.lock:
+                self.slept += seconds
+            metrics.inc("sleep_seconds_total", seconds, reason=reason)
+            time.sleep(seconds)
+
+    async def acquire_async(self):
+        """acquire() for asyncio code: waits without blocking the event loop"""
+        await self.sleep_async(self.reserve())
+
+    async def sleep_async(self, seconds, reason="pacing"):
+        import asyncio
+        if seconds > 0:
+            with self.lock:
+                self.slept += seconds
+            metrics.inc("sleep_seconds_total", seconds, reason=reason)
+            await asyncio.sleep(seconds)
+
+    def on_success(self):
+        """Additive increase after a request went through"""
+        with self.lock:
+            self.consecutive_throttles = 0
+            self.rate = min(self.target_rate, self.rate + self.increase)
+
+    def on_throttle(self, retry_after=None):
+        """Multiplicative decrease after a 429/401, honouring Retry-After if given"""
+        with self.lock:
+            self.throttles += 1
+            self.consecutive_throttles += 1
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            self.tokens = min(self.tokens, 0.0)
+
+            if retry_after is not None:
+                self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+
+    def backoff_delay(self):
+        """Jittered exponential delay before retrying after consecutive throttles"""
+        with self.lock:
+            remaining = self.blocked_until - time.monotonic()
+            exponent = max(0, self.consecutive_throttles - 1)
+            delay = min(self.max_backoff, self.base_backoff * (2 ** exponent))
+        return max(remaining, random.uniform(delay / 2, delay))
+
+    @property
+    def achieved_rate(self):
+        elapsed = time.monotonic() - self.started
+        return self.requests / elapsed if elapsed > 0 else 0.0
+
+    def summary(self):
+        return {
+            "target_rate": round(self.target_rate, 4),
+            "current_rate": round(self.rate, 4),
+            "achieved_rate": round(self.achieved_rate, 4),
+            "burst": self.burst,
+            "requests": self.requests,
+            "throttles": self.throttles,
+            "slept_seconds": round(self.slept, 2),
+        }
+
+
+def parse_retry_after(value):
+    """Parse a Retry-After header (seconds form), returning None if absent or unparseable"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def instaloader_rate_controller(scheduler):
+    """Return a rate_controller factory for instaloader.Instaloader driven by the scheduler"""
+    from instaloader import RateController
+
+    class SchedulerRateController(RateController):
+        """Instaloader rate controller that defers pacing to an AdaptiveScheduler"""
+
+        def __init__(self, context):
+            super().__init__(context)
+            self._throttles_seen = scheduler.throttles
+
+        def sleep(self, secs):
+            scheduler.sleep(secs)
+
+        def wait_before_query(self, query_type):
+            # The previous query went through unless a throttle was reported since
+            # (here, by a retry policy or by another export sharing the scheduler)
+            if scheduler.throttles != self._throttles_seen:
+                self._throttles_seen = scheduler.throttles
+            elif self._query_timestamps:
+                scheduler.on_success()
+
+            scheduler.acquire()
+            # Instaloader's own sliding windows still apply as a hard ceiling
+            super().wait_before_query(query_type)
+
+        def handle_429(self, query_type):
+            scheduler.on_throttle()
+            metrics.inc("retries_total", reason="429")
+            scheduler.sleep(scheduler.backoff_delay(), reason="backoff")
+
+    return SchedulerRateController
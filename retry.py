@@ -0,0 +1,213 @@
+"""
+Request-level retries with jittered backoff and an auth circuit breaker
+"""
+
+import random, re, threading, time
+
+import metrics
+
+# Kinds of request failure
+TRANSIENT = "transient"  # Connection resets, timeouts, 5xx: retry after a short delay
+THROTTLED = "throttled"  # 429, or a 401 asking to wait: back off
+AUTH = "auth"  # 401/403 or a redirect to the login page: the session may have expired
+FATAL = "fatal"  # 400, 404, checkpoints: retrying won't help
+
+STATUS_PATTERN = re.compile(r"\b([1-5]\d\d) [A-Z]")
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of retrying once auth has failed too many times in a row"""
+
+
+def _chain(error):
+    """The error and every exception it was raised from"""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        yield error
+        error = error.__cause__ or error.__context__
+
+
+def status_code(error):
+    """HTTP status of a failed request, from the error or the exceptions behind it"""
+    for cause in _chain(error):
+        status = getattr(cause, "status_code", None)
+        if status is None and getattr(cause, "response", None) is not None:
+            status = getattr(cause.response, "status_code", None)
+        if status is None:
+            match = STATUS_PATTERN.search(str(cause))
+            status = int(match.group(1)) if match else None
+        if status is not None:
+            return status
+    return None
+
+
+def classify(error):
+    """TRANSIENT, THROTTLED, AUTH or FATAL"""
+    names = {type(cause).__name__ for cause in _chain(error)}
+    message = " ".join(str(cause) for cause in _chain(error)).lower()
+
+    if "LoginRequiredException" in names or "redirected to login" in message:
+        return AUTH
+    if "AbortDownloadException" in names or "QueryReturnedNotFoundException" in names:
+        return FATAL
+
+    status = status_code(error)
+    if status == 429 or "TooManyRequestsException" in names or "wait a few minutes" in message:
+        return THROTTLED
+    if status in (401, 403):
+        return AUTH
+    if status is not None and status >= 500:
+        return TRANSIENT
+    if status is not None and status != 200:
+        return FATAL
+    # Network errors (requests' are OSErrors), truncated JSON and instaloader's bare
+    # ConnectionExceptions are all worth another try
+    if isinstance(error, OSError) or names & {"JSONDecodeError", "ConnectionException"}:
+        return TRANSIENT
+    return FATAL
+
+
+class CircuitBreaker:
+    """
+    Stop after repeated auth failures
+
+    Opens after threshold consecutive auth failures and stays open, so every
+    caller sharing the session gives up with a partial result instead of
+    re-logging in over and over.
+    """
+
+    def __init__(self, threshold=3):
+        self.threshold = max(1, threshold)
+        self.failures = 0
+        self.is_open = False
+        self.lock = threading.Lock()
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+
+    def record_failure(self):
+        """Count an auth failure, returning True if the breaker is now open"""
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.is_open = True
+            return self.is_open
+
+    def trip(self):
+        """Open right away, e.g. when logging in again failed"""
+        with self.lock:
+            self.is_open = True
+
+    def reset(self):
+        with self.lock:
+            self.failures = 0
+            self.is_open = False
+
+
+class RetryPolicy:
+    """
+    Retry a single failing request in place
+
+    Transient errors and throttles are retried after a jittered exponential
+    delay (the scheduler's backoff for throttles), so a hiccup on page 300
+    costs seconds rather than the 299 pages before it. Auth errors are passed
+    to on_auth_error, which should re-login only if the session really
+    expired and return whether the request is worth retrying; if it can't
+    recover, the circuit breaker opens so nobody tries to log in again.
+    """
+
+    def __init__(self, attempts=3, base_delay=1.0, max_delay=60.0, scheduler=None, breaker=None,
+                 on_auth_error=None):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.scheduler = scheduler
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        self.on_auth_error = on_auth_error
+        self.local = threading.local()
+
+    def delay(self, attempt):
+        """Jittered exponential delay before the given retry (1 for the first)"""
+        delay = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        return random.uniform(delay / 2, delay)
+
+    def sleep(self, seconds):
+        if self.scheduler is not None:
+            self.scheduler.sleep(seconds, reason="backoff")
+        elif seconds > 0:
+            metrics.inc("sleep_seconds_total", seconds, reason="backoff")
+            time.sleep(seconds)
+
+    def call(self, function, *args, **kwargs):
+        """Call function, retrying it on failure; raises CircuitOpenError once the breaker is open"""
+        # Requests made while handling an auth error (e.g. verifying the session) are not retried
+        if getattr(self.local, "refreshing", False):
+            return function(*args, **kwargs)
+
+        attempt = 0
+        while True:
+            if self.breaker.is_open:
+                raise CircuitOpenError("Stopped after repeated authentication failures")
+            try:
+                result = function(*args, **kwargs)
+            except Exception as error:
+                kind = classify(error)
+                if kind == AUTH and self.breaker.record_failure():
+                    raise CircuitOpenError(f"Stopped after {self.breaker.failures} authentication failures "
+                                           f"in a row: {error}") from error
+                if kind == FATAL or attempt >= self.attempts:
+                    raise
+                attempt += 1
+
+                if kind == AUTH:
+                    if self.on_auth_error is None:
+                        raise
+                    self.local.refreshing = True
+                    try:
+                        retry = self.on_auth_error(error)
+                    finally:
+                        self.local.refreshing = False
+                    if not retry:
+                        self.breaker.trip()
+                        raise CircuitOpenError(f"Stopped after a failed login: {error}") from error
+                    metrics.inc("retries_total", reason="auth")
+                    continue
+
+                if kind == THROTTLED and self.scheduler is not None:
+                    delay = self.scheduler.backoff_delay()
+                else:
+                    delay = max(getattr(error, "retry_after", None) or 0, self.delay(attempt))
+                metrics.inc("retries_total", reason=kind)
+                self.sleep(delay)
+            else:
+                self.breaker.record_success()
+                return result
+
+
+def wrap_instaloader(context, policy):
+    """
+    Retry each of instaloader's requests in place with policy
+
+    Left alone, instaloader retries a failed request immediately and then
+    raises out of the NodeIterator, losing the crawl's position. With
+    max_connection_attempts=1 every failure goes to the policy instead.
+    Throttles are still reported to the policy's scheduler so it slows down.
+    """
+    get_json = context.get_json
+    context.max_connection_attempts = 1
+
+    def attempt(*args, **kwargs):
+        try:
+            return get_json(*args, **kwargs)
+        except Exception as error:
+            if policy.scheduler is not None and classify(error) == THROTTLED:
+                policy.scheduler.on_throttle(getattr(error, "retry_after", None))
+            raise
+
+    def retried_get_json(*args, **kwargs):
+        return policy.call(attempt, *args, **kwargs)
+
+    context.get_json = retried_get_json
+    return context
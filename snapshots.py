@@ -0,0 +1,190 @@
+"""
+Follower snapshots stored as deltas against a sorted id index
+"""
+
+import bisect, datetime, json, os, shutil
+from array import array
+
+import output, user_table
+
+SNAPSHOT_DIR = ".snapshots"
+FULL_EVERY = 7  # Keep a full copy of every 7th snapshot, deltas in between
+
+
+def merge_diff(old_ids, new_ids):
+    """
+    Compare two sorted id sequences in a single pass
+
+    Returns (added, lost, unchanged): positions in new_ids that are new,
+    positions in old_ids that are gone, and the number of ids in both.
+    """
+    added, lost = [], []
+    unchanged = 0
+    i = j = 0
+    while i < len(old_ids) and j < len(new_ids):
+        if old_ids[i] == new_ids[j]:
+            unchanged += 1
+            i += 1
+            j += 1
+        elif old_ids[i] < new_ids[j]:
+            lost.append(i)
+            i += 1
+        else:
+            added.append(j)
+            j += 1
+    lost.extend(range(i, len(old_ids)))
+    added.extend(range(j, len(new_ids)))
+    return added, lost, unchanged
+
+
+def now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+class SnapshotStore:
+    """
+    History of one account's followers (or followees)
+
+    A snapshot is just a sorted array of user ids, 8 bytes per follower;
+    the users themselves are kept once in the shared UserTable of the
+    snapshot directory, however many snapshots, accounts and edges they
+    appear in. A new crawl is diffed against the latest id index in one
+    linear merge, and only the delta (ids of new and lost followers) is
+    added to the history. Every `full_every` snapshots a full copy of the
+    index is kept as well, so history never depends on an unbounded chain
+    of deltas.
+
+    Layout of .snapshots/USERNAME_followers/:
+        manifest.json         every snapshot with its counts and files
+        current.ids           sorted ids of the latest snapshot
+        000042.delta.json     ids added/lost by snapshot 42
+        000042.full.ids       full copy of snapshot 42 (periodic)
+    """
+
+    def __init__(self, username, edge="followers", directory=SNAPSHOT_DIR, full_every=FULL_EVERY, keep_urls=False):
+        self.username = username
+        self.edge = edge
+        self.full_every = max(1, full_every)
+        self.path = os.path.join(directory, f"{username}_{edge}")
+        self.manifest_path = os.path.join(self.path, "manifest.json")
+        self.ids_path = os.path.join(self.path, "current.ids")
+        self.users = user_table.shared(directory, keep_urls=keep_urls)
+
+        self.snapshots = []
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                self.snapshots = json.load(f).get("snapshots", [])
+
+    def read_ids(self, filename="current.ids"):
+        """Sorted ids of the latest snapshot, or of a full copy"""
+        path = os.path.join(self.path, filename)
+        ids = array("q")
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                ids.fromfile(f, os.path.getsize(path) // ids.itemsize)
+        return ids
+
+    def current_ids(self):
+        return self.read_ids()
+
+    def contains(self, user_id, ids=None):
+        """True if user_id was a follower in the latest snapshot"""
+        ids = self.current_ids() if ids is None else ids
+        user_id = int(user_id)
+        i = bisect.bisect_left(ids, user_id)
+        return i < len(ids) and ids[i] == user_id
+
+    def record(self, records, timestamp=None):
+        """
+        Add a new crawl to the history
+
+        records is any iterable of export records with an id; records
+        without one cannot be tracked and are skipped. Returns the manifest
+        entry, with the added and lost records attached.
+        """
+        timestamp = timestamp or now()
+
+        # Sorting the ids also drops followers a resumed crawl saw twice
+        new_ids = array("q", sorted({self.users.upsert(record) for record in records if record.get("id") is not None}))
+        self.users.save()
+
+        old_ids = self.current_ids()
+        first = not self.snapshots
+        added, lost, unchanged = merge_diff(old_ids, new_ids)
+        added_ids = [new_ids[j] for j in added]
+        lost_ids = [old_ids[i] for i in lost]
+
+        os.makedirs(self.path, exist_ok=True)
+        seq = self.snapshots[-1]["seq"] + 1 if self.snapshots else 1
+        entry = {
+            "seq": seq,
+            "timestamp": timestamp.isoformat(),
+            "count": len(new_ids),
+            "added": len(added_ids),
+            "lost": len(lost_ids),
+            "unchanged": unchanged,
+            "delta": None,
+            "full": None,
+        }
+
+        # The first snapshot has nothing to be a delta against
+        if not first:
+            entry["delta"] = f"{seq:06d}.delta.json"
+            self._write_json(os.path.join(self.path, entry["delta"]), {
+                "seq": seq,
+                "timestamp": entry["timestamp"],
+                "added": added_ids,
+                "lost": lost_ids,
+            })
+
+        with output.replacing(self.ids_path) as ids_tmp:
+            with open(ids_tmp, "wb") as f:
+                new_ids.tofile(f)
+
+        last_full = max((s["seq"] for s in self.snapshots if s.get("full")), default=None)
+        if last_full is None or seq - last_full >= self.full_every:
+            entry["full"] = f"{seq:06d}.full.ids"
+            shutil.copyfile(self.ids_path, os.path.join(self.path, entry["full"]))
+
+        self.snapshots.append(entry)
+        self._write_json(self.manifest_path, {
+            "username": self.username,
+            "edge": self.edge,
+            "snapshots": self.snapshots,
+        })
+
+        return dict(entry, added_records=[self.users.get(user_id) for user_id in added_ids],
+                    lost_records=[self.users.get(user_id) for user_id in lost_ids])
+
+    def changes_since(self, since):
+        """
+        Net new and lost followers over every snapshot taken after `since`
+
+        Only the delta files in that window are read. A follower who left
+        and came back (or the other way round) cancels out.
+        """
+        added, lost = set(), set()
+        for entry in self.snapshots:
+            if not entry.get("delta") or datetime.datetime.fromisoformat(entry["timestamp"]) <= since:
+                continue
+
+            with open(os.path.join(self.path, entry["delta"]), "r", encoding="utf-8") as f:
+                delta = json.load(f)
+            for user_id in delta["added"]:
+                if user_id in lost:
+                    lost.discard(user_id)
+                else:
+                    added.add(user_id)
+            for user_id in delta["lost"]:
+                if user_id in added:
+                    added.discard(user_id)
+                else:
+                    lost.add(user_id)
+
+        return ([self.users.get(user_id) for user_id in sorted(added)],
+                [self.users.get(user_id) for user_id in sorted(lost)])
+
+    def _write_json(self, path, data):
+        with output.replacing(path) as tmp_path:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
@@ -0,0 +1,48 @@
+"""
+Shared fixtures: the mock Instagram server and an isolated working directory
+"""
+
+import os, sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import auth_cache, benchmark, metrics, mock_instagram, profile_cache, progress, transport  # noqa: E402
+
+FOLLOWERS = 600
+
+
+@pytest.fixture(scope="session")
+def mock():
+    """A mock Instagram with FOLLOWERS followers that every Instagram request is sent to"""
+    mock = mock_instagram.MockInstagram(followers=FOLLOWERS, following=40, posts=12)
+    server = mock_instagram.serve(mock)
+    transport.configure(base_url=mock_instagram.base_url(server))
+    benchmark.remove_instaloader_limits()
+    progress.configure(quiet=True)
+    yield mock
+    server.shutdown()
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Run in a temporary directory, with a logged-in session cache and a profile cache of its own"""
+    monkeypatch.chdir(tmp_path)
+    auth = auth_cache.AuthCache(path=str(tmp_path / "auth.json"))
+    auth.store(benchmark.SESSION_COOKIES, mock_instagram.VIEWER_USERNAME)
+    monkeypatch.setattr(auth_cache, "_shared", auth)
+    monkeypatch.setattr(profile_cache, "_shared", profile_cache.ProfileCache(path=str(tmp_path / "profiles.json")))
+    metrics.registry.reset()
+    return tmp_path
+
+
+@pytest.fixture
+def exporter(mock, workdir):
+    """A logged-in exporter of the mock target that never waits for the rate scheduler"""
+    from main import InstaFollowers
+    from rate_scheduler import AdaptiveScheduler
+
+    exporter = InstaFollowers(mock_instagram.TARGET_USERNAME, scheduler=AdaptiveScheduler(rate=1000, burst=1000))
+    assert exporter.login()
+    return exporter
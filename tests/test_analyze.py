@@ -0,0 +1,69 @@
+import json
+
+import analyze
+from analyze import FANS, MUTUALS, UNRETURNED, SortedRuns, merge_join
+
+
+def sorted_runs(directory, name, ids, max_bytes):
+    runs = SortedRuns(str(directory), name, max_bytes)
+    for user_id in ids:
+        runs.add({"id": str(user_id), "username": f"user{user_id}"})
+    return runs
+
+
+def test_spilled_runs_merge_in_order(tmp_path):
+    ids = [7, 3, 9, 1, 3, 8, 2, 9, 5]
+    # A cap below one entry spills every record to a run of its own
+    runs = sorted_runs(tmp_path, "followers", ids, max_bytes=1)
+    assert len(runs.runs) == len(ids)
+
+    merged = list(runs)
+    assert [user_id for user_id, line in merged] == sorted(set(ids))
+    assert json.loads(merged[0][1]) == {"id": "1", "username": "user1"}
+
+
+def test_records_without_id_are_skipped(tmp_path):
+    runs = SortedRuns(str(tmp_path), "followers", 1 << 20)
+    runs.add({"username": "anonymous"})
+    runs.add({"id": 4, "username": "user4"})
+    assert (runs.count, runs.skipped, runs.runs) == (1, 1, [])
+    assert [user_id for user_id, line in runs] == [4]
+
+
+def test_merge_join_with_spilled_runs(tmp_path):
+    followers = sorted_runs(tmp_path, "followers", [5, 1, 3, 8, 10, 4], max_bytes=300)
+    following = sorted_runs(tmp_path, "following", [2, 3, 9, 4, 10, 11], max_bytes=300)
+    assert followers.runs and following.runs
+
+    joined = {}
+    for name, line in merge_join(followers, following):
+        joined.setdefault(name, []).append(int(json.loads(line)["id"]))
+    assert joined == {
+        MUTUALS: [3, 4, 10],
+        FANS: [1, 5, 8],
+        UNRETURNED: [2, 9, 11],
+    }
+
+
+def test_merge_join_with_one_side_empty():
+    followers = [(1, b"a\n"), (2, b"b\n")]
+    assert list(merge_join(followers, [])) == [(FANS, b"a\n"), (FANS, b"b\n")]
+    assert list(merge_join([], followers)) == [(UNRETURNED, b"a\n"), (UNRETURNED, b"b\n")]
+
+
+def test_analyze_exports(workdir):
+    import metrics
+    from ndjson_writer import NDJSONWriter, read_ndjson
+    from progress import QuietConsole
+
+    for name, ids in (("followers", range(0, 300)), ("following", range(200, 350))):
+        with NDJSONWriter(f"{name}.ndjson") as writer:
+            for user_id in ids:
+                writer.write({"id": user_id, "username": f"user{user_id}"})
+
+    # A cap of a few kilobytes sends both sides through spilled runs
+    counts = analyze.analyze("followers.ndjson", "following.ndjson", "out", max_memory=0.01, console=QuietConsole())
+    assert counts == {MUTUALS: 100, FANS: 200, UNRETURNED: 50}
+    assert metrics.registry.value("analyze_spilled_bytes_total") > 0
+    mutuals = [record["id"] for record in read_ndjson("out/mutuals.ndjson") if "id" in record]
+    assert mutuals == list(range(200, 300))
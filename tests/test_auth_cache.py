@@ -0,0 +1,50 @@
+import os, stat, time
+
+import auth_cache, benchmark, mock_instagram
+from auth_cache import AuthCache
+
+
+def test_store_and_load(tmp_path):
+    path = str(tmp_path / "auth.json")
+    AuthCache(path).store({"sessionid": "abc", "csrftoken": "def"}, "someone")
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+
+    cache = AuthCache(path, ttl=60)
+    assert cache.load() and cache.is_fresh()
+    assert cache.username == "someone" and cache.cookies["sessionid"] == "abc"
+
+
+def test_freshness(tmp_path):
+    path = str(tmp_path / "auth.json")
+    cache = AuthCache(path, ttl=60)
+    cache.store({"csrftoken": "def"}, "someone")
+    assert not cache.is_fresh()  # No session cookie
+
+    cache.store({"sessionid": "abc"}, "someone")
+    cache.verified_at = time.time() - 61
+    assert not cache.is_fresh()
+
+    cache.verified_at = time.time()
+    cache.invalidate()
+    assert not AuthCache(path).is_fresh()
+    cache.clear()
+    assert not os.path.exists(path) and not AuthCache(path).load()
+
+
+def login(mock):
+    from main import InstaFollowers
+
+    requests = mock.requests
+    assert InstaFollowers(mock_instagram.TARGET_USERNAME).login()
+    return mock.requests - requests
+
+
+def test_fresh_session_is_used_without_requests(mock, workdir):
+    assert login(mock) == 0
+
+
+def test_stale_session_is_verified_once(mock, workdir):
+    auth = auth_cache.shared()
+    auth.verified_at = time.time() - auth.ttl - 1
+    assert login(mock) == 1
+    assert auth.is_fresh() and auth.cookies["sessionid"] == benchmark.SESSION_COOKIES["sessionid"]
@@ -0,0 +1,53 @@
+import json, os
+
+from rich.console import Console
+
+import avatars, mock_instagram, output
+from ndjson_writer import NDJSONWriter
+
+USERS = 200
+
+
+def write_exports():
+    with NDJSONWriter("followers.ndjson") as writer:
+        for index in range(USERS):
+            writer.write(mock_instagram.synthetic_user(index))
+    # Overlapping records in a nested JSON export, one with a fresh signature and one the CDN doesn't know
+    following = [mock_instagram.synthetic_user(index) for index in range(USERS - 10, USERS + 10)]
+    following[0]["profile_pic_url"] = following[0]["profile_pic_url"].split("?")[0] + "?oh=new"
+    following.append({"profile_pic_url": "https://scontent.cdninstagram.com/v/t51.2885-19/missing.jpg?oh=1"})
+    output.write_json("following.json", {"followers_count": 0, "following": following})
+    return ["followers.ndjson", "following.json"]
+
+
+def test_media_key_ignores_the_signature():
+    url = mock_instagram.profile_pic_url(123)
+    assert avatars.media_key(url) == avatars.media_key(url.split("?")[0] + "?oh=other")
+
+
+def test_sync_downloads_each_picture_once(mock, workdir):
+    exports = write_exports()
+    console = Console(quiet=True)
+    counts = avatars.sync(exports, "avatars", concurrency=4, console=console)
+    # Users share AVATAR_VARIANTS distinct pictures, which are stored once each
+    assert counts == {"downloaded": mock_instagram.AVATAR_VARIANTS,
+                      "deduplicated": USERS + 10 - mock_instagram.AVATAR_VARIANTS, "cached": 0, "failed": 1}
+    objects = [name for _, _, names in os.walk("avatars/objects") for name in names]
+    assert len(objects) == mock_instagram.AVATAR_VARIANTS
+
+    store = avatars.AvatarStore("avatars")
+    url = mock_instagram.profile_pic_url(mock_instagram.FIRST_USER_ID + 5)
+    with open(store.path_for(url), "rb") as f:
+        assert f.read() == mock_instagram.avatar_body(mock_instagram.FIRST_USER_ID + 5)
+    store.close()
+
+    # Running again only retries what failed
+    assert avatars.sync(exports, "avatars", console=console) == \
+        {"downloaded": 0, "deduplicated": 0, "cached": USERS + 10, "failed": 1}
+
+
+def test_index_stops_at_a_torn_line(tmp_path):
+    entry = {"key": "/a.jpg", "sha256": "ab", "size": 1, "path": "objects/ab/ab.jpg"}
+    with open(tmp_path / avatars.INDEX_FILE, "w", encoding="utf-8") as f:
+        f.write(json.dumps(entry) + "\n" + '{"key": "/b.j')
+    assert list(avatars.read_index(str(tmp_path))) == ["/a.jpg"]
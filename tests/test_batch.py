@@ -0,0 +1,34 @@
+import json
+
+import mock_instagram
+from batch import BatchExporter, output_path, read_targets
+from ndjson_writer import read_ndjson
+
+from conftest import FOLLOWERS
+
+
+def test_read_targets(tmp_path):
+    path = tmp_path / "targets.txt"
+    path.write_text("# accounts\n@alice\n\nbob\nalice\n  carol  \n")
+    assert read_targets(str(path)) == ["alice", "bob", "carol"]
+
+
+def test_output_path():
+    assert output_path("alice", "ndjson", "out", "gzip").replace("\\", "/") == "out/alice_followers.ndjson.gz"
+
+
+def test_batch_shares_one_session(exporter):
+    batch = BatchExporter(exporter, workers=2, output_format="ndjson", output_dir="exports")
+    results = batch.run(["no_such_user", mock_instagram.TARGET_USERNAME])
+
+    # Results come back in the order the targets were given
+    assert [(result["username"], result["success"]) for result in results] == \
+        [("no_such_user", False), (mock_instagram.TARGET_USERNAME, True)]
+    assert len(list(read_ndjson(results[1]["output"]))) == FOLLOWERS
+    assert results[0]["error"]
+    # Every worker drew from the primary exporter's scheduler
+    assert exporter.scheduler.requests >= FOLLOWERS // 50
+
+    with open(batch.save_summary(), encoding="utf-8") as f:
+        summary = json.load(f)
+    assert (summary["accounts"], summary["succeeded"], summary["records"]) == (2, 1, FOLLOWERS)
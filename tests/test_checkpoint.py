@@ -0,0 +1,105 @@
+import time
+
+import pytest
+
+from checkpoint import Checkpoint
+from ndjson_writer import read_ndjson
+
+from conftest import FOLLOWERS
+
+
+class Interrupted(Exception):
+    pass
+
+
+def interrupt_after(commits, error=Interrupted):
+    """An on_checkpoint hook that stops the crawl at its commits-th checkpoint"""
+    seen = []
+
+    def on_checkpoint(checkpoint):
+        seen.append(checkpoint.records_written)
+        if len(seen) >= commits:
+            raise error("interrupted")
+    return on_checkpoint
+
+
+def exported_ids(filename):
+    return [record["id"] for record in read_ndjson(filename) if "id" in record]
+
+
+def test_save_and_load(workdir):
+    checkpoint = Checkpoint("someone", directory=".checkpoints")
+    checkpoint.commit(end_cursor="abc", records_written=120, output="out.ndjson", output_offset=4096)
+
+    loaded = Checkpoint("someone", directory=".checkpoints")
+    assert loaded.load()
+    assert loaded.to_dict() == checkpoint.to_dict()
+    assert loaded.is_resumable
+
+    # A checkpoint only applies to its own target and edge
+    assert not Checkpoint("someone", "following", directory=".checkpoints").load()
+    assert not Checkpoint("someone", "following", directory=".checkpoints").restore(checkpoint.to_dict())
+    assert not Checkpoint("someone else", directory=".checkpoints").load()
+
+
+def test_frozen_iterator_expires(workdir):
+    checkpoint = Checkpoint("someone", directory=None)
+    checkpoint.commit(frozen={"best_before": time.time() + 60, "remaining_data": {
+        "page_info": {"end_cursor": "next", "has_next_page": True}}})
+    assert checkpoint.is_resumable
+    assert checkpoint.end_cursor == "next"
+
+    checkpoint.commit(frozen={"best_before": time.time() - 1})
+    assert not checkpoint.is_resumable
+
+
+def test_unsaved_commit_leaves_file_alone(workdir):
+    checkpoint = Checkpoint("someone", directory=".checkpoints")
+    checkpoint.commit(end_cursor="first", records_written=50)
+    checkpoint.commit(end_cursor="second", records_written=100, save=False)
+
+    loaded = Checkpoint("someone", directory=".checkpoints")
+    loaded.load()
+    assert loaded.end_cursor == "first"
+
+
+def test_resume_frozen_crawl(exporter):
+    """An interrupted instaloader crawl resumes from its frozen iterator without gaps or duplicates"""
+    exporter.on_checkpoint = interrupt_after(3)
+    assert not exporter.export(output_format="ndjson", output="followers.ndjson")
+
+    checkpoint = Checkpoint(exporter.username)
+    assert checkpoint.load() and checkpoint.frozen is not None
+    assert 0 < checkpoint.records_written < FOLLOWERS
+
+    exporter.on_checkpoint = None
+    assert exporter.export(output_format="ndjson", output="followers.ndjson", resume=True)
+    ids = exported_ids("followers.ndjson")
+    assert len(ids) == len(set(ids)) == FOLLOWERS
+    assert not Checkpoint(exporter.username).load()
+
+
+def test_resume_direct_crawl(exporter):
+    """The direct API route resumes from the end_cursor it committed"""
+    import mock_instagram
+    from job_queue import LeaseLost
+    from ndjson_writer import NDJSONWriter
+
+    checkpoint = Checkpoint(exporter.username)
+    exporter.on_checkpoint = interrupt_after(4, LeaseLost)
+    writer = NDJSONWriter("followers.ndjson", resumable=True)
+    # LeaseLost is the one error the direct route must not swallow
+    with pytest.raises(LeaseLost):
+        exporter.try_direct_api_request(mock_instagram.TARGET_ID, writer=writer, checkpoint=checkpoint)
+    writer.abort()
+    # Only the checkpoints the hook accepted were saved
+    assert checkpoint.load() and checkpoint.records_written == 150
+
+    exporter.on_checkpoint = None
+    writer = NDJSONWriter("followers.ndjson", resume_offset=checkpoint.output_offset,
+                          resume_count=checkpoint.records_written)
+    data = exporter.try_direct_api_request(mock_instagram.TARGET_ID, writer=writer, checkpoint=checkpoint)
+    writer.close()
+    assert data["exported"] == FOLLOWERS
+    ids = exported_ids("followers.ndjson")
+    assert len(ids) == len(set(ids)) == FOLLOWERS
@@ -0,0 +1,49 @@
+import json, sqlite3, sys
+
+import pytest
+
+import main, mock_instagram
+from graphql_paginator import node_to_record, parse_fields
+from snapshots import SnapshotStore
+
+from conftest import FOLLOWERS
+
+NODE = {"id": "42", "username": "someone", "full_name": "Some One", "is_private": False, "is_verified": True,
+        "profile_pic_url": "https://scontent.cdninstagram.com/v/t51.2885-19/42_1_n.jpg?sig=1"}
+
+
+def test_parse_fields():
+    assert parse_fields("id, username,is_verified,id") == ("id", "username", "is_verified")
+    with pytest.raises(ValueError):
+        parse_fields("id,nonsense")
+
+
+def test_node_to_record_projects_fields():
+    assert node_to_record(NODE, ("id", "username")) == {"id": 42, "username": "someone"}
+
+
+def run_main(monkeypatch, *args):
+    # The mock has no rate limit to respect
+    monkeypatch.setattr(main, "DOCUMENTED_RATE", 1000.0)
+    monkeypatch.setattr(sys, "argv", ["main.py", "-u", mock_instagram.TARGET_USERNAME, "--quiet",
+                                      "--rate", "1000", "--burst", "1000"] + list(args))
+    main.main()
+
+
+def test_fields_with_snapshot_and_db(mock, workdir, monkeypatch):
+    """Records without full_name still reach the snapshot history and the database"""
+    run_main(monkeypatch, "--fields", "id,username", "--snapshot", "--db", "history.db",
+             "--output", "followers.json")
+
+    with open("followers.json", encoding="utf-8") as f:
+        followers = json.load(f)["followers"]
+    assert len(followers) == FOLLOWERS and set(followers[0]) == {"id", "username"}
+
+    store = SnapshotStore(mock_instagram.TARGET_USERNAME)
+    assert [entry["count"] for entry in store.snapshots] == [FOLLOWERS]
+    user = store.users.get(followers[0]["id"])
+    assert user["username"] == followers[0]["username"] and user["full_name"] == ""
+
+    with sqlite3.connect("history.db") as db:
+        assert db.execute("SELECT count FROM snapshots").fetchall() == [(FOLLOWERS,)]
+        assert db.execute("SELECT count(*) FROM users WHERE full_name IS NULL").fetchone()[0] == FOLLOWERS
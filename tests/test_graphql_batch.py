@@ -0,0 +1,81 @@
+import asyncio, json
+
+import pytest
+
+import benchmark, mock_instagram
+from graphql_batch import AiohttpClient, GraphQLBatch, ThreadedClient, read_specs
+from ndjson_writer import read_ndjson
+from rate_scheduler import AdaptiveScheduler
+
+from conftest import FOLLOWERS
+
+CLIENTS = {"aiohttp": AiohttpClient, "threads": ThreadedClient}
+
+
+def write_specs(path, *outputs):
+    with open(path, "w", encoding="utf-8") as f:
+        for name in outputs:
+            spec = {"query_hash": mock_instagram.FOLLOWERS_QUERY_HASH, "output": name,
+                    "format": name.rsplit(".", 1)[-1],
+                    "variables": {"id": str(mock_instagram.TARGET_ID), "first": 50}}
+            f.write(json.dumps(spec) + "\n")
+    return str(path)
+
+
+def run(client_class, specs):
+    batch = GraphQLBatch(client_class(benchmark.SESSION_COOKIES), AdaptiveScheduler(rate=1000, burst=1000))
+    batch.policy.base_delay = 0.01
+    return asyncio.run(batch.run(specs))
+
+
+def test_read_specs(tmp_path):
+    path = tmp_path / "specs.jsonl"
+    path.write_text('# comment\n\n{"query_hash": "abc", "variables": "{\\"id\\": \\"1\\"}", "format": "ndjson"}\n')
+    [spec] = read_specs(str(path), compression="gzip")
+    assert spec["variables"] == {"id": "1"}
+    assert spec["output"] == "abc_1.ndjson.gz" and spec["compression"] == "gzip"
+
+    path.write_text('{"variables": {}}\n')
+    with pytest.raises(ValueError, match="specs.jsonl:1"):
+        read_specs(str(path))
+
+
+@pytest.mark.parametrize("client", CLIENTS)
+def test_batch_writes_every_spec(client, mock, workdir):
+    specs = read_specs(write_specs(workdir / "specs.jsonl", "a.json", "b.ndjson"))
+    results = run(CLIENTS[client], specs)
+    assert sorted((result["output"], result["success"], result["nodes"]) for result in results) == \
+        [("a.json", True, FOLLOWERS), ("b.ndjson", True, FOLLOWERS)]
+
+    with open("a.json", encoding="utf-8") as f:
+        assert len(json.load(f)["nodes"]) == FOLLOWERS
+    assert len(list(read_ndjson("b.ndjson"))) == FOLLOWERS
+
+
+@pytest.mark.parametrize("client", CLIENTS)
+def test_transient_errors_are_retried(client, mock, workdir, monkeypatch):
+    monkeypatch.setattr(mock, "fail_503", 0.2)
+    injected = mock.injected[503]
+    specs = read_specs(write_specs(workdir / "specs.jsonl", "a.ndjson"))
+    [result] = run(CLIENTS[client], specs)
+    assert result["success"], result["error"]
+    assert mock.injected[503] > injected
+    assert len(list(read_ndjson("a.ndjson"))) == FOLLOWERS
+
+
+def test_unwritable_output_fails_only_its_spec(mock, workdir):
+    specs = read_specs(write_specs(workdir / "specs.jsonl", "missing/a.ndjson", "b.ndjson"))
+    results = {result["output"]: result for result in run(ThreadedClient, specs)}
+    assert not results["missing/a.ndjson"]["success"]
+    assert results["b.ndjson"]["success"]
+
+
+def test_aiohttp_network_errors_are_transient(mock, workdir, monkeypatch):
+    import transport
+
+    # Nothing listens there: every request fails to connect, is retried and finally reported
+    monkeypatch.setattr(transport, "_base_url", "http://127.0.0.1:9")
+    specs = read_specs(write_specs(workdir / "specs.jsonl", "a.json"))
+    [result] = run(AiohttpClient, specs)
+    assert not result["success"] and "ConnectionError" not in result["error"]
+    assert result["error"].startswith("ClientConnectorError")
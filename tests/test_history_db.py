@@ -0,0 +1,51 @@
+import pytest
+
+from history_db import HistoryDB
+
+
+def user(user_id, **fields):
+    record = {"id": user_id, "username": f"user{user_id}", "full_name": f"User {user_id}"}
+    record.update(fields)
+    return record
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = HistoryDB(str(tmp_path / "history.db"))
+    yield db
+    db.close()
+
+
+def test_snapshots_track_first_and_last_seen(db):
+    db.record_snapshot("acct", [user(1), user(2), {"username": "no id"}], taken_at="2024-01-01T00:00:00")
+    db.record_snapshot("acct", (user(n) for n in (2, 3)), taken_at="2024-02-01T00:00:00")
+
+    assert [tuple(row) for row in db.history("acct")] == [("2024-01-01T00:00:00", 2), ("2024-02-01T00:00:00", 2)]
+    assert sorted(row["id"] for row in db.current("acct")) == [2, 3]
+    [gone] = db.lost("acct")
+    assert (gone["id"], gone["last_seen"]) == (1, "2024-01-01T00:00:00")
+    assert db.lost("acct", since="2024-01-15") == []
+
+    row = db.first_seen("acct", "user2")
+    assert (row["first_seen"], row["last_seen"]) == ("2024-01-01T00:00:00", "2024-02-01T00:00:00")
+    assert db.first_seen("acct", "user2", edge="following") is None
+
+
+def test_missing_fields_keep_stored_values(db):
+    db.record_user(user(1, is_verified=True))
+    db.record_snapshot("acct", [{"id": 1, "username": "renamed"}])
+    [row] = db.current("acct")
+    assert (row["username"], row["full_name"], row["is_verified"]) == ("renamed", "User 1", 1)
+
+
+def test_large_snapshots_are_batched(db):
+    snapshot_id = db.record_snapshot("acct", (user(n) for n in range(2500)))
+    assert db.latest_snapshot("acct") == snapshot_id
+    assert len(db.current("acct")) == 2500
+
+
+def test_posts_are_upserted(db):
+    post = {"shortcode": "abc", "date": "2024-01-01", "likes": 1, "comments": 0, "type": "image"}
+    db.record_posts("acct", [post])
+    db.record_posts("acct", [dict(post, likes=5)])
+    assert [tuple(row) for row in db.conn.execute("SELECT likes FROM posts")] == [(5,)]
@@ -0,0 +1,144 @@
+import os, time
+
+import pytest
+
+import mock_instagram
+from checkpoint import Checkpoint
+from job_queue import JobQueue, QueueWorker
+from ndjson_writer import read_ndjson
+
+from conftest import FOLLOWERS
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    yield queue
+    queue.close()
+
+
+def expire(queue, job_id):
+    """Backdate a lease as if its worker had stopped sending heartbeats"""
+    with queue.conn:
+        queue.conn.execute("UPDATE jobs SET lease_until = ? WHERE id = ?", (time.time() - 1, job_id))
+
+
+def test_targets_are_queued_once(queue):
+    assert queue.add("alice")
+    assert not queue.add("alice")
+    assert queue.add("bob")
+    with pytest.raises(ValueError):
+        queue.add("alice", "following")
+    assert queue.stats() == {"pending": 2}
+
+
+def test_claims_in_order_until_empty(queue):
+    queue.add("alice")
+    queue.add("bob")
+    assert queue.claim("a")["target"] == "alice"
+    assert queue.claim("b")["target"] == "bob"
+    assert queue.claim("c") is None
+
+
+def test_expired_lease_is_reclaimed_with_its_checkpoint(queue):
+    queue.add("alice")
+    job = queue.claim("a", lease=60)
+    checkpoint = Checkpoint("alice", directory=None)
+    checkpoint.commit(end_cursor="cursor-2", records_written=100, output="alice.part", output_offset=2048)
+    assert queue.heartbeat(job["id"], "a", 60, checkpoint.to_dict(), 100)
+
+    # A live lease is not handed out again
+    assert queue.claim("b") is None
+    expire(queue, job["id"])
+    taken = queue.claim("b", lease=60)
+    assert (taken["id"], taken["attempts"]) == (job["id"], 2)
+    assert taken["checkpoint"]["end_cursor"] == "cursor-2"
+
+    # The first worker finds out at its next heartbeat and can't finish the job any more
+    assert not queue.heartbeat(job["id"], "a", 60)
+    assert not queue.complete(job["id"], "a", 100, "alice.ndjson")
+    assert queue.complete(job["id"], "b", 300, "alice.ndjson")
+    assert queue.stats() == {"done": 1}
+
+
+def test_failures_retry_up_to_max_attempts(queue):
+    queue.add("alice")
+    for attempt in range(1, 3):
+        job = queue.claim("a", max_attempts=2)
+        assert job["attempts"] == attempt
+        assert queue.fail(job["id"], "a", "boom", max_attempts=2)
+    assert queue.stats() == {"failed": 1}
+    assert queue.claim("a", max_attempts=2) is None
+
+
+def test_expired_leases_give_up_after_max_attempts(queue):
+    queue.add("alice")
+    for _ in range(2):
+        expire(queue, queue.claim("a", max_attempts=2)["id"])
+    assert queue.claim("a", max_attempts=2) is None
+    assert queue.stats() == {"failed": 1}
+
+
+def batch_exporter(exporter, output_dir):
+    from batch import BatchExporter
+
+    return BatchExporter(exporter, output_format="ndjson", output_dir=output_dir)
+
+
+def test_worker_exports_queued_job(exporter, queue):
+    queue.add(mock_instagram.TARGET_USERNAME)
+    worker = QueueWorker(queue, batch_exporter(exporter, "exports"), lease=30, until_empty=True)
+    results = worker.run()
+    assert [result["success"] for result in results] == [True]
+    ids = [record["id"] for record in read_ndjson(results[0]["output"]) if "id" in record]
+    assert len(ids) == len(set(ids)) == FOLLOWERS
+    assert queue.stats() == {"done": 1}
+
+
+def test_worker_that_lost_its_lease_stops(exporter, queue):
+    """A worker whose job was taken over stops at its first checkpoint without touching the job's state"""
+    queue.add(mock_instagram.TARGET_USERNAME)
+    job = queue.claim("stale", lease=30)
+    expire(queue, job["id"])
+    taken = queue.claim("current", lease=30)
+
+    os.makedirs("exports")
+    worker = QueueWorker(queue, batch_exporter(exporter, "exports"), lease=30)
+    result = worker.export(job, "stale")
+    assert not result["success"]
+    assert result["error"] == "lease lost"
+
+    # The stale worker neither saved a local checkpoint nor released the job
+    assert not os.path.exists(Checkpoint(mock_instagram.TARGET_USERNAME).path)
+    assert queue.heartbeat(taken["id"], "current", 30)
+    assert queue.stats() == {"leased": 1}
+
+
+def test_worker_that_lost_its_lease_at_completion_keeps_its_output(exporter, queue, monkeypatch):
+    """A job taken over between the last page and complete() is published by its new owner only"""
+    queue.add(mock_instagram.TARGET_USERNAME)
+    job = queue.claim("stale", lease=30)
+    complete = queue.complete
+    taken = []
+
+    def taken_over_first(job_id, owner, *args):
+        if owner == "stale":
+            expire(queue, job_id)
+            taken.append(queue.claim("current", lease=30))
+        return complete(job_id, owner, *args)
+
+    monkeypatch.setattr(queue, "complete", taken_over_first)
+    os.makedirs("exports")
+    worker = QueueWorker(queue, batch_exporter(exporter, "exports"), lease=30)
+    result = worker.export(job, "stale")
+    assert not result["success"] and result["output"] is None
+    filename = os.path.join("exports", f"{mock_instagram.TARGET_USERNAME}_followers.ndjson")
+    assert not os.path.exists(filename)
+    assert queue.stats() == {"leased": 1}
+
+    # The new owner carries on from the stale worker's finished file
+    result = worker.export(taken[0], "current")
+    assert result["success"] and result["output"] == filename
+    ids = [record["id"] for record in read_ndjson(filename) if "id" in record]
+    assert len(ids) == len(set(ids)) == FOLLOWERS
+    assert os.listdir("exports") == [os.path.basename(filename)]
@@ -0,0 +1,85 @@
+import json, urllib.request
+
+import pytest
+
+import metrics
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    """A fresh registry, with any metric a test registers forgotten afterwards"""
+    monkeypatch.setattr(metrics, "METRICS", dict(metrics.METRICS))
+    return metrics.Metrics()
+
+
+def test_counters_and_histograms(registry):
+    registry.inc("requests_total", status="200")
+    registry.inc("requests_total", 2, status="429")
+    registry.observe("request_seconds", 0.02)
+    registry.observe("request_seconds", 3.0)
+    assert registry.value("requests_total") == 3
+    assert registry.value("requests_total", status="429") == 2
+    assert registry.count("request_seconds") == 2
+    assert registry.value("request_seconds") == pytest.approx(3.02)
+
+    histogram = registry.snapshot()["histograms"]["request_seconds"]
+    assert histogram["max"] == 3.0
+    assert histogram["buckets"]["0.025"] == 1 and histogram["buckets"]["5.0"] == 1
+
+
+def test_timer_feeds_counters_and_histograms(registry):
+    with registry.timer("serialize_seconds_total", format="json"):
+        pass
+    with registry.timer("login_seconds"):
+        pass
+    assert registry.snapshot()["counters"]["serialize_seconds_total{format=\"json\"}"] >= 0
+    assert registry.count("login_seconds") == 1
+
+
+def test_prometheus_text(registry):
+    registry.inc("requests_total", status="200")
+    registry.observe("records_per_page", 50)
+    text = registry.prometheus()
+    assert "# HELP insta_requests_total HTTP requests sent, by status code" in text
+    assert "# TYPE insta_requests_total counter" in text
+    assert 'insta_requests_total{status="200"} 1' in text
+    assert "# TYPE insta_records_per_page histogram" in text
+    assert 'insta_records_per_page_bucket{le="50"} 1' in text
+    assert 'insta_records_per_page_bucket{le="+Inf"} 1' in text
+    assert "insta_records_per_page_count 1" in text
+    # Metrics without data are left out
+    assert "insta_logins_total" not in text
+
+
+def test_metrics_are_registered_on_first_use(registry):
+    registry.inc("made_up_total", kind="x")
+    registry.observe("made_up_seconds", 0.3)
+    text = registry.prometheus()
+    assert "# HELP insta_made_up_total" not in text
+    assert 'insta_made_up_total{kind="x"} 1' in text
+    assert "# TYPE insta_made_up_seconds histogram" in text
+    assert 'insta_made_up_seconds_bucket{le="0.5"} 1' in text
+
+
+def test_registered_help_and_buckets(registry):
+    metrics.register("page_bytes", "Bytes per page", (10, 100))
+    registry.observe("page_bytes", 42)
+    text = registry.prometheus()
+    assert "# HELP insta_page_bytes Bytes per page" in text
+    assert 'insta_page_bytes_bucket{le="100"} 1' in text
+
+
+def test_save_and_serve(registry, tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, "registry", registry)
+    registry.inc("records_total", 7, source="test")
+    registry.save(str(tmp_path / "metrics.json"))
+    with open(tmp_path / "metrics.json", encoding="utf-8") as f:
+        assert json.load(f)["counters"] == {'records_total{source="test"}': 7}
+
+    server = metrics.serve(0)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        with urllib.request.urlopen(url) as response:
+            assert 'insta_records_total{source="test"} 7' in response.read().decode("utf-8")
+    finally:
+        server.shutdown()
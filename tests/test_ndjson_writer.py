@@ -0,0 +1,51 @@
+import os
+
+import pytest
+
+from ndjson_writer import NDJSONWriter, part_path, read_ndjson
+
+
+def test_output_appears_only_when_closed(tmp_path):
+    filename = str(tmp_path / "out.ndjson")
+    writer = NDJSONWriter(filename, flush_every=1)
+    writer.write({"id": 1})
+    assert not os.path.exists(filename)
+    writer.close(username="someone")
+    assert list(read_ndjson(filename)) == [{"id": 1}]
+    assert os.listdir(tmp_path) == ["out.ndjson"]
+
+
+def test_aborted_output_has_no_summary(tmp_path):
+    filename = str(tmp_path / "out.ndjson.gz")
+    with pytest.raises(KeyboardInterrupt):
+        with NDJSONWriter(filename) as writer:
+            writer.write({"id": 1})
+            raise KeyboardInterrupt
+    assert list(read_ndjson(filename)) == [{"id": 1}]
+    assert b"_summary" not in open(filename, "rb").read()
+
+
+def test_resumable_output_is_kept_in_its_part_file(tmp_path):
+    filename = str(tmp_path / "out.ndjson")
+    writer = NDJSONWriter(filename, resumable=True)
+    writer.write({"id": 1})
+    offset = writer.tell()
+    writer.write({"id": 2})
+    writer.abort()
+    assert not os.path.exists(filename) and os.path.exists(part_path(filename))
+
+    # Resuming drops what was written after the checkpoint's offset
+    writer = NDJSONWriter(filename, resume_offset=offset, resume_count=1)
+    writer.write({"id": 3})
+    writer.close()
+    assert [record["id"] for record in read_ndjson(filename)] == [1, 3]
+    assert not os.path.exists(part_path(filename))
+
+
+def test_only_resumable_output_can_be_rewound(tmp_path):
+    with pytest.raises(ValueError):
+        NDJSONWriter(str(tmp_path / "out.ndjson.gz"), resumable=True)
+    writer = NDJSONWriter(str(tmp_path / "out.ndjson"))
+    with pytest.raises(ValueError):
+        writer.truncate()
+    writer.abort()
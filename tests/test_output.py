@@ -0,0 +1,73 @@
+import json, os
+
+import pytest
+
+import output
+
+
+def test_compression_from_flag_or_extension():
+    assert output.compression_for("a.json.gz") == "gzip"
+    assert output.compression_for("a.json.zst") == "zstd"
+    assert output.compression_for("a.json", "gzip") == "gzip"
+    assert output.compression_for("a.json") is None
+    assert output.with_extension("a.json", "zstd") == "a.json.zst"
+    assert output.with_extension("a.json.gz", "gzip") == "a.json.gz"
+
+
+def test_pretty_and_compact_encoding():
+    data = {"name": "Zoë", "big": 2 ** 70}
+    assert json.loads(output.dumps(data)) == data
+    assert b"\n    " in output.dumps(data)
+    # Integers wider than 64 bits fall back to the standard library when orjson is installed
+    assert output.dumps(data, compact=True) == '{"name":"Zoë","big":1180591620717411303424}'.encode("utf-8")
+    assert output.dumps_line({"id": 1}) == b'{"id":1}\n'
+
+
+@pytest.mark.parametrize("compression", [None, "gzip"])
+def test_write_and_read_json(tmp_path, compression):
+    filename = output.with_extension(str(tmp_path / "out.json"), compression)
+    output.write_json(filename, {"followers": [1, 2]}, compact=True, compression=compression)
+    assert output.read_json(filename) == {"followers": [1, 2]}
+    assert os.listdir(tmp_path) == [os.path.basename(filename)]
+
+
+def test_atomic_file_discard_leaves_the_old_file(tmp_path):
+    filename = str(tmp_path / "out.json")
+    output.write_json(filename, {"old": True})
+    with pytest.raises(RuntimeError):
+        with output.AtomicFile(filename) as f:
+            f.write(b"{")
+            raise RuntimeError
+    assert output.read_json(filename) == {"old": True}
+    assert os.listdir(tmp_path) == ["out.json"]
+
+
+def test_replacing(tmp_path):
+    path = str(tmp_path / "cache.json")
+    with output.replacing(path) as tmp:
+        assert tmp != path
+        with open(tmp, "w") as f:
+            f.write("new")
+    with pytest.raises(ValueError):
+        with output.replacing(path) as tmp:
+            open(tmp, "w").close()
+            raise ValueError
+    with open(path) as f:
+        assert f.read() == "new"
+    assert os.listdir(tmp_path) == ["cache.json"]
+
+
+def test_missing_zstandard_is_reported_up_front(monkeypatch):
+    import builtins
+
+    real_import = builtins.__import__
+
+    def no_zstandard(name, *args, **kwargs):
+        if name == "zstandard":
+            raise ImportError(name)
+        return real_import(name, *args, **kwargs)
+
+    monkeypatch.setattr(builtins, "__import__", no_zstandard)
+    with pytest.raises(RuntimeError, match="pip install zstandard"):
+        output.check_available("zstd")
+    output.check_available("gzip")
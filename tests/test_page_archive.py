@@ -0,0 +1,83 @@
+import json
+
+import pytest
+
+import mock_instagram, transport
+from graphql_paginator import FOLLOWERS_QUERY_HASH, GRAPHQL_URL, GraphQLPaginator, page_params
+from page_archive import ArchiveReader, PageArchive, scan_page_info
+
+from conftest import FOLLOWERS
+
+VARIABLES = {"id": str(mock_instagram.TARGET_ID), "first": 50}
+
+
+def page(has_next_page, end_cursor, count=3):
+    return json.dumps({"data": {"user": {"edge_followed_by": {
+        "count": count,
+        "page_info": {"has_next_page": has_next_page, "end_cursor": end_cursor},
+        "edges": [{"node": {"id": "1", "username": "someone"}}],
+    }}}, "status": "ok"}).encode("utf-8")
+
+
+@pytest.mark.parametrize("body, expected", [
+    (page(True, "QVFE"), (3, True, "QVFE")),
+    (page(False, None), (3, False, None)),
+    (page(True, 'with "quotes" and \\ backslash'), (3, True, 'with "quotes" and \\ backslash')),
+    # Pretty-printed bodies have whitespace between the keys
+    (json.dumps(json.loads(page(True, "abc")), indent=2).encode("utf-8"), (3, True, "abc")),
+])
+def test_scan_page_info(body, expected):
+    assert scan_page_info(body) == expected
+
+
+@pytest.mark.parametrize("body", [
+    b'{"data": {}}',
+    # Two pages' worth of page_info: the caller has to decode
+    page(True, "a")[:-1] + b', "more": ' + page(True, "b") + b"}",
+    # Keys in another order than Instagram's
+    b'{"page_info": {"end_cursor": "abc", "has_next_page": true}}',
+])
+def test_scan_page_info_gives_up(body):
+    assert scan_page_info(body) is None
+
+
+def test_scan_mock_pages(mock):
+    """Pages as the mock server sends them scan to the same values as decoding them"""
+    session = transport.get_session()
+    cursor = None
+    for _ in range(3):
+        response = session.get(GRAPHQL_URL, params=page_params(FOLLOWERS_QUERY_HASH, VARIABLES, 50, cursor),
+                               headers=transport.DEFAULT_HEADERS)
+        page_info = response.json()["data"]["user"]["edge_followed_by"]["page_info"]
+        count, has_next_page, cursor = scan_page_info(response.content)
+        assert count == FOLLOWERS
+        assert (has_next_page, cursor) == (page_info["has_next_page"], page_info["end_cursor"])
+
+
+def test_archive_and_replay(mock, workdir):
+    archive = PageArchive("archive", segment_size=20_000)
+    paginator = GraphQLPaginator(None, FOLLOWERS_QUERY_HASH, VARIABLES, archive=archive, decode=False)
+    assert list(paginator) == []
+    assert paginator.pages == FOLLOWERS // 50
+    assert archive.next_cursor(FOLLOWERS_QUERY_HASH, VARIABLES) == (False, None)
+    archive.close()
+
+    with ArchiveReader("archive") as reader:
+        entries = list(reader.pages(FOLLOWERS_QUERY_HASH, VARIABLES))
+        assert len(entries) == paginator.pages
+        assert len({entry["segment"] for entry in entries}) > 1
+        ids = [node["id"] for node in reader.nodes(FOLLOWERS_QUERY_HASH)]
+    assert len(ids) == len(set(ids)) == FOLLOWERS
+
+
+def test_torn_index_line_is_ignored(workdir):
+    archive = PageArchive("archive")
+    archive.append(page(True, "a"), FOLLOWERS_QUERY_HASH, VARIABLES, None, "a", True)
+    archive.close()
+    with open("archive/index.ndjson", "ab") as f:
+        f.write(b'{"query_hash": "cut short')
+
+    reopened = PageArchive("archive")
+    assert len(reopened.entries) == 1
+    assert reopened.next_cursor(FOLLOWERS_QUERY_HASH, {"id": VARIABLES["id"], "after": "x"}) == (True, "a")
+    reopened.close()
@@ -0,0 +1,85 @@
+import itertools, json, os, sys, threading
+
+import pytest
+
+import export, mock_instagram
+from prefetch import Prefetcher
+from rate_scheduler import AdaptiveScheduler
+
+from conftest import FOLLOWERS
+
+
+def pages(count, fetched):
+    for item in range(count):
+        fetched.append(item)
+        yield item
+
+
+@pytest.mark.parametrize("depth", [0, 2])
+def test_items_come_in_order(depth):
+    with Prefetcher(range(100), depth, page_size=10) as pipeline:
+        assert list(pipeline) == list(range(100))
+
+
+def test_producer_stays_within_depth():
+    fetched = []
+    with Prefetcher(pages(1000, fetched), depth=2, page_size=10) as pipeline:
+        next(pipeline)
+        pipeline.stopped.wait(0.2)
+        # One item taken, two pages queued and at most one more waiting to be queued
+        assert len(fetched) <= 22
+    assert not pipeline.thread.is_alive()
+
+
+def test_errors_are_raised_where_they_happened():
+    def failing():
+        yield 1
+        yield 2
+        raise ValueError("page 3")
+
+    with Prefetcher(failing(), depth=1, page_size=1) as pipeline:
+        assert next(pipeline) == 1
+        assert next(pipeline) == 2
+        with pytest.raises(ValueError, match="page 3"):
+            next(pipeline)
+
+
+def test_snapshots_are_taken_on_the_producer_thread():
+    threads = []
+
+    def snapshot():
+        threads.append(threading.current_thread().name)
+        return len(threads)
+
+    with Prefetcher(range(10), depth=1, page_size=2, snapshot=snapshot, snapshot_every=4) as pipeline:
+        states = [pipeline.state for _ in pipeline]
+    assert states == [None] * 4 + [1] + [None] * 3 + [2] + [None]
+    assert set(threads) == {"prefetch"}
+
+
+def test_islice_stops_without_fetching_past_the_limit():
+    fetched = []
+    with Prefetcher(itertools.islice(pages(1000, fetched), 5), depth=0) as pipeline:
+        assert list(pipeline) == [0, 1, 2, 3, 4]
+    assert fetched == [0, 1, 2, 3, 4]
+
+
+def test_user_command_is_paced_by_the_scheduler(mock, workdir, monkeypatch):
+    """export.py user drives instaloader through the adaptive scheduler, like main.py"""
+    schedulers = []
+
+    def scheduler():
+        schedulers.append(AdaptiveScheduler(rate=1000, burst=1000))
+        return schedulers[-1]
+
+    monkeypatch.setattr(export, "AdaptiveScheduler", scheduler)
+    monkeypatch.setattr(sys, "argv", ["export.py", "user", mock_instagram.TARGET_USERNAME, "--posts", "3"])
+    export.main()
+
+    directory = f"{mock_instagram.TARGET_USERNAME}_data"
+    followers = [name for name in os.listdir(directory) if name.startswith("followers")]
+    with open(os.path.join(directory, followers[0]), encoding="utf-8") as f:
+        assert len(json.load(f)["followers"]) == FOLLOWERS
+    [used] = schedulers
+    # Every page of followers, following and posts went through the scheduler
+    assert used.requests >= FOLLOWERS // 50
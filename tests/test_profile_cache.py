@@ -0,0 +1,57 @@
+import multiprocessing, time
+
+import mock_instagram
+from profile_cache import ProfileCache
+
+
+def entry(user_id, username, fetched_at=None):
+    return {"id": user_id, "username": username, "fetched_at": fetched_at or time.time(), "node": {}}
+
+
+def put(path, username, user_id):
+    ProfileCache(path).modify(lambda entries: entries.__setitem__(username, entry(user_id, username)))
+
+
+def test_ttl(tmp_path):
+    cache = ProfileCache(str(tmp_path / "profiles.json"), ttl=60)
+    cache.modify(lambda entries: entries.update(fresh=entry(1, "fresh"), stale=entry(2, "stale", time.time() - 61)))
+
+    reopened = ProfileCache(str(tmp_path / "profiles.json"), ttl=60)
+    assert reopened.get("Fresh")["id"] == 1
+    assert reopened.get("stale") is None
+    # User ids never change, so they are used past the TTL
+    assert reopened.user_id("stale") == 2
+
+
+def test_invalidate(tmp_path):
+    path = str(tmp_path / "profiles.json")
+    put(path, "someone", 1)
+    cache = ProfileCache(path)
+    cache.invalidate("SOMEONE")
+    assert ProfileCache(path).user_id("someone") is None
+
+
+def test_concurrent_processes_keep_each_others_entries(tmp_path):
+    path = str(tmp_path / "profiles.json")
+    workers = [multiprocessing.Process(target=put, args=(path, f"user{n}", n)) for n in range(8)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    cache = ProfileCache(path)
+    assert sorted(cache.user_id(f"user{n}") for n in range(8)) == list(range(8))
+
+
+def test_store_profile_and_rebuild_it(exporter):
+    cache = ProfileCache("profiles.json")
+    # A rename: the old username points at the same id
+    put("profiles.json", "old_name", mock_instagram.TARGET_ID)
+
+    profile = exporter.load_profile()
+    cache.store(profile)
+    assert cache.user_id("old_name") is None
+
+    rebuilt = ProfileCache("profiles.json").profile(exporter.insta.context, mock_instagram.TARGET_USERNAME)
+    assert (rebuilt.userid, rebuilt.followers, rebuilt.mediacount) == \
+        (profile.userid, profile.followers, profile.mediacount)
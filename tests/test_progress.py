@@ -0,0 +1,66 @@
+import io, json, time
+
+import pytest
+
+import progress
+from progress import JSONConsole, Progress
+
+
+def events(stream):
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def test_json_console_levels_and_quiet():
+    stream = io.StringIO()
+    console = JSONConsole(stream)
+    console.print("[bold red]Login failed[/bold red]")
+    console.print("[bold yellow]Stopping early[/bold yellow]")
+    console.print("[green]Saved to [bold]x.json[/bold][/green]")
+    assert [(event["level"], event["message"]) for event in events(stream)] == \
+        [("error", "Login failed"), ("warning", "Stopping early"), ("info", "Saved to x.json")]
+
+    stream = io.StringIO()
+    quiet = JSONConsole(stream, quiet=True)
+    quiet.print("[green]ok[/green]")
+    quiet.print("[red]broken[/red]")
+    assert [event["message"] for event in events(stream)] == ["broken"]
+
+
+@pytest.mark.parametrize("seconds, text", [(None, "?"), (75, "1m15s"), (3725, "1h02m")])
+def test_format_eta(seconds, text):
+    assert progress.format_eta(seconds) == text
+
+
+def test_smoothed_rate_and_eta():
+    bar = Progress(target="acct", total=1000)
+    bar.last = (0.0, 0)
+    bar.update(100)
+    bar.tick(1.0)
+    assert bar.rate == 100 and bar.eta() == 9.0
+    # A throttled interval pulls the rate down by SMOOTHING of the difference
+    bar.tick(2.0)
+    assert bar.rate == pytest.approx(100 * (1 - progress.SMOOTHING))
+    assert "acct starting: 100/1000 followers, 70.0/s" in bar.text()
+
+
+def test_events_at_a_fixed_rate():
+    stream = io.StringIO()
+    bar = Progress(JSONConsole(stream), target="acct", total=50, interval=0.01).start()
+    for count in range(1, 51):
+        bar.update(count)
+    bar.phase = "saving"
+    time.sleep(0.1)
+    bar.close(success=True)
+
+    names = [event["event"] for event in events(stream)]
+    assert "phase" in names and "progress" in names
+    # Updates only store the count; events are only written when it has moved, not on every tick
+    assert names.count("progress") < 5
+    done = events(stream)[-1]
+    assert (done["event"], done["count"], done["success"]) == ("done", 50, True)
+
+
+def test_quiet_console_renders_nothing():
+    bar = Progress(progress.QuietConsole(), target="acct").start()
+    assert bar.thread is None
+    bar.close()
@@ -0,0 +1,116 @@
+import time
+
+import pytest
+
+import mock_instagram, transport
+from graphql_paginator import FOLLOWERS_QUERY_HASH, GraphQLError, GraphQLPaginator
+from rate_scheduler import AdaptiveScheduler, parse_retry_after
+
+
+def test_multiplicative_decrease():
+    scheduler = AdaptiveScheduler(rate=8.0, min_rate=1.0)
+    scheduler.on_throttle()
+    assert scheduler.rate == 4.0
+    for _ in range(10):
+        scheduler.on_throttle()
+    assert scheduler.rate == 1.0
+    assert scheduler.throttles == 11
+
+
+def test_additive_increase_up_to_target():
+    scheduler = AdaptiveScheduler(rate=1.0, min_rate=0.1, increase=0.1)
+    scheduler.on_throttle()
+    scheduler.on_success()
+    assert scheduler.rate == pytest.approx(0.6)
+    assert scheduler.consecutive_throttles == 0
+    for _ in range(20):
+        scheduler.on_success()
+    assert scheduler.rate == 1.0
+
+
+def test_throttle_empties_the_bucket():
+    scheduler = AdaptiveScheduler(rate=10.0, burst=5)
+    assert scheduler.reserve() == 0.0
+    scheduler.on_throttle()
+    # The next request waits for a whole token at the halved rate
+    assert scheduler.reserve() == pytest.approx(1 / 5.0, rel=0.1)
+
+
+def test_retry_after_blocks_requests():
+    scheduler = AdaptiveScheduler(rate=100.0, burst=100)
+    scheduler.on_throttle(retry_after=30)
+    assert 29 < scheduler.reserve() <= 30
+    assert 29 < scheduler.backoff_delay() <= 30
+
+
+def test_backoff_grows_with_consecutive_throttles():
+    scheduler = AdaptiveScheduler(base_backoff=10.0, max_backoff=35.0)
+    delays = []
+    for _ in range(4):
+        scheduler.on_throttle()
+        delays.append(scheduler.backoff_delay())
+    assert 5 <= delays[0] <= 10
+    assert 10 <= delays[1] <= 20
+    assert 17.5 <= delays[3] <= 35
+
+
+@pytest.mark.parametrize("value, seconds", [
+    ("120", 120.0),
+    ("1.5", 1.5),
+    ("-3", 0.0),
+    ("", None),
+    (None, None),
+    ("Wed, 21 Oct 2015 07:28:00 GMT", None),
+])
+def test_parse_retry_after(value, seconds):
+    assert parse_retry_after(value) == seconds
+
+
+def test_increase_and_floor_scale_with_the_target():
+    for target in (0.3, 300.0):
+        scheduler = AdaptiveScheduler(rate=target)
+        assert scheduler.min_rate == pytest.approx(target / 10)
+        scheduler.on_throttle()
+        for _ in range(10):
+            scheduler.on_success()
+        # Ten successes undo a halving, whatever the target
+        assert scheduler.rate == pytest.approx(target)
+
+
+def test_retry_after_from_the_server(mock, monkeypatch):
+    """A 429 from the server slows the scheduler down and blocks it for Retry-After seconds"""
+    throttling = mock_instagram.MockInstagram(followers=10, fail_429=1.0, retry_after=7)
+    server = mock_instagram.serve(throttling)
+    monkeypatch.setattr(transport, "_base_url", mock_instagram.base_url(server))
+    try:
+        scheduler = AdaptiveScheduler(rate=50.0, burst=50)
+        paginator = GraphQLPaginator(None, FOLLOWERS_QUERY_HASH, {"id": str(mock_instagram.TARGET_ID)},
+                                     scheduler=scheduler)
+        with pytest.raises(GraphQLError) as raised:
+            list(paginator)
+    finally:
+        server.shutdown()
+
+    assert raised.value.status_code == 429
+    assert raised.value.retry_after == 7.0
+    assert scheduler.rate == 25.0
+    assert 6 < scheduler.blocked_until - time.monotonic() <= 7
+
+
+def test_recovers_from_scattered_throttles(mock, monkeypatch):
+    """One 429 in ten doesn't drag the rate down to a crawl"""
+    from retry import RetryPolicy
+
+    throttling = mock_instagram.MockInstagram(followers=2000, fail_429=0.1, retry_after=0)
+    server = mock_instagram.serve(throttling)
+    monkeypatch.setattr(transport, "_base_url", mock_instagram.base_url(server))
+    try:
+        scheduler = AdaptiveScheduler(rate=200.0, burst=1, base_backoff=0.01)
+        paginator = GraphQLPaginator(None, FOLLOWERS_QUERY_HASH, {"id": str(mock_instagram.TARGET_ID), "first": 20},
+                                     scheduler=scheduler, retry=RetryPolicy(attempts=5, scheduler=scheduler))
+        assert len(list(paginator)) == 2000
+    finally:
+        server.shutdown()
+
+    assert scheduler.throttles >= 3
+    assert scheduler.rate > scheduler.target_rate / 4
@@ -0,0 +1,47 @@
+import json
+
+import instaloader
+import pytest
+import requests
+
+from graphql_paginator import GraphQLError
+from retry import AUTH, FATAL, THROTTLED, TRANSIENT, classify, status_code
+
+
+@pytest.mark.parametrize("error, kind", [
+    (GraphQLError("HTTP 429 - Too Many Requests", 429), THROTTLED),
+    (GraphQLError("HTTP 401 - Unauthorized", 401), AUTH),
+    (GraphQLError("HTTP 403 - Forbidden", 403), AUTH),
+    (GraphQLError("HTTP 503 - Service Unavailable", 503), TRANSIENT),
+    (GraphQLError("HTTP 400 - Bad Request", 400), FATAL),
+    (GraphQLError("User not found", 404), FATAL),
+    (instaloader.exceptions.TooManyRequestsException("429 Too Many Requests"), THROTTLED),
+    (instaloader.exceptions.LoginRequiredException("Login required"), AUTH),
+    (instaloader.exceptions.QueryReturnedNotFoundException("404 Not Found"), FATAL),
+    (instaloader.exceptions.ConnectionException("401 Unauthorized - \"fail\" status, message "
+                                                "\"Please wait a few minutes before you try again.\""), THROTTLED),
+    (instaloader.exceptions.ConnectionException("Redirected to login page. Use --login."), AUTH),
+    (instaloader.exceptions.ConnectionException("502 Bad Gateway when accessing URL"), TRANSIENT),
+    (instaloader.exceptions.ConnectionException("HTTPSConnectionPool: Read timed out."), TRANSIENT),
+    (requests.exceptions.ConnectionError("Connection reset by peer"), TRANSIENT),
+    (json.JSONDecodeError("Expecting value", "", 0), TRANSIENT),
+    (ValueError("bad argument"), FATAL),
+])
+def test_classify(error, kind):
+    assert classify(error) == kind
+
+
+def test_classify_follows_the_cause():
+    try:
+        try:
+            raise GraphQLError("HTTP 429 - Too Many Requests", 429)
+        except GraphQLError as cause:
+            raise RuntimeError("page request failed") from cause
+    except RuntimeError as error:
+        assert status_code(error) == 429
+        assert classify(error) == THROTTLED
+
+
+def test_status_from_message():
+    assert status_code(instaloader.exceptions.ConnectionException("JSON Query to graphql/query: 500 Internal")) == 500
+    assert status_code(ValueError("no status here")) is None
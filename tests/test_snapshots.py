@@ -0,0 +1,35 @@
+import pytest
+
+from snapshots import SnapshotStore, merge_diff
+
+
+@pytest.mark.parametrize("old, new, added, lost, unchanged", [
+    ([], [], [], [], 0),
+    ([], [1, 2], [0, 1], [], 0),
+    ([1, 2], [], [], [0, 1], 0),
+    ([1, 2, 3], [1, 2, 3], [], [], 3),
+    ([1, 3, 5], [2, 3, 6], [0, 2], [0, 2], 1),
+    ([1, 2, 3, 4], [3, 4, 5, 6], [2, 3], [0, 1], 2),
+    ([10, 20], [1, 2, 30], [0, 1, 2], [0, 1], 0),
+])
+def test_merge_diff(old, new, added, lost, unchanged):
+    assert merge_diff(old, new) == (added, lost, unchanged)
+
+
+def users(*ids):
+    return [{"id": user_id, "username": f"user{user_id}", "full_name": f"User {user_id}"} for user_id in ids]
+
+
+def test_record_reports_gains_and_losses(workdir):
+    store = SnapshotStore("someone", directory="snapshots")
+    first = store.record(users(1, 2, 3))
+    assert first["delta"] is None and first["count"] == 3
+
+    # Duplicates (a resumed crawl) and records without an id don't count
+    second = store.record(users(2, 3, 3, 4) + [{"username": "anonymous"}])
+    assert (second["added"], second["lost"], second["unchanged"]) == (1, 1, 2)
+    assert [record["username"] for record in second["added_records"]] == ["user4"]
+    assert [record["username"] for record in second["lost_records"]] == ["user1"]
+
+    reopened = SnapshotStore("someone", directory="snapshots")
+    assert list(reopened.current_ids()) == [2, 3, 4]
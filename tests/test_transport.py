@@ -0,0 +1,53 @@
+import metrics, mock_instagram, transport
+
+
+def test_rewrite_url(monkeypatch):
+    monkeypatch.setattr(transport, "_base_url", "http://127.0.0.1:8080")
+    assert transport.rewrite_url("https://www.instagram.com/graphql/query?a=1") == \
+        "http://127.0.0.1:8080/www.instagram.com/graphql/query?a=1"
+    assert transport.rewrite_url("https://scontent-fra5-1.fbcdn.net/v/x.jpg") == \
+        "http://127.0.0.1:8080/scontent-fra5-1.fbcdn.net/v/x.jpg"
+    assert transport.rewrite_url("https://example.com/instagram.com") == "https://example.com/instagram.com"
+
+
+def test_instaloader_copies_share_the_pool(monkeypatch):
+    import instaloader
+    import instaloader.instaloadercontext as instaloadercontext
+
+    monkeypatch.setattr(transport, "_context", None)
+    context = instaloader.Instaloader(quiet=True).context
+    transport.share_with_instaloader(context)
+    session = transport.get_session()
+    assert session is context._session
+    adapter = session.get_adapter("https://www.instagram.com/")
+    assert instaloadercontext.copy_session(session).get_adapter("https://www.instagram.com/") is adapter
+
+    # Instaloader closing its per-query copies leaves the shared pool open
+    adapter.poolmanager.connection_from_url("https://www.instagram.com/")
+    pools = len(adapter.poolmanager.pools)
+    adapter.close()
+    assert len(adapter.poolmanager.pools) == pools > 0
+
+
+def test_requests_are_measured(mock, workdir):
+    response = transport.get(f"https://i.instagram.com/api/v1/users/{mock_instagram.TARGET_ID}/info/")
+    assert response.json()["user"]["username"] == mock_instagram.TARGET_USERNAME
+    assert metrics.registry.value("requests_total", status="200") == 1
+    assert metrics.registry.count("request_seconds") == 1
+    assert metrics.registry.value("response_bytes") == len(response.content)
+
+
+def test_instaloader_shares_the_pool(exporter):
+    import instaloader.instaloadercontext as instaloadercontext
+
+    context = exporter.insta.context
+    session = transport.get_session()
+    assert session is context._session
+    adapter = session.get_adapter("https://www.instagram.com/")
+    # Per-query copies and anonymous sessions go through the same pool
+    assert instaloadercontext.copy_session(session).get_adapter("https://www.instagram.com/") is adapter
+    assert context.get_anonymous_session().get_adapter("https://www.instagram.com/") is adapter
+
+    # Instaloader closing its copies leaves the shared pool open
+    adapter.close()
+    assert transport.get(f"https://www.instagram.com/{mock_instagram.TARGET_USERNAME}/").status_code == 200
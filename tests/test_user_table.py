@@ -0,0 +1,67 @@
+import multiprocessing
+
+from user_table import UserTable
+
+
+def user(user_id, **fields):
+    record = {"id": user_id, "username": f"user{user_id}", "full_name": f"User {user_id}",
+              "is_private": False, "is_verified": False}
+    record.update(fields)
+    return record
+
+
+def test_round_trip(tmp_path):
+    table = UserTable(str(tmp_path))
+    table.upsert(user(2, full_name="Twö", is_verified=True))
+    table.upsert(user(1, is_private=True))
+    table.save()
+
+    reopened = UserTable(str(tmp_path))
+    assert reopened.get(2) == {"id": 2, "username": "user2", "full_name": "Twö", "is_private": False,
+                               "is_verified": True}
+    assert reopened.get(1)["is_private"]
+    assert reopened.get(3)["username"] is None
+
+
+def test_strings_are_interned(tmp_path):
+    table = UserTable(str(tmp_path))
+    for user_id in range(100):
+        table.upsert(user(user_id, full_name="Same Name"))
+    assert table.strings.count("Same Name") == 1
+
+
+def save_users(directory, ids):
+    table = UserTable(directory)
+    for user_id in ids:
+        table.upsert(user(user_id))
+        table.save()
+
+
+def test_concurrent_saves_keep_every_user(tmp_path):
+    """Processes sharing a table (queue workers with --snapshot) don't drop each other's users"""
+    directory = str(tmp_path)
+    workers = [multiprocessing.Process(target=save_users, args=(directory, range(n, 400, 4))) for n in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert [worker.exitcode for worker in workers] == [0] * 4
+
+    table = UserTable(directory)
+    assert sorted(table.users) == list(range(400))
+    assert table.get(123)["username"] == "user123"
+
+
+def test_later_save_keeps_its_own_changes(tmp_path):
+    first, second = UserTable(str(tmp_path)), UserTable(str(tmp_path))
+    first.upsert(user(1, username="old"))
+    first.save()
+    second.upsert(user(1, username="new"))
+    second.upsert(user(2))
+    second.save()
+    first.upsert(user(3))
+    first.save()
+
+    table = UserTable(str(tmp_path))
+    assert sorted(table.users) == [1, 2, 3]
+    assert table.get(1)["username"] == "new"
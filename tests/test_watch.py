@@ -0,0 +1,34 @@
+import metrics
+from watch import Watcher, read_log
+
+from conftest import FOLLOWERS
+
+
+def test_crawls_only_when_the_count_moves(exporter, mock, monkeypatch):
+    watcher = Watcher(exporter, interval=0, threshold=5, log_file="watch.ndjson", output="followers.json")
+    first = watcher.step()
+    assert first["followers"] == FOLLOWERS and first["delta"] is None
+    assert first["crawl"]["complete"] and first["crawl"]["records"] == FOLLOWERS
+
+    assert "crawl" not in watcher.step()
+
+    monkeypatch.setattr(mock, "followers", FOLLOWERS + 3)
+    assert "crawl" not in watcher.step()  # Below the threshold
+    monkeypatch.setattr(mock, "followers", FOLLOWERS + 5)
+    moved = watcher.step()
+    assert moved["delta"] == 5 and moved["crawl"]["records"] == FOLLOWERS + 5
+
+    assert [("crawl" in entry) for entry in read_log("watch.ndjson")] == [True, False, False, True]
+    assert metrics.registry.value("watch_polls_total") == 4
+    assert metrics.registry.value("watch_crawls_total", result="ok") == 2
+
+    # Watching again picks up the last crawled count from the log
+    assert Watcher(exporter, log_file="watch.ndjson").crawled_count == FOLLOWERS + 5
+
+
+def test_failed_poll_is_logged(exporter, monkeypatch):
+    watcher = Watcher(exporter, log_file="watch.ndjson")
+    monkeypatch.setattr(exporter, "username", "no_such_user")
+    entry = watcher.step()
+    assert entry["error"] and "crawl" not in entry
+    assert list(read_log("watch.ndjson"))[0]["error"] == entry["error"]
@@ -0,0 +1,176 @@
+"""
+Shared pooled HTTP transport for every Instagram request
+"""
+
+import threading, time
+
+import metrics
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_TIMEOUT = (5, 30)  # (connect, read) seconds
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/115.0.0.0 Safari/537.36',
+    'Accept': 'application/json',
+    'Accept-Encoding': 'gzip, deflate',
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Connection': 'keep-alive',
+    'Referer': 'https://www.instagram.com/',
+    'X-IG-App-ID': '936619743392459',  # Common Instagram App ID
+    'X-Requested-With': 'XMLHttpRequest',
+}
+
+_lock = threading.Lock()
+_pool_size = DEFAULT_POOL_SIZE
+_timeout = DEFAULT_TIMEOUT
+_adapter = None
+_session = None
+_context = None
+_adapter_class = None
+_base_url = None
+
+
+def _pooled_adapter_class():
+    """Define PooledAdapter on first use so importing this module stays cheap"""
+    global _adapter_class
+    if _adapter_class is None:
+        from requests.adapters import HTTPAdapter
+
+        class PooledAdapter(HTTPAdapter):
+            """
+            HTTPAdapter shared by every session in the process
+
+            Instaloader closes its short-lived per-query sessions, which would
+            also close the adapter's pool. Closing is therefore a no-op unless
+            the whole transport is shut down.
+            """
+
+            def close(self, force=False):
+                if force:
+                    super().close()
+
+            def send(self, request, **kwargs):
+                if _base_url is not None:
+                    request.url = rewrite_url(request.url)
+
+                started = time.perf_counter()
+                response = super().send(request, **kwargs)
+                if not kwargs.get("stream"):
+                    response.content  # Time the body download too, not just the headers
+                elapsed = time.perf_counter() - started
+
+                metrics.inc("requests_total", status=str(response.status_code))
+                metrics.observe("request_seconds", elapsed)
+                size = response.headers.get("Content-Length")
+                if size is None and not kwargs.get("stream"):
+                    size = len(response.content)
+                metrics.observe("response_bytes", int(size or 0))
+                return response
+
+        _adapter_class = PooledAdapter
+    return _adapter_class
+
+
+def configure(pool_size=None, timeout=None, base_url=None):
+    """
+    Set pool size and timeouts; must be called before the first request
+
+    base_url sends every Instagram request to another server instead, e.g.
+    the local mock server (mock_instagram.py) used by the benchmarks.
+    """
+    global _pool_size, _timeout, _base_url
+    if pool_size is not None:
+        _pool_size = pool_size
+    if timeout is not None:
+        _timeout = timeout
+    if base_url is not None:
+        _base_url = base_url.rstrip("/")
+
+
+def rewrite_url(url):
+    """https://www.instagram.com/path -> BASE_URL/www.instagram.com/path"""
+    scheme, _, rest = url.partition("://")
+    host = rest.split("/", 1)[0]
+    if scheme in ("http", "https") and (host.endswith("instagram.com") or host.endswith("fbcdn.net")):
+        return f"{_base_url}/{rest}"
+    return url
+
+
+def request_timeout():
+    return _timeout
+
+
+def _get_adapter():
+    global _adapter
+    if _adapter is None:
+        _adapter = _pooled_adapter_class()(pool_connections=_pool_size, pool_maxsize=_pool_size, pool_block=True)
+    return _adapter
+
+
+def _mount(session):
+    if not isinstance(session.get_adapter("https://"), _pooled_adapter_class()):
+        adapter = _get_adapter()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+    return session
+
+
+def get_session():
+    """
+    Return the process-wide session
+
+    Once an instaloader context has been shared this is instaloader's own
+    authenticated session, so direct requests carry the same cookies and
+    reuse the same keep-alive connections.
+    """
+    global _session
+    with _lock:
+        if _context is not None:
+            return _mount(_context._session)
+
+        if _session is None:
+            import requests
+            _session = requests.Session()
+            _session.headers.update(DEFAULT_HEADERS)
+            _mount(_session)
+        return _session
+
+
+def share_with_instaloader(context):
+    """Route instaloader's requests through the shared pool and reuse its session"""
+    global _context
+    import instaloader.instaloadercontext as instaloadercontext
+
+    with _lock:
+        _context = context
+
+        # Profile pages are fetched through a fresh anonymous session every time
+        get_anonymous_session = context.get_anonymous_session
+        context.get_anonymous_session = lambda: _mount(get_anonymous_session())
+
+        # Instaloader copies its session for every GraphQL query; give the copies our pool
+        copy_session = instaloadercontext.copy_session
+        if not getattr(copy_session, "pooled", False):
+            def pooled_copy_session(session, request_timeout=None):
+                new = copy_session(session, request_timeout)
+                new.hooks = session.hooks
+                return _mount(new)
+
+            pooled_copy_session.pooled = True
+            instaloadercontext.copy_session = pooled_copy_session
+
+
+def get(url, **kwargs):
+    """GET through the shared session with the default timeout"""
+    kwargs.setdefault("timeout", _timeout)
+    return get_session().get(url, **kwargs)
+
+
+def close():
+    """Shut down every pooled connection"""
+    global _adapter, _session
+    with _lock:
+        if _adapter is not None:
+            _adapter.close(force=True)
+        _adapter = None
+        _session = None
@@ -0,0 +1,190 @@
+"""
+Deduplicated store of every user seen in any snapshot
+"""
+
+import json, os, struct, threading
+
+import file_lock, output
+
+# id, username string, full name string, flags
+ROW = struct.Struct("<qIIB")
+IS_PRIVATE = 1
+IS_VERIFIED = 2
+
+
+class UserTable:
+    """
+    Each user stored once, no matter how many snapshots, accounts or edges
+    (followers/following) they appear in
+
+    Strings are interned into one pool, so a username or full name is kept
+    once however often it occurs. Users are fixed-size binary rows of id,
+    username index, full-name index and a flags byte (is_private,
+    is_verified). Signed profile picture URLs expire and make up most of an
+    export's size, so they live in a separate, optional table keyed by id.
+
+    Several processes may share a table (queue workers with --snapshot).
+    Saving locks the directory, reads back what the others saved since and
+    only writes this process's own changes on top, so no user is lost.
+
+    Layout of .snapshots/users/:
+        strings.bin    interned strings, each terminated by NUL
+        users.bin      one 17-byte row per user, sorted by id
+        urls.json      latest profile picture URL per id (only with keep_urls)
+    """
+
+    def __init__(self, directory, keep_urls=False):
+        self.path = os.path.join(directory, "users")
+        self.strings_path = os.path.join(self.path, "strings.bin")
+        self.users_path = os.path.join(self.path, "users.bin")
+        self.urls_path = os.path.join(self.path, "urls.json")
+        self.lock_path = os.path.join(self.path, ".lock")
+        self.keep_urls = keep_urls
+        self.lock = threading.RLock()
+
+        self.strings = []
+        self.string_index = {}
+        self.users = {}
+        self.urls = {}
+        self.urls_loaded = False
+        self.changed = set()  # Ids upserted since the last save
+        self.changed_urls = set()
+        self.dirty = False
+        # strings.bin and users.bin are only consistent with each other while no save is under way
+        if os.path.isdir(self.path):
+            with file_lock.locked(self.lock_path):
+                self.load()
+
+    def read_rows(self):
+        """id -> (username, full name, flags) as stored on disk"""
+        strings = []
+        if os.path.exists(self.strings_path):
+            with open(self.strings_path, "rb") as f:
+                strings = f.read().decode("utf-8").split("\0")[:-1]
+        rows = {}
+        if os.path.exists(self.users_path):
+            with open(self.users_path, "rb") as f:
+                for user_id, username, full_name, flags in ROW.iter_unpack(f.read()):
+                    rows[user_id] = (strings[username], strings[full_name], flags)
+        return rows
+
+    def read_urls(self):
+        if not os.path.exists(self.urls_path):
+            return {}
+        with open(self.urls_path, "r", encoding="utf-8") as f:
+            return {int(user_id): url for user_id, url in json.load(f).items()}
+
+    def load(self):
+        """Take over every stored user that hasn't been changed in this process"""
+        for user_id, (username, full_name, flags) in self.read_rows().items():
+            if user_id not in self.changed:
+                self.users[user_id] = (self.intern(username), self.intern(full_name), flags)
+
+    def load_urls(self):
+        """The URL table is only parsed when it is actually needed"""
+        if not self.urls_loaded:
+            self.urls_loaded = True
+            self.urls.update(self.read_urls())
+        return self.urls
+
+    def intern(self, value):
+        # NUL separates the pool, so it cannot be part of a string
+        value = (value or "").replace("\0", "")
+        index = self.string_index.get(value)
+        if index is None:
+            index = len(self.strings)
+            self.strings.append(value)
+            self.string_index[value] = index
+        return index
+
+    def upsert(self, record):
+        """Store (or update) the user behind an export record and return its id"""
+        user_id = int(record["id"])
+
+        with self.lock:
+            # Fields left out of the record (see --fields) keep their stored values
+            old = self.users.get(user_id)
+            username = self.intern(record.get("username")) if "username" in record or old is None else old[0]
+            full_name = self.intern(record.get("full_name")) if "full_name" in record or old is None else old[1]
+            flags = old[2] if old is not None else 0
+            for field, flag in (("is_private", IS_PRIVATE), ("is_verified", IS_VERIFIED)):
+                if field in record:
+                    flags = (flags | flag) if record[field] else (flags & ~flag)
+            row = (username, full_name, flags)
+            if self.users.get(user_id) != row:
+                self.users[user_id] = row
+                self.changed.add(user_id)
+                self.dirty = True
+
+            url = record.get("profile_pic_url")
+            if self.keep_urls and url:
+                urls = self.load_urls()
+                if urls.get(user_id) != url:
+                    urls[user_id] = url
+                    self.changed_urls.add(user_id)
+                    self.dirty = True
+        return user_id
+
+    def get(self, user_id, with_url=False):
+        """The record of a stored user, or a bare id record if it is unknown"""
+        row = self.users.get(int(user_id))
+        if row is None:
+            return {"id": int(user_id), "username": None, "full_name": None, "is_private": None, "is_verified": None}
+
+        record = {
+            "id": int(user_id),
+            "username": self.strings[row[0]],
+            "full_name": self.strings[row[1]],
+            "is_private": bool(row[2] & IS_PRIVATE),
+            "is_verified": bool(row[2] & IS_VERIFIED),
+        }
+        if with_url:
+            record["profile_pic_url"] = self.load_urls().get(int(user_id))
+        return record
+
+    def save(self):
+        """Write the table if anything changed"""
+        with self.lock:
+            if not self.dirty:
+                return
+            os.makedirs(self.path, exist_ok=True)
+
+            with file_lock.locked(self.lock_path):
+                # Users other processes saved since this table was loaded
+                self.load()
+                if self.urls_loaded:
+                    for user_id, url in self.read_urls().items():
+                        if user_id not in self.changed_urls:
+                            self.urls[user_id] = url
+
+                self._replace(self.strings_path, "".join(f"{value}\0" for value in self.strings).encode("utf-8"))
+                self._replace(self.users_path, b"".join(
+                    ROW.pack(user_id, *self.users[user_id]) for user_id in sorted(self.users)
+                ))
+                if self.urls_loaded:
+                    self._replace(self.urls_path, json.dumps(
+                        {str(user_id): url for user_id, url in self.urls.items()}
+                    ).encode("utf-8"))
+            self.changed.clear()
+            self.changed_urls.clear()
+            self.dirty = False
+
+    def _replace(self, path, data):
+        with output.replacing(path) as tmp_path:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+
+
+_shared = {}
+_lock = threading.Lock()
+
+
+def shared(directory, keep_urls=False):
+    """Return the process-wide table for a snapshot directory"""
+    key = os.path.abspath(directory)
+    with _lock:
+        if key not in _shared:
+            _shared[key] = UserTable(directory)
+        if keep_urls:
+            _shared[key].keep_urls = True
+        return _shared[key]
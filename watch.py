@@ -0,0 +1,154 @@
+"""
+Watch an account's counts and only export its followers again when they change
+"""
+
+import datetime, json, os, time
+
+import metrics
+
+metrics.register("watch_polls_total", "Profile count polls in watch mode")
+metrics.register("watch_crawls_total", "Recrawls triggered by watch mode, by result")
+
+DEFAULT_INTERVAL = 15 * 60  # Seconds between polls
+DEFAULT_THRESHOLD = 1  # Change in the follower count that triggers a crawl
+
+
+def read_log(filename):
+    """Entries of a watch log, oldest first"""
+    if not os.path.exists(filename):
+        return
+    with open(filename, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue  # A line cut short by a crash
+
+
+class Watcher:
+    """
+    Poll an account's counts on an interval over one warm session
+
+    Every poll is a single profile request for the follower, following and
+    post counts. The followers are only crawled again, through the exporter,
+    once the follower count has moved by at least threshold since the last
+    complete crawl (or if there hasn't been one). Each poll is appended as a
+    JSON line to the log, which is also where the last crawled count is read
+    from when watching starts again.
+    """
+
+    def __init__(self, exporter, interval=DEFAULT_INTERVAL, threshold=DEFAULT_THRESHOLD, log_file=None,
+                 output_format="json", output=None, max_polls=None):
+        self.exporter = exporter
+        self.console = exporter.console
+        self.interval = interval
+        self.threshold = max(1, threshold)
+        self.log_file = log_file or f"{exporter.username}_watch.ndjson"
+        self.output_format = output_format
+        self.output = output
+        self.max_polls = max_polls
+        self.polls = 0
+        self.crawled_count = None
+
+        for entry in read_log(self.log_file):
+            if (entry.get("crawl") or {}).get("complete"):
+                self.crawled_count = entry["followers"]
+
+    def poll(self):
+        """Current counts of the account, from one profile request"""
+        import instaloader
+
+        context, username = self.exporter.insta.context, self.exporter.username
+        user_id = self.exporter.profiles.user_id(username)
+        if user_id:
+            # With the id known only the profile query is needed, not the profile page as well
+            profile = instaloader.Profile(context, {"username": username, "id": str(user_id)})
+        else:
+            profile = instaloader.Profile.from_username(context, username)
+        try:
+            followers = profile.followers
+        except instaloader.exceptions.ProfileNotExistsException:
+            # Renamed or deleted: look the username up from scratch next time
+            self.exporter.profiles.invalidate(username)
+            raise
+        # The crawl this may trigger then starts from the cached profile, without another request
+        self.exporter.profiles.store(profile)
+        metrics.inc("watch_polls_total")
+        return {
+            "followers": followers,
+            "following": profile.followees,
+            "posts": profile.mediacount,
+            "biography": profile.biography,
+        }
+
+    def should_crawl(self, counts):
+        return self.crawled_count is None or abs(counts["followers"] - self.crawled_count) >= self.threshold
+
+    def crawl(self):
+        """Export the followers again; an interrupted ndjson export is resumed"""
+        self.exporter.records = 0
+        started = time.monotonic()
+        complete = self.exporter.export(output_format=self.output_format, output=self.output,
+                                        resume=self.output_format == "ndjson")
+        metrics.inc("watch_crawls_total", result="ok" if complete else "failed")
+        return {
+            "complete": bool(complete),
+            "records": self.exporter.records,
+            "seconds": round(time.monotonic() - started, 3),
+        }
+
+    def log(self, entry):
+        with open(self.log_file, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def step(self):
+        """Poll once, crawl if the count moved, and log what happened"""
+        from retry import CircuitOpenError
+
+        entry = {
+            "timestamp": str(datetime.datetime.now(datetime.timezone.utc)),
+            "username": self.exporter.username,
+        }
+        try:
+            counts = self.poll()
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            entry["error"] = str(e)
+            self.console.print(f"[bold red]Poll failed: {e}[/bold red]")
+            self.log(entry)
+            return entry
+
+        entry.update(counts)
+        previous = self.crawled_count
+        entry["delta"] = None if previous is None else counts["followers"] - previous
+        self.console.print(f"[blue]{self.exporter.username}: {counts['followers']} followers, "
+                           f"{counts['following']} following, {counts['posts']} posts[/blue]")
+
+        if self.should_crawl(counts):
+            reason = "first crawl" if previous is None else f"follower count moved by {entry['delta']:+d}"
+            self.console.print(f"[yellow]Exporting followers ({reason})...[/yellow]")
+            entry["crawl"] = self.crawl()
+            if entry["crawl"]["complete"]:
+                self.crawled_count = counts["followers"]
+        self.log(entry)
+        return entry
+
+    def run(self):
+        """Poll until interrupted (or max_polls), sleeping interval seconds in between"""
+        from retry import CircuitOpenError
+
+        self.console.print(f"[bold blue]Watching {self.exporter.username} every {self.interval:.0f}s; "
+                           f"logging to {self.log_file}[/bold blue]")
+        try:
+            while self.max_polls is None or self.polls < self.max_polls:
+                if self.polls:
+                    self.exporter.scheduler.sleep(self.interval, reason="watch")
+                self.polls += 1
+                self.step()
+        except CircuitOpenError as e:
+            self.console.print(f"[bold red]Stopped watching: {e}[/bold red]")
+            return False
+        except KeyboardInterrupt:
+            self.console.print("\n[yellow]Stopped watching.[/yellow]")
+        return True